@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+"""
+Converts a WAV file into a flash image for the player: unsigned 8-bit
+samples, left channel, then right channel. The input is processed in
+chunks, so memory use doesn't depend on the length of the file.
+
+The clock frequency the chip needs to play the image at the right speed
+is written into a JSON sidecar next to the image.
+"""
+
+import argparse
+import json
+import math
+import sys
+import wave
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+import numpy.typing as npt
+from tt10_rtl.spi_flash import FlashParams
+
+# The player reads a byte per channel for every sample, at the rate of the
+# controller with the default FlashParams, which DigitalTop uses.
+CYCLES_PER_BYTE = FlashParams().cycles_per_byte
+CHANNELS = 2
+CYCLES_PER_SAMPLE = CYCLES_PER_BYTE * CHANNELS
+
+# Frames read from the input at a time
+CHUNK_FRAMES = 64 * 1024
+
+# Number of zero crossings of the resampling kernel on each side,
+# at the lower of the two rates
+_KERNEL_ZERO_CROSSINGS = 16
+
+# Output frames to compute at once, bounds the size of the intermediate arrays
+_RESAMPLE_BLOCK_FRAMES = 4096
+
+FloatArray = npt.NDArray[np.float64]
+
+
+class Resampler:
+    """
+    Streaming band-limited resampler, with a Blackman-windowed sinc kernel.
+    Keeps only as much of the input as the kernel needs between chunks.
+    """
+
+    def __init__(self, input_rate: int, output_rate: int, channels: int) -> None:
+        assert input_rate > 0
+        assert output_rate > 0
+        assert channels > 0
+
+        # Input samples per output sample
+        self._step = input_rate / output_rate
+        # When downsampling, the kernel must also filter out everything
+        # above the new Nyquist frequency.
+        self._cutoff = min(1.0, output_rate / input_rate)
+        # Kernel half-width, in input samples
+        self._half_width = math.ceil(_KERNEL_ZERO_CROSSINGS / self._cutoff)
+
+        # Input samples that may still be needed. Starts with silence,
+        # so that the first output samples have a full kernel to the left.
+        self._buffer: FloatArray = np.zeros((self._half_width, channels))
+        # Index of the first sample in the buffer, in input samples
+        self._buffer_start = -self._half_width
+        # Time of the next output sample, in input samples
+        self._time = 0.0
+        self._input_frames = 0
+        self._output_frames = 0
+        self._output_rate = output_rate
+        self._input_rate = input_rate
+
+    def process(self, frames: FloatArray) -> FloatArray:
+        """
+        Feeds input frames (frames x channels), and returns the output
+        frames that can be computed so far.
+        """
+        self._buffer = np.concatenate((self._buffer, frames))
+        self._input_frames += len(frames)
+
+        # Every output sample needs half_width input samples to its right
+        limit = self._buffer_start + len(self._buffer) - self._half_width
+        return self._produce(limit)
+
+    def flush(self) -> FloatArray:
+        """
+        Returns the remaining output frames, as if the input was followed
+        by silence.
+        """
+        channels = self._buffer.shape[1]
+        self._buffer = np.concatenate(
+            (self._buffer, np.zeros((self._half_width + 1, channels)))
+        )
+
+        # The last output sample is before the end of the input
+        total = math.ceil(self._input_frames * self._output_rate / self._input_rate)
+        limit = self._buffer_start + len(self._buffer) - self._half_width
+        result = self._produce(limit, max_frames=total - self._output_frames)
+        assert self._output_frames == total
+        return result
+
+    def _produce(self, limit: float, max_frames: int | None = None) -> FloatArray:
+        # Output samples at times strictly before the limit
+        count = max(0, math.ceil((limit - self._time) / self._step))
+        if max_frames is not None:
+            count = min(count, max_frames)
+
+        offsets = np.arange(-self._half_width + 1, self._half_width + 1)
+
+        blocks: list[FloatArray] = []
+        for block_start in range(0, count, _RESAMPLE_BLOCK_FRAMES):
+            block_size = min(count - block_start, _RESAMPLE_BLOCK_FRAMES)
+            times = self._time + self._step * np.arange(
+                block_start, block_start + block_size
+            )
+            indices = np.floor(times).astype(np.int64)[:, np.newaxis] + offsets
+            distances = times[:, np.newaxis] - indices
+            weights = (
+                self._cutoff
+                * np.sinc(self._cutoff * distances)
+                * _blackman(distances / self._half_width)
+            )
+            blocks.append(
+                np.einsum(
+                    "ot,otc->oc", weights, self._buffer[indices - self._buffer_start]
+                )
+            )
+
+        self._time += count * self._step
+        self._output_frames += count
+
+        # Drop what the next output sample doesn't need
+        first_needed = math.floor(self._time) - self._half_width + 1
+        drop = max(0, first_needed - self._buffer_start)
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+
+        if not blocks:
+            return np.zeros((0, self._buffer.shape[1]))
+        return np.concatenate(blocks)
+
+
+def _blackman(x: FloatArray) -> FloatArray:
+    """
+    Blackman window, centered at 0, for x in [-1, 1].
+    """
+    window: FloatArray = (
+        0.42 + 0.5 * np.cos(np.pi * x) + 0.08 * np.cos(2 * np.pi * x)
+    ) * (np.abs(x) <= 1)
+    return window
+
+
+def read_wav(file: BinaryIO) -> tuple[int, Iterator[FloatArray]]:
+    """
+    Opens a PCM WAV file. Returns the sample rate, and an iterator over
+    chunks of stereo frames in [-1, 1). Mono input is duplicated into both
+    channels.
+    """
+    reader = wave.open(file, "rb")
+
+    channels = reader.getnchannels()
+    if channels not in (1, CHANNELS):
+        raise ValueError(f"Expected a mono or stereo file, got {channels} channels")
+    sample_width = reader.getsampwidth()
+    if sample_width not in (1, 2, 3, 4):
+        raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+
+    def chunks() -> Iterator[FloatArray]:
+        with reader:
+            while data := reader.readframes(CHUNK_FRAMES):
+                samples = _decode_samples(data, sample_width).reshape(-1, channels)
+                if channels == 1:
+                    samples = np.repeat(samples, CHANNELS, axis=1)
+                yield samples
+
+    return reader.getframerate(), chunks()
+
+
+def _decode_samples(data: bytes, sample_width: int) -> FloatArray:
+    # 8-bit WAV samples are unsigned, everything else is signed little-endian
+    if sample_width == 1:
+        return (np.frombuffer(data, np.uint8).astype(np.float64) - 128) / 128
+    if sample_width == 3:
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3)
+        # Put the samples at the top of 32-bit words, to keep the sign
+        padded = np.zeros((len(raw), 4), np.uint8)
+        padded[:, 1:] = raw
+        data = padded.tobytes()
+        sample_width = 4
+    dtype = np.dtype(f"<i{sample_width}")
+    return np.frombuffer(data, dtype).astype(np.float64) / (1 << (8 * sample_width - 1))
+
+
+def quantize(
+    frames: FloatArray, rng: np.random.Generator | None
+) -> npt.NDArray[np.uint8]:
+    """
+    Converts frames in [-1, 1) to unsigned 8-bit samples, with TPDF dither
+    if rng is given.
+    """
+    values = frames * 128 + 128
+    if rng is not None:
+        # Triangular dither, spanning +-1 LSB
+        values += rng.random(values.shape) - rng.random(values.shape)
+    return np.clip(np.round(values), 0, 255).astype(np.uint8)
+
+
+def convert(
+    wav: BinaryIO,
+    image: BinaryIO,
+    *,
+    sample_rate: int | None = None,
+    dither: bool = True,
+    seed: int | None = None,
+) -> tuple[int, int]:
+    """
+    Converts a WAV file into a flash image.
+    Returns the sample rate of the image, and the number of frames written.
+    """
+    input_rate, chunks = read_wav(wav)
+    output_rate = sample_rate or input_rate
+
+    resampler = (
+        Resampler(input_rate, output_rate, CHANNELS)
+        if output_rate != input_rate
+        else None
+    )
+    rng = np.random.default_rng(seed) if dither else None
+
+    frames_written = 0
+
+    def write(frames: FloatArray) -> None:
+        nonlocal frames_written
+        # C order interleaves the channels: L, R, L, R, ...
+        image.write(quantize(frames, rng).tobytes())
+        frames_written += len(frames)
+
+    for chunk in chunks:
+        write(resampler.process(chunk) if resampler else chunk)
+    if resampler:
+        write(resampler.flush())
+
+    return output_rate, frames_written
+
+
+def sidecar_path(image: Path) -> Path:
+    return image.with_name(image.name + ".json")
+
+
+def _main() -> None:
+    args = _parse_command_line()
+
+    with args.input.open("rb") as wav, args.output.open("wb") as image:
+        sample_rate, frames = convert(
+            wav,
+            image,
+            sample_rate=args.sample_rate,
+            dither=args.dither,
+            seed=args.seed,
+        )
+
+    sidecar = {
+        "sample_rate_hz": sample_rate,
+        "clock_hz": sample_rate * CYCLES_PER_SAMPLE,
+        "channels": CHANNELS,
+        "frames": frames,
+        "size_bytes": frames * CHANNELS,
+    }
+    with sidecar_path(args.output).open("w") as f:
+        json.dump(sidecar, f, indent=4)
+        f.write("\n")
+
+    print(
+        f"Wrote {sidecar['size_bytes']} bytes at {sample_rate} Hz, "
+        f"clock the chip at {sidecar['clock_hz']} Hz",
+        file=sys.stderr,
+    )
+
+
+def _parse_command_line() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument("input", type=Path, help="PCM WAV file, mono or stereo")
+    parser.add_argument(
+        "output",
+        type=Path,
+        help="Flash image. The sidecar is written to OUTPUT.json.",
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=int,
+        help="Sample rate of the image. If unspecified, the input rate is kept.",
+    )
+    parser.add_argument(
+        "--no-dither",
+        dest="dither",
+        action="store_false",
+        help="Round the samples to 8 bits without dither",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="Seed for the dither, for reproducible images"
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,258 @@
+"""
+Cycle-exact reference model of the player in production mode: Player
+reading from the flash through SPIFlash, as wired in DigitalTop.
+The output of DigitalTop with upsampling is modeled by upsample.
+
+Instead of simulating every clock edge, the model computes when each
+frame is completed from the fixed timing of the controller, so whole
+songs can be processed in seconds.
+"""
+
+import math
+from bisect import bisect_right
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+from tt10_rtl.spi_flash import FlashParams
+
+# Timing of the default FlashParams, which DigitalTop uses.
+# Cycles from the edge at which the controller sees the read request,
+# to the edge at which the player samples the first byte.
+FIRST_BYTE_CYCLES = FlashParams().cycles_until_first_read_byte
+BYTE_CYCLES = FlashParams().cycles_per_byte
+CHANNELS = 2
+FRAME_CYCLES = BYTE_CYCLES * CHANNELS
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Playback:
+    """
+    Values taken by o_digital. Row i of ``samples`` (left, right) is output
+    after clock edge ``cycles[i]``, and stays until the next row.
+    Frames are listed even if they're equal to the previous one.
+    When playback pauses, o_digital is cleared, which is listed as
+    a row of zeros, and marked in ``pauses``.
+    """
+
+    cycles: npt.NDArray[np.int64]
+    samples: npt.NDArray[np.uint8]
+    pauses: npt.NDArray[np.bool_]
+    clock_hz: float
+
+    @property
+    def times(self) -> npt.NDArray[np.float64]:
+        """
+        Timestamps of the rows, in seconds since edge 0.
+        """
+        times: npt.NDArray[np.float64] = self.cycles / self.clock_hz
+        return times
+
+    @property
+    def o_digital(self) -> npt.NDArray[np.uint16]:
+        """
+        The rows as the 16-bit value of DigitalTop.o_digital.
+        """
+        left = self.samples[:, 0].astype(np.uint16)
+        right = self.samples[:, 1].astype(np.uint16)
+        result: npt.NDArray[np.uint16] = (left | (right << 8)).astype(np.uint16)
+        return result
+
+
+def simulate(
+    image: bytes,
+    play_events: Sequence[tuple[int, bool]],
+    *,
+    end_cycle: int,
+    clock_hz: float,
+    address_width_bits: int = 24,
+) -> Playback:
+    """
+    Computes the output of the player for a flash image.
+
+    Cycles count clock edges, with edge 0 being the first one after reset.
+    The flash wraps around at the end of the image, and the player wraps
+    around at the end of the address space.
+
+    :param play_events: (cycle, level) pairs, sorted by cycle. i_play takes
+        the level at the given edge, and keeps it until the next event.
+        It's low until the first event.
+    :param end_cycle: Last edge to model.
+    """
+    if not image:
+        raise ValueError("The flash image can't be empty")
+
+    event_cycles = [cycle for cycle, _ in play_events]
+    if event_cycles != sorted(event_cycles):
+        raise ValueError("Play events must be sorted")
+
+    # Intervals [start, end) during which i_play is high,
+    # up to the end of the model
+    high_intervals: list[tuple[int, int]] = []
+    high_start: int | None = None
+    for cycle, level in play_events:
+        if level and high_start is None:
+            high_start = cycle
+        elif not level and high_start is not None:
+            if cycle > high_start:
+                high_intervals.append((high_start, cycle))
+            high_start = None
+    if high_start is not None:
+        high_intervals.append((high_start, max(high_start, end_cycle) + 1))
+    high_starts = [start for start, _ in high_intervals]
+
+    def next_high(cycle: int) -> int | None:
+        """First edge at or after the given one at which i_play is high."""
+        index = bisect_right(high_starts, cycle) - 1
+        if index >= 0 and cycle < high_intervals[index][1]:
+            return cycle
+        if index + 1 < len(high_intervals):
+            return high_starts[index + 1]
+        return None
+
+    def next_low(cycle: int) -> int:
+        """First edge at or after the given one at which i_play is low."""
+        index = bisect_right(high_starts, cycle) - 1
+        if index >= 0 and cycle < high_intervals[index][1]:
+            return high_intervals[index][1]
+        return cycle
+
+    data = np.frombuffer(image, np.uint8)
+    address_mask = (1 << address_width_bits) - 1
+
+    cycles: list[npt.NDArray[np.int64]] = []
+    samples: list[npt.NDArray[np.uint8]] = []
+    pauses: list[npt.NDArray[np.bool_]] = []
+
+    frames_played = 0
+    # First edge at which the player is paused, and can see i_play
+    paused_from = 0
+    while True:
+        play_cycle = next_high(paused_from)
+        if play_cycle is None:
+            break
+
+        # The controller sees the read request on the next edge
+        read_cycle = play_cycle + 1
+        first_frame_cycle = (
+            read_cycle + FIRST_BYTE_CYCLES + BYTE_CYCLES * (CHANNELS - 1)
+        )
+        if first_frame_cycle > end_cycle:
+            break
+
+        # The player only checks i_play when a frame is done. Find the first
+        # frame that's done while i_play is low.
+        pause_cycle: int | None = None
+        candidate = first_frame_cycle
+        while candidate <= end_cycle:
+            low = next_low(candidate)
+            if low == candidate:
+                pause_cycle = candidate
+                break
+            # Round up to the next frame
+            candidate = first_frame_cycle + FRAME_CYCLES * math.ceil(
+                (low - first_frame_cycle) / FRAME_CYCLES
+            )
+
+        last_frame_cycle = end_cycle if pause_cycle is None else pause_cycle
+        frames = (last_frame_cycle - first_frame_cycle) // FRAME_CYCLES + 1
+
+        # Every frame reads the channels from consecutive addresses
+        start_address = (frames_played * CHANNELS) & address_mask
+        offsets = np.arange(frames * CHANNELS, dtype=np.int64)
+        session = data[(start_address + offsets) % len(data)].reshape(-1, CHANNELS)
+
+        cycles.append(
+            first_frame_cycle + FRAME_CYCLES * np.arange(frames, dtype=np.int64)
+        )
+        samples.append(session)
+        pauses.append(np.zeros(frames, np.bool_))
+        frames_played += frames
+
+        if pause_cycle is None:
+            break
+
+        # o_digital is cleared on the first edge in the paused state
+        paused_from = pause_cycle + 1
+        if paused_from > end_cycle:
+            break
+        cycles.append(np.array([paused_from], dtype=np.int64))
+        samples.append(np.zeros((1, CHANNELS), np.uint8))
+        pauses.append(np.ones(1, np.bool_))
+
+    return Playback(
+        cycles=np.concatenate(cycles) if cycles else np.zeros(0, np.int64),
+        samples=(
+            np.concatenate(samples) if samples else np.zeros((0, CHANNELS), np.uint8)
+        ),
+        pauses=np.concatenate(pauses) if pauses else np.zeros(0, np.bool_),
+        clock_hz=clock_hz,
+    )
+
+
+def upsample(playback: Playback, factor: int, *, end_cycle: int) -> Playback:
+    """
+    Computes the output of DigitalTop built with upsampling=factor, from the
+    output of its player.
+
+    NOTE: Keep in sync with Interpolator. Every frame is approached from the
+    previous one in factor steps, starting on the edge after the frame.
+    Step k is previous + k * (|frame - previous| // factor) towards the frame,
+    and the last step is the frame itself. Pauses clear
+    the output on the same edge as the player, and the frame just before
+    a pause is never output, since the clear takes precedence. After a pause,
+    the next frame is approached from 0.
+
+    :param end_cycle: Last edge to model.
+    """
+    if factor not in (2, 4):
+        raise ValueError(f"Unsupported upsampling factor: {factor}")
+    step_cycles = FRAME_CYCLES // factor
+    shift = (factor - 1).bit_length()
+
+    pauses = playback.pauses
+    # Frames that are followed by a pause
+    cleared = np.zeros_like(pauses)
+    cleared[:-1] = pauses[1:]
+    frames = ~pauses & ~cleared
+
+    # Pause rows are zeros, and so is the output before the first frame
+    previous = np.concatenate(
+        [np.zeros((1, CHANNELS), np.uint8), playback.samples[:-1]]
+    )[frames].astype(np.int16)
+    current = playback.samples[frames].astype(np.int16)
+    frame_cycles = playback.cycles[frames]
+
+    delta = current - previous
+    increment = np.sign(delta) * (np.abs(delta) >> shift)
+    steps = np.arange(1, factor + 1)
+    # Indexed by (frame, step, channel)
+    stepped = (
+        previous[:, np.newaxis, :]
+        + increment[:, np.newaxis, :] * steps[np.newaxis, :, np.newaxis]
+    )
+    stepped[:, -1, :] = current
+    stepped_cycles = (
+        frame_cycles[:, np.newaxis] + 1 + (steps - 1)[np.newaxis, :] * step_cycles
+    )
+
+    cycles = np.concatenate([stepped_cycles.reshape(-1), playback.cycles[pauses]])
+    samples = np.concatenate(
+        [
+            stepped.reshape(-1, CHANNELS).astype(np.uint8),
+            np.zeros((np.count_nonzero(pauses), CHANNELS), np.uint8),
+        ]
+    )
+    is_pause = np.concatenate(
+        [np.zeros(stepped_cycles.size, np.bool_), np.ones_like(pauses[pauses])]
+    )
+
+    order = np.argsort(cycles, kind="stable")
+    keep = cycles[order] <= end_cycle
+    return Playback(
+        cycles=cycles[order][keep],
+        samples=samples[order][keep],
+        pauses=is_pause[order][keep],
+        clock_hz=playback.clock_hz,
+    )
@@ -0,0 +1,128 @@
+import io
+import json
+import subprocess
+import sys
+import wave
+from pathlib import Path
+
+import audio_to_flash
+import numpy as np
+import pytest
+
+
+def _wav(samples: np.ndarray, rate: int, sample_width: int) -> bytes:
+    """
+    Builds a WAV file from frames x channels integer samples.
+    """
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    dtype = np.uint8 if sample_width == 1 else np.dtype(f"<i{sample_width}")
+    result = io.BytesIO()
+    with wave.open(result, "wb") as writer:
+        writer.setnchannels(samples.shape[1])
+        writer.setsampwidth(sample_width)
+        writer.setframerate(rate)
+        writer.writeframes(samples.astype(dtype).tobytes())
+    return result.getvalue()
+
+
+def test_passthrough() -> None:
+    rng = np.random.default_rng()
+    samples = rng.integers(0, 256, (10_000, 2))
+    image = io.BytesIO()
+
+    rate, frames = audio_to_flash.convert(
+        io.BytesIO(_wav(samples, 8000, 1)), image, dither=False
+    )
+
+    assert rate == 8000
+    assert frames == len(samples)
+    # Left, then right
+    assert image.getvalue() == samples.astype(np.uint8).tobytes()
+
+
+def test_mono_16_bit() -> None:
+    rng = np.random.default_rng()
+    samples = rng.integers(-(1 << 15), 1 << 15, 10_000)
+    image = io.BytesIO()
+
+    audio_to_flash.convert(io.BytesIO(_wav(samples, 8000, 2)), image, dither=False)
+
+    result = np.frombuffer(image.getvalue(), np.uint8).reshape(-1, 2)
+    # Both channels get the same samples
+    assert (result[:, 0] == result[:, 1]).all()
+    expected = np.clip(np.round(samples / 256 + 128), 0, 255)
+    assert (result[:, 0] == expected).all()
+
+
+def test_dither_is_unbiased() -> None:
+    # A constant halfway between two 8-bit values
+    samples = np.full(100_000, 0x80, np.int64)
+    image = io.BytesIO()
+
+    audio_to_flash.convert(io.BytesIO(_wav(samples, 8000, 2)), image, seed=1)
+
+    result = np.frombuffer(image.getvalue(), np.uint8)
+    assert set(np.unique(result)) <= {127, 128, 129, 130}
+    assert result.mean() == pytest.approx(128.5, abs=0.01)
+
+
+@pytest.mark.parametrize("input_rate,output_rate", [(48000, 44100), (22050, 44100)])
+def test_resample(
+    input_rate: int, output_rate: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    frequency = 1000
+    duration_frames = input_rate // 2
+    t = np.arange(duration_frames) / input_rate
+    samples = np.round(np.sin(2 * np.pi * frequency * t) * 0.5 * (1 << 15))
+    wav = _wav(np.stack((samples, -samples), axis=1), input_rate, 2)
+
+    whole = io.BytesIO()
+    rate, frames = audio_to_flash.convert(
+        io.BytesIO(wav), whole, sample_rate=output_rate, dither=False
+    )
+    assert rate == output_rate
+    assert frames == -(-duration_frames * output_rate // input_rate)
+
+    # Chunk boundaries don't change the result
+    monkeypatch.setattr(audio_to_flash, "CHUNK_FRAMES", 1000)
+    chunked = io.BytesIO()
+    audio_to_flash.convert(
+        io.BytesIO(wav), chunked, sample_rate=output_rate, dither=False
+    )
+    assert chunked.getvalue() == whole.getvalue()
+
+    result = np.frombuffer(whole.getvalue(), np.uint8).reshape(-1, 2) - 128.0
+    left = result[:, 0]
+    spectrum = np.abs(np.fft.rfft(left))
+    peak = np.argmax(spectrum) * output_rate / len(left)
+    assert peak == pytest.approx(frequency, abs=output_rate / len(left))
+
+    # Compare with an ideal sine, away from the edges
+    t = np.arange(len(left)) / output_rate
+    expected = np.sin(2 * np.pi * frequency * t) * 64
+    middle = slice(len(left) // 4, 3 * len(left) // 4)
+    assert np.abs(left[middle] - expected[middle]).max() <= 1
+    assert (result[:, 1] == np.clip(-left, -128, 127)).all()
+
+
+def test_sidecar(tmp_path: Path) -> None:
+    wav = tmp_path / "input.wav"
+    wav.write_bytes(_wav(np.zeros((100, 2)), 44100, 2))
+    image = tmp_path / "image.bin"
+
+    subprocess.run(
+        [
+            sys.executable,
+            Path(__file__).parent / "audio_to_flash.py",
+            wav,
+            image,
+        ],
+        check=True,
+    )
+
+    assert image.stat().st_size == 200
+    sidecar = json.loads(audio_to_flash.sidecar_path(image).read_text())
+    assert sidecar["sample_rate_hz"] == 44100
+    # From the docs
+    assert sidecar["clock_hz"] == 1411200
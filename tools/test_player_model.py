@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import player_model
+import pytest
+
+CLOCK_HZ = 48e3 * 16 * 2
+
+
+def test_upsampling_steps() -> None:
+    image = bytes([0, 0, 100, 200, 101, 201, 0, 3])
+    playback = player_model.simulate(
+        image, [(0, True)], end_cycle=1000, clock_hz=CLOCK_HZ
+    )
+    upsampled = player_model.upsample(playback, 4, end_cycle=1000)
+
+    assert (np.diff(upsampled.cycles) == player_model.FRAME_CYCLES // 4).all()
+    assert upsampled.samples[:16].tolist() == [
+        # From the zeros before playback
+        [0, 0],
+        [0, 0],
+        [0, 0],
+        [0, 0],
+        [25, 50],
+        [50, 100],
+        [75, 150],
+        [100, 200],
+        # Rounded down
+        [100, 200],
+        [100, 200],
+        [100, 200],
+        [101, 201],
+        # Down, rounded towards the previous frame
+        [76, 152],
+        [51, 103],
+        [26, 54],
+        [0, 3],
+    ]
+
+
+def test_continuous() -> None:
+    image = bytes(range(256))
+    playback = player_model.simulate(
+        image, [(0, True)], end_cycle=100_000, clock_hz=CLOCK_HZ
+    )
+
+    assert (np.diff(playback.cycles) == player_model.FRAME_CYCLES).all()
+    frames = np.arange(len(playback.cycles)) * 2
+    assert (playback.samples[:, 0] == frames % 256).all()
+    assert (playback.samples[:, 1] == (frames + 1) % 256).all()
+
+
+def test_address_wraps_around() -> None:
+    # A read continues sequentially until the end of the flash, but the player
+    # wraps around at the end of its address space, so a read that starts after
+    # a pause does too.
+    image = bytes(range(64))
+    playback = player_model.simulate(
+        image,
+        [(0, True), (500, False), (1000, True)],
+        end_cycle=2000,
+        clock_hz=CLOCK_HZ,
+        address_width_bits=4,
+    )
+
+    # The last frame before the pause, then a row of zeros
+    last, zeros = np.flatnonzero(np.diff(playback.cycles) != player_model.FRAME_CYCLES)
+    assert zeros == last + 1
+    assert (playback.samples[zeros] == 0).all()
+    before = playback.samples[: last + 1, 0]
+    after = playback.samples[zeros + 1 :, 0]
+    assert (before == np.arange(len(before)) * 2).all()
+    assert len(before) * 2 > 16
+    assert after[0] == len(before) * 2 % 16
+
+
+def test_full_song() -> None:
+    # 10 minutes, with a pause every second
+    clock_hz = 44.1e3 * player_model.FRAME_CYCLES
+    seconds = 10 * 60
+    image = random.randbytes(1 << 24)
+    play_events = [
+        (round(second * clock_hz) + offset, level)
+        for second in range(seconds)
+        for offset, level in ((0, True), (round(clock_hz * 0.9), False))
+    ]
+
+    playback = player_model.simulate(
+        image, play_events, end_cycle=round(seconds * clock_hz), clock_hz=clock_hz
+    )
+
+    # Every pause adds a row of zeros
+    assert len(playback.cycles) == pytest.approx(seconds * 44.1e3 * 0.9, rel=0.01)
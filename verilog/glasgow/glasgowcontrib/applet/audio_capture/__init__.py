@@ -0,0 +1,419 @@
+import logging
+from argparse import ArgumentParser, FileType, Namespace
+from typing import Any
+
+from amaranth import Cat, Module, Mux, Signal, unsigned
+from amaranth.lib import stream
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth.lib.io import Buffer, Direction, PortLike
+from amaranth.lib.wiring import Component, In, Out
+from glasgow.applet import (
+    AbstractAssembly,
+    GlasgowAppletArguments,
+    GlasgowAppletError,
+    GlasgowAppletV2,
+    GlasgowAppletV2TestCase,
+    GlasgowPin,
+)
+from tt10_rtl.spi_flash import FlashParams
+
+from .analysis import (
+    RECORD_DELTA_MAX,
+    RECORD_FLAG_OVERFLOW,
+    RECORD_FLAG_START,
+    RECORD_SIZE,
+    Capture,
+    Record,
+    compare,
+    parse_records,
+    recover_samples,
+)
+
+CHANNELS = 2
+# The player outputs a frame as fast as the flash controller reads one,
+# with the default FlashParams, which DigitalTop uses.
+CYCLES_PER_SAMPLE = FlashParams().cycles_per_byte * CHANNELS
+
+_CLOCK_PHASE_WIDTH_BITS = 32
+
+# Maximum number of records to receive at once
+_RECV_RECORDS = 1024
+
+
+class AudioCaptureComponent(Component):  # type: ignore[misc]
+    """
+    Records the value of uo whenever it changes, along with the number
+    of cycles since the previous record. Can also drive the clock,
+    reset and play inputs of the chip.
+    """
+
+    def __init__(
+        self,
+        uo: PortLike,
+        *,
+        clk: PortLike | None = None,
+        rst: PortLike | None = None,
+        play: PortLike | None = None,
+        fifo_depth: int = 1024,
+    ) -> None:
+        super().__init__(
+            {
+                # Added to the phase of the clock generator every cycle.
+                # The clock is the top bit of the phase.
+                "i_clock_step": In(unsigned(_CLOCK_PHASE_WIDTH_BITS)),
+                "i_reset": In(1),
+                "i_play": In(1),
+                "i_capture": In(1),
+                "o_stream": Out(stream.Signature(unsigned(8))),
+            }
+        )
+
+        assert fifo_depth > 0
+
+        self._uo = uo
+        self._clk = clk
+        self._rst = rst
+        self._play = play
+        self._fifo_depth = fifo_depth
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        #
+        # Chip control
+        #
+
+        if self._clk is not None:
+            phase = Signal(unsigned(_CLOCK_PHASE_WIDTH_BITS))
+            m.d.sync += phase.eq(phase + self.i_clock_step)
+            m.submodules.clk_buffer = clk_buffer = Buffer(Direction.Output, self._clk)
+            m.d.comb += clk_buffer.o.eq(phase[-1])
+
+        if self._rst is not None:
+            m.submodules.rst_buffer = rst_buffer = Buffer(Direction.Output, self._rst)
+            # rst_n is active-low
+            m.d.comb += rst_buffer.o.eq(~self.i_reset)
+
+        if self._play is not None:
+            m.submodules.play_buffer = play_buffer = Buffer(
+                Direction.Output, self._play
+            )
+            m.d.comb += play_buffer.o.eq(self.i_play)
+
+        #
+        # Capture
+        #
+
+        m.submodules.uo_buffer = uo_buffer = Buffer(Direction.Input, self._uo)
+        uo = Signal(8)
+        m.submodules.uo_sync = FFSynchronizer(uo_buffer.i, uo)
+
+        # The pins don't all change at exactly the same time, so only take
+        # values that are stable for two cycles.
+        uo_prev = Signal(8)
+        m.d.sync += uo_prev.eq(uo)
+        stable = Signal()
+        m.d.comb += stable.eq(uo == uo_prev)
+
+        m.submodules.fifo = fifo = SyncFIFOBuffered(
+            width=8 * RECORD_SIZE, depth=self._fifo_depth
+        )
+
+        value = Signal(8)
+        delta = Signal(range(RECORD_DELTA_MAX + 1))
+        overflow = Signal()
+
+        record_delta = Signal.like(delta)
+        record_value = Signal.like(value)
+        record_flags = Signal(8)
+        m.d.comb += fifo.w_data.eq(Cat(record_delta, record_value, record_flags))
+
+        with m.FSM():
+            with m.State("Idle"):
+                # Records left over from the previous capture may still be
+                # in the FIFO. Wait for room, so the start record isn't lost.
+                with m.If(self.i_capture & stable & fifo.w_rdy):
+                    m.d.comb += [
+                        record_delta.eq(0),
+                        record_value.eq(uo),
+                        record_flags.eq(RECORD_FLAG_START),
+                        fifo.w_en.eq(1),
+                    ]
+                    m.d.sync += [
+                        value.eq(uo),
+                        delta.eq(1),
+                        overflow.eq(0),
+                    ]
+                    m.next = "Capture"
+
+            with m.State("Capture"):
+                change = stable & (uo != value)
+                with m.If(~self.i_capture):
+                    m.next = "Idle"
+                # Also record when nothing changes, before the delta overflows
+                with m.Elif(change | (delta == RECORD_DELTA_MAX)):
+                    m.d.comb += [
+                        record_delta.eq(delta),
+                        record_value.eq(Mux(change, uo, value)),
+                        record_flags.eq(Mux(overflow, RECORD_FLAG_OVERFLOW, 0)),
+                        fifo.w_en.eq(1),
+                    ]
+                    m.d.sync += [
+                        value.eq(record_value),
+                        delta.eq(1),
+                        # The flag is sent with the first record
+                        # that makes it into the FIFO
+                        overflow.eq(~fifo.w_rdy),
+                    ]
+                with m.Else():
+                    m.d.sync += delta.eq(delta + 1)
+
+        # Send the records a byte at a time
+        byte_index = Signal(range(RECORD_SIZE))
+        m.d.comb += [
+            self.o_stream.valid.eq(fifo.r_rdy),
+            self.o_stream.payload.eq(fifo.r_data.word_select(byte_index, 8)),
+            fifo.r_en.eq(self.o_stream.ready & (byte_index == RECORD_SIZE - 1)),
+        ]
+        with m.If(self.o_stream.valid & self.o_stream.ready):
+            m.d.sync += byte_index.eq(
+                Mux(byte_index == RECORD_SIZE - 1, 0, byte_index + 1)
+            )
+
+        return m
+
+
+class AudioCaptureInterface:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        assembly: AbstractAssembly,
+        *,
+        uo: tuple[GlasgowPin, ...],
+        clk: GlasgowPin | None = None,
+        rst: GlasgowPin | None = None,
+        play: GlasgowPin | None = None,
+    ) -> None:
+        self._logger = logger
+
+        uo_port = assembly.add_port(uo, "uo")
+        clk_port = assembly.add_port(clk, "clk") if clk is not None else None
+        rst_port = assembly.add_port(rst, "rst") if rst is not None else None
+        play_port = assembly.add_port(play, "play") if play is not None else None
+
+        self._component = assembly.add_submodule(
+            AudioCaptureComponent(uo_port, clk=clk_port, rst=rst_port, play=play_port)
+        )
+
+        self._clock_step_reg = assembly.add_rw_register(self._component.i_clock_step)
+        self._reset_reg = assembly.add_rw_register(self._component.i_reset)
+        self._play_reg = assembly.add_rw_register(self._component.i_play)
+        self._capture_reg = assembly.add_rw_register(self._component.i_capture)
+        self._pipe = assembly.add_in_pipe(self._component.o_stream)
+
+        self._clock_hz: float = 1 / assembly.sys_clk_period
+
+    @property
+    def clock_hz(self) -> float:
+        """
+        Frequency of the clock that captures are timed with.
+        """
+        return self._clock_hz
+
+    async def set_chip_clock(self, frequency_hz: float) -> float:
+        """
+        Drives the clock of the chip. The frequency is rounded to the
+        resolution of the clock generator, and the result is returned.
+        The edges are aligned to our own clock, so they have up to a cycle
+        of jitter.
+        """
+        step = round(frequency_hz / self.clock_hz * (1 << _CLOCK_PHASE_WIDTH_BITS))
+        # The clock is the top bit of the phase, so it can toggle
+        # at most every other cycle.
+        if not 0 < step < 1 << (_CLOCK_PHASE_WIDTH_BITS - 1):
+            raise GlasgowAppletError(
+                f"Clock frequency must be below {self.clock_hz / 2:.0f} Hz"
+            )
+        await self._clock_step_reg.set(step)
+        return step * self.clock_hz / (1 << _CLOCK_PHASE_WIDTH_BITS)
+
+    async def set_reset(self, reset: bool) -> None:
+        await self._reset_reg.set(reset)
+
+    async def set_play(self, play: bool) -> None:
+        await self._play_reg.set(play)
+
+    async def start_capture(self) -> None:
+        assert not (await self._capture_reg.get())
+        await self._capture_reg.set(True)
+
+    async def read_capture(self, duration_s: float) -> Capture:
+        """
+        Receives the records of a capture started with start_capture,
+        until the given time since the start, then stops the capture.
+        """
+        assert await self._capture_reg.get()
+
+        duration_cycles = round(duration_s * self.clock_hz)
+        records: list[Record] = []
+        cycles = 0
+        try:
+            while cycles < duration_cycles:
+                if records:
+                    # There's a record at least every RECORD_DELTA_MAX cycles,
+                    # so this doesn't wait for records past the end.
+                    count = min(
+                        _RECV_RECORDS,
+                        -(-(duration_cycles - cycles) // RECORD_DELTA_MAX),
+                    )
+                else:
+                    # Records left over from the previous capture
+                    # come before the start record.
+                    count = 1
+
+                data = await self._pipe.recv(RECORD_SIZE * count)
+                for record in parse_records(bytes(data)):
+                    if not records and not (record.flags & RECORD_FLAG_START):
+                        continue
+                    if record.flags & RECORD_FLAG_OVERFLOW:
+                        raise GlasgowAppletError(
+                            "Capture buffer overflowed, the host is too slow"
+                        )
+                    records.append(record)
+                    cycles += record.delta
+        finally:
+            await self._capture_reg.set(False)
+
+        self._logger.debug("Received %d records", len(records))
+        return Capture.from_records(records, self.clock_hz)
+
+
+class AudioCaptureApplet(GlasgowAppletV2):  # type: ignore[misc]
+    logger = logging.getLogger(__name__)
+    help = "capture the audio mirrored on uo, and check it against the image"
+    required_revision = "C3"
+
+    @classmethod
+    def add_build_arguments(
+        cls, parser: ArgumentParser, access: GlasgowAppletArguments
+    ) -> None:
+        access.add_voltage_argument(parser)
+        access.add_pins_argument(
+            parser,
+            "uo",
+            required=True,
+            width=8,
+            default="B0,B1,B2,B3,B4,B5,B6,B7",
+            help="bind the chip's uo[7:0] to PINS",
+        )
+        access.add_pins_argument(
+            parser, "clk", help="drive the clock of the chip on PIN"
+        )
+        access.add_pins_argument(parser, "rst", help="drive rst_n of the chip on PIN")
+        access.add_pins_argument(parser, "play", help="drive ui[0] of the chip on PIN")
+
+    def build(self, args: Namespace) -> None:
+        with self.assembly.add_applet(self):
+            self.assembly.use_voltage(args.voltage)
+            self.capture_iface = AudioCaptureInterface(
+                self.logger,
+                self.assembly,
+                uo=args.uo,
+                clk=args.clk,
+                rst=args.rst,
+                play=args.play,
+            )
+
+    @classmethod
+    def add_run_arguments(cls, parser: ArgumentParser) -> None:
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=1.0,
+            metavar="SECONDS",
+            help="capture for SECONDS (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--clock-hz",
+            type=float,
+            default=44100 * CYCLES_PER_SAMPLE,
+            metavar="FREQ",
+            help="frequency of the clock driven on the clk pin (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--image",
+            type=FileType("rb"),
+            help="compare the capture with the samples in IMAGE",
+        )
+        parser.add_argument(
+            "--channel",
+            choices=("left", "right"),
+            default="left",
+            help="channel of the image mirrored on uo (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            type=FileType("wb"),
+            help="write the recovered samples to FILE, as unsigned 8-bit PCM",
+        )
+
+    async def run(self, args: Namespace) -> None:
+        period_cycles = None
+        if args.clk is not None:
+            chip_clock_hz = await self.capture_iface.set_chip_clock(args.clock_hz)
+            self.logger.info("Clocking the chip at %.1f Hz", chip_clock_hz)
+            period_cycles = (
+                CYCLES_PER_SAMPLE * self.capture_iface.clock_hz / chip_clock_hz
+            )
+        # Start capturing before playback, so that nothing is missed
+        if args.rst is not None:
+            await self.capture_iface.set_reset(True)
+        await self.capture_iface.start_capture()
+        if args.rst is not None:
+            await self.capture_iface.set_reset(False)
+        if args.play is not None:
+            await self.capture_iface.set_play(True)
+        capture = await self.capture_iface.read_capture(args.duration)
+        if args.play is not None:
+            await self.capture_iface.set_play(False)
+
+        try:
+            samples = recover_samples(capture, period_cycles)
+        except ValueError as e:
+            raise GlasgowAppletError(str(e)) from e
+        self.logger.info(
+            "Recovered %d samples at %.1f Hz",
+            len(samples.values),
+            capture.clock_hz / samples.period_cycles,
+        )
+
+        if args.output:
+            args.output.write(samples.values)
+
+        if args.image:
+            channel = ("left", "right").index(args.channel)
+            expected = args.image.read()[channel::CHANNELS]
+            try:
+                report = compare(samples, expected, capture.clock_hz)
+            except ValueError as e:
+                raise GlasgowAppletError(str(e)) from e
+
+            self.logger.info("Compared %d samples", report.samples)
+            self.logger.info("Dropped: %d", report.dropped)
+            self.logger.info("Duplicated: %d", report.duplicated)
+            self.logger.info("Mismatched: %d", report.mismatched)
+            self.logger.info(
+                "Jitter: %.1f ns RMS, %.1f ns peak",
+                report.jitter_rms_s * 1e9,
+                report.jitter_peak_s * 1e9,
+            )
+            if not report.ok:
+                raise GlasgowAppletError("The capture doesn't match the image")
+
+    @classmethod
+    def tests(cls) -> type[GlasgowAppletV2TestCase]:
+        from . import test
+
+        return test.AudioCaptureAppletTestCase
@@ -0,0 +1,210 @@
+"""
+Host-side analysis of captures: recovers the sample stream from the times
+at which uo changed, and compares it with the image it was played from.
+"""
+
+import math
+import statistics
+import struct
+from dataclasses import dataclass
+
+# Every record is: 16-bit little-endian delta, value of uo, flags.
+# The delta is the number of cycles of the capture clock since
+# the previous record.
+RECORD_SIZE = 4
+RECORD_DELTA_MAX = 0xFFFF
+# First record of a capture, with a delta of 0
+RECORD_FLAG_START = 1 << 0
+# Records were lost before this one
+RECORD_FLAG_OVERFLOW = 1 << 1
+
+# Number of samples that must match after a dropped or duplicated sample
+_RESYNC_WINDOW = 8
+# Maximum number of consecutive dropped samples to look for
+_MAX_DROPPED = 4
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Record:
+    delta: int
+    value: int
+    flags: int
+
+
+def parse_records(data: bytes) -> list[Record]:
+    assert len(data) % RECORD_SIZE == 0
+    return [
+        Record(delta=delta, value=value, flags=flags)
+        for delta, value, flags in struct.iter_unpack("<HBB", data)
+    ]
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Capture:
+    """
+    Values taken by uo. ``values[i]`` was seen at ``cycles[i]``, counted
+    in cycles of the capture clock from the start of the capture.
+    The first entry is the value at the start of the capture.
+    """
+
+    cycles: list[int]
+    values: list[int]
+    end_cycle: int
+    clock_hz: float
+
+    @classmethod
+    def from_records(cls, records: list[Record], clock_hz: float) -> "Capture":
+        if not records or not (records[0].flags & RECORD_FLAG_START):
+            raise ValueError("A capture must begin with a start record")
+
+        cycles: list[int] = []
+        values: list[int] = []
+        cycle = 0
+        for record in records:
+            if record.flags & RECORD_FLAG_OVERFLOW:
+                raise ValueError(f"Records were lost before cycle {cycle}")
+            cycle += record.delta
+            # Records are also sent when nothing changes, so that the deltas
+            # don't overflow
+            if not values or record.value != values[-1]:
+                cycles.append(cycle)
+                values.append(record.value)
+
+        return cls(cycles=cycles, values=values, end_cycle=cycle, clock_hz=clock_hz)
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Samples:
+    """
+    Sample stream recovered from a capture.
+    """
+
+    values: bytes
+    # Sample period, in cycles of the capture clock
+    period_cycles: float
+    # Deviation of every change of uo from the ideal sample grid,
+    # in cycles of the capture clock
+    jitter_cycles: list[float]
+
+
+def recover_samples(capture: Capture, period_cycles: float | None = None) -> Samples:
+    """
+    Splits the time between changes of uo into whole sample periods.
+    Consecutive samples with the same value don't change uo, so they're
+    recovered from the length of the interval.
+
+    The samples before the first change and after the last one are left
+    out, since it's not known when they began or ended.
+
+    :param period_cycles: Nominal sample period. If None, it is estimated
+        from the capture.
+    """
+    changes = capture.cycles[1:]
+    if len(changes) < 2:
+        raise ValueError("The capture has too few changes to recover samples")
+    intervals = [end - start for start, end in zip(changes, changes[1:])]
+
+    period = statistics.median(intervals) if period_cycles is None else period_cycles
+    # The nominal period may be slightly off from the actual one, for example
+    # if the chip has its own clock. Fit the period to the changes,
+    # and recount the samples with the result.
+    for _ in range(2):
+        counts = [max(1, round(interval / period)) for interval in intervals]
+        indices = [0]
+        for count in counts:
+            indices.append(indices[-1] + count)
+        period, offset = _fit_line(indices, changes)
+
+    jitter = [
+        cycle - (offset + period * index) for index, cycle in zip(indices, changes)
+    ]
+    values = bytes(
+        value for value, count in zip(capture.values[1:], counts) for _ in range(count)
+    )
+    return Samples(values=values, period_cycles=period, jitter_cycles=jitter)
+
+
+def _fit_line(xs: list[int], ys: list[int]) -> tuple[float, float]:
+    """
+    Least-squares fit of ys = slope * xs + offset.
+    Returns the slope and the offset.
+    """
+    mean_x = statistics.fmean(xs)
+    mean_y = statistics.fmean(ys)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    slope = covariance / variance
+    return slope, mean_y - slope * mean_x
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Report:
+    # Number of captured samples that were compared
+    samples: int
+    # Samples of the image that were never output
+    dropped: int
+    # Samples that were output more than once
+    duplicated: int
+    # Samples that don't match the image, and aren't one of the above
+    mismatched: int
+    period_s: float
+    jitter_rms_s: float
+    jitter_peak_s: float
+
+    @property
+    def ok(self) -> bool:
+        return not (self.dropped or self.duplicated or self.mismatched)
+
+
+def compare(samples: Samples, expected: bytes, clock_hz: float) -> Report:
+    """
+    Compares the recovered samples with the samples in the image.
+    The capture may start anywhere in the image.
+    """
+    captured = samples.values
+
+    start = expected.find(captured[:_RESYNC_WINDOW])
+    if start < 0:
+        raise ValueError("The beginning of the capture isn't in the image")
+
+    def resyncs(captured_index: int, expected_index: int) -> bool:
+        window = captured[captured_index : captured_index + _RESYNC_WINDOW]
+        return expected[expected_index : expected_index + len(window)] == window
+
+    dropped = 0
+    duplicated = 0
+    mismatched = 0
+
+    i = 0
+    j = start
+    while i < len(captured) and j < len(expected):
+        if captured[i] == expected[j]:
+            i += 1
+            j += 1
+            continue
+
+        if j > start and captured[i] == expected[j - 1] and resyncs(i + 1, j):
+            duplicated += 1
+            i += 1
+            continue
+
+        for skip in range(1, _MAX_DROPPED + 1):
+            if resyncs(i, j + skip):
+                dropped += skip
+                j += skip
+                break
+        else:
+            mismatched += 1
+            i += 1
+            j += 1
+
+    jitter = samples.jitter_cycles
+    return Report(
+        samples=i,
+        dropped=dropped,
+        duplicated=duplicated,
+        mismatched=mismatched,
+        period_s=samples.period_cycles / clock_hz,
+        jitter_rms_s=math.sqrt(statistics.fmean(x * x for x in jitter)) / clock_hz,
+        jitter_peak_s=max(abs(x) for x in jitter) / clock_hz,
+    )
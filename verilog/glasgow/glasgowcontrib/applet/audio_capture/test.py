@@ -0,0 +1,172 @@
+import random
+
+from amaranth.sim import SimulatorContext
+from glasgow.applet import (
+    GlasgowAppletV2TestCase,
+    SimulationAssembly,
+    applet_v2_simulation_test,
+    synthesis_test,
+)
+
+from . import CHANNELS, CYCLES_PER_SAMPLE, AudioCaptureApplet
+from .analysis import Capture, compare, recover_samples
+
+# Frames in the test image
+FRAMES = 200
+
+# Pins passed to the simulation tests
+CHIP_PINS = "--clk A0 --rst A1 --play A2"
+
+
+class AudioCaptureAppletTestCase(GlasgowAppletV2TestCase, applet=AudioCaptureApplet):  # type: ignore[misc, call-arg]
+    @synthesis_test  # type: ignore[misc]
+    def test_build(self) -> None:
+        self.assertBuilds()
+
+    def setUp(self) -> None:
+        # Consecutive samples in the left channel are always different,
+        # so that every dropped or duplicated sample can be detected
+        left = [random.randrange(1, 256)]
+        for _ in range(FRAMES - 1):
+            left.append((left[-1] + random.randrange(1, 256)) % 256)
+        right = random.randbytes(FRAMES)
+        self._image = bytes(sample for frame in zip(left, right) for sample in frame)
+
+        # Frames the emulated player skips, or outputs twice
+        self._dropped: set[int] = set()
+        self._duplicated: set[int] = set()
+
+    def _prepare_chip(self, assembly: SimulationAssembly) -> None:
+        # HACK based on CHIP_PINS, and the defaults in
+        # AudioCaptureApplet.add_build_arguments
+        clk_port = assembly.get_pin("A0")
+        rst_port = assembly.get_pin("A1")
+        play_port = assembly.get_pin("A2")
+        uo_ports = [assembly.get_pin(f"B{i}") for i in range(8)]
+
+        async def testbench(ctx: SimulatorContext) -> None:
+            prev_clk = False
+            cycles = 0
+            frame = 0
+            repeated = False
+
+            async for _, _, clk, rst_n, play in ctx.tick().sample(
+                clk_port.o, rst_port.o, play_port.o
+            ):
+                rising = clk and not prev_clk
+                prev_clk = bool(clk)
+
+                if not rst_n:
+                    cycles = 0
+                    frame = 0
+                    repeated = False
+                    for port in uo_ports:
+                        ctx.set(port.i, 0)
+                    continue
+
+                if not (rising and play):
+                    continue
+
+                # Like the player, output the left channel of a frame
+                # every CYCLES_PER_SAMPLE cycles
+                cycles += 1
+                if cycles % CYCLES_PER_SAMPLE:
+                    continue
+
+                while frame in self._dropped:
+                    frame += 1
+                if frame >= FRAMES:
+                    continue
+
+                value = self._image[CHANNELS * frame]
+                for bit, port in enumerate(uo_ports):
+                    ctx.set(port.i, (value >> bit) & 1)
+
+                if frame in self._duplicated and not repeated:
+                    repeated = True
+                else:
+                    frame += 1
+                    repeated = False
+
+        assembly.add_testbench(testbench, background=True)
+
+    async def _capture(self, applet: AudioCaptureApplet) -> tuple[Capture, float]:
+        """
+        Captures all the frames. Returns the capture, and the frequency
+        of the chip clock.
+        """
+        iface = applet.capture_iface
+
+        # Not a whole number of cycles, to exercise the clock generator
+        chip_clock_hz = await iface.set_chip_clock(iface.clock_hz / 4.3)
+        await iface.set_reset(True)
+        await iface.start_capture()
+        await iface.set_reset(False)
+        await iface.set_play(True)
+        capture = await iface.read_capture(
+            (FRAMES + 2) * CYCLES_PER_SAMPLE / chip_clock_hz
+        )
+        await iface.set_play(False)
+
+        return capture, chip_clock_hz
+
+    @applet_v2_simulation_test(prepare=_prepare_chip, args=CHIP_PINS)  # type: ignore[misc]
+    async def test_capture(
+        self, applet: AudioCaptureApplet, ctx: SimulatorContext
+    ) -> None:
+        capture, chip_clock_hz = await self._capture(applet)
+        period_cycles = CYCLES_PER_SAMPLE * capture.clock_hz / chip_clock_hz
+
+        samples = recover_samples(capture, period_cycles)
+        # Everything except the last sample, which is held until the end
+        self.assertEqual(samples.values, self._image[:-CHANNELS:CHANNELS])
+        self.assertAlmostEqual(samples.period_cycles, period_cycles, delta=0.01)
+
+        report = compare(samples, self._image[::CHANNELS], capture.clock_hz)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.samples, FRAMES - 1)
+        # The edges of the chip clock are aligned to the capture clock
+        self.assertLessEqual(report.jitter_peak_s, 1 / capture.clock_hz)
+
+    @applet_v2_simulation_test(prepare=_prepare_chip, args=CHIP_PINS)  # type: ignore[misc]
+    async def test_dropped_and_duplicated(
+        self, applet: AudioCaptureApplet, ctx: SimulatorContext
+    ) -> None:
+        self._dropped.update((50, 120, 121))
+        self._duplicated.add(80)
+
+        capture, _ = await self._capture(applet)
+
+        # Estimate the period from the capture
+        report = compare(
+            recover_samples(capture), self._image[::CHANNELS], capture.clock_hz
+        )
+        self.assertEqual(report.dropped, 3)
+        self.assertEqual(report.duplicated, 1)
+        self.assertEqual(report.mismatched, 0)
+
+    def test_recover_samples(self) -> None:
+        period = 100
+        values = [0, 1, 2, 2, 2, 3, 4, 4, 5, 6]
+        jitter = [random.uniform(-2, 2) for _ in values]
+
+        # uo only changes when the sample does
+        cycles = [0]
+        changes = [0]
+        for index, value in enumerate(values):
+            if value != changes[-1]:
+                cycles.append(round(1000 + index * period + jitter[index]))
+                changes.append(value)
+        capture = Capture(
+            cycles=cycles,
+            values=changes,
+            end_cycle=cycles[-1] + period,
+            clock_hz=1e6,
+        )
+
+        samples = recover_samples(capture)
+
+        # The last sample is left out, since it's not known when it ended
+        self.assertEqual(samples.values, bytes(values[1:-1]))
+        self.assertAlmostEqual(samples.period_cycles, period, delta=1)
+        self.assertTrue(all(abs(x) <= 4 for x in samples.jitter_cycles))
@@ -0,0 +1,91 @@
+import argparse
+import logging
+import os
+import random
+import subprocess
+import sys
+
+from tt10_rtl.spi_flash import FlashParams
+
+# The flash is attached to port A with the pinout of flash-program,
+# and to the chip. The chip must not drive the flash while it's being
+# programmed, so hold it in reset until the capture starts.
+# uo[7:0] of the chip is attached to port B, its clock and rst_n
+# to the pins below, and ui[0] is tied high.
+VOLTAGE = "3.3"
+CLK_PIN = "A6"
+RST_PIN = "A7"
+
+SAMPLE_RATE_HZ = 44100
+CHANNELS = 2
+# Computed the same way as in the applet
+CYCLES_PER_SAMPLE = FlashParams().cycles_per_byte * CHANNELS
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+
+    args = _parse_command_line()
+
+    image = random.randbytes(args.size)
+    # Leave some of the image after the end of the capture
+    duration_s = 0.9 * len(image) / CHANNELS / SAMPLE_RATE_HZ
+
+    env = {
+        **os.environ,
+        "GLASGOW_OUT_OF_TREE_APPLETS": "I-am-okay-with-breaking-changes",
+    }
+
+    logging.info("Loading a 0x%X byte image", len(image))
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "glasgow.cli",
+            "run",
+            "flash-program",
+            f"--voltage={VOLTAGE}",
+            "load",
+            "--address=0",
+            "-",
+        ],
+        check=True,
+        capture_output=True,
+        input=image,
+        env=env,
+    )
+
+    logging.info("Capturing %.2f seconds of audio", duration_s)
+    # The applet checks the capture, and fails if it doesn't match
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "glasgow.cli",
+            "run",
+            "audio-capture",
+            f"--voltage={VOLTAGE}",
+            f"--clk={CLK_PIN}",
+            f"--rst={RST_PIN}",
+            f"--duration={duration_s}",
+            f"--clock-hz={SAMPLE_RATE_HZ * CYCLES_PER_SAMPLE}",
+            "--image=-",
+        ],
+        check=True,
+        input=image,
+        env=env,
+    )
+
+    logging.info("Capture matches the image")
+
+
+def _parse_command_line() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--size", type=lambda s: int(s, 0), default=0x10000)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
+import dataclasses
 import logging
 from argparse import ArgumentParser, FileType, Namespace
 from typing import Any
 
-from amaranth import Module, unsigned
+from amaranth import Assert, Module, Signal, unsigned
+from amaranth.lib import stream, wiring
+from amaranth.lib.crc import catalog
+from amaranth.lib.fifo import SyncFIFOBuffered
 from amaranth.lib.io import Buffer, Direction, PortLike
 from amaranth.lib.memory import Memory
 from amaranth.lib.wiring import Component, In, Out
@@ -15,8 +19,24 @@ from glasgow.applet import (
     GlasgowPin,
     SimulationAssembly,
 )
-
-from .spi_flash import FlashParams, SPIFlash
+from tt10_rtl.perf_counters import PERF_COUNTER_WIDTH_BITS, PERF_COUNTERS
+from tt10_rtl.spi_flash import FlashParams, SPIFlash
+
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# NOTE: Keep in sync with the read commands listed in FlashParams
+_READ_COMMANDS = {
+    "0x03": FlashParams(),
+    "0x3B": FlashParams(read_command=0x3B, data_io_width=2, read_dummy_cycles=8),
+    "0x6B": FlashParams(read_command=0x6B, data_io_width=4, read_dummy_cycles=8),
+    "0xEB": FlashParams(
+        read_command=0xEB,
+        address_io_width=4,
+        data_io_width=4,
+        read_mode_bits=8,
+        read_dummy_cycles=4,
+    ),
+}
 
 
 class FlashComponent(Component):  # type: ignore[misc]
@@ -26,24 +46,46 @@ class FlashComponent(Component):  # type: ignore[misc]
         cs: PortLike,
         io: PortLike,
         buffer_size: int = 8,
+        stream_fifo_depth: int = 512,
         flash_params: FlashParams = FlashParams(),
     ) -> None:
         super().__init__(
             {
+                # Debug interface: reads buffer_size bytes into a memory,
+                # which is then pushed into o_stream. The memory can also be
+                # read over registers.
                 "i_read": In(1),
                 "i_address": In(unsigned(flash_params.address_width_bits)),
                 "o_read_done": Out(1, init=0),
                 "i_mem_addr": In(range(buffer_size)),
                 "o_mem": Out(unsigned(8)),
+                # Streaming interface: reads i_stream_size bytes into o_stream
+                "i_stream": In(1),
+                "i_stream_address": In(unsigned(flash_params.address_width_bits)),
+                "i_stream_size": In(unsigned(flash_params.address_width_bits + 1)),
+                "o_stream": Out(stream.Signature(unsigned(8))),
+                # Checksum interface: reads i_stream_size bytes from
+                # i_stream_address, and pushes only their CRC-32 into o_stream,
+                # least significant byte first. This is the CRC used by zlib.
+                "i_checksum": In(1),
+                "i_perf_clear": In(1),
+                **{
+                    f"o_perf_{name}": Out(unsigned(PERF_COUNTER_WIDTH_BITS))
+                    for name in PERF_COUNTERS
+                },
             }
         )
 
         assert buffer_size > 0
+        # We stop reading when the FIFO is almost full,
+        # and resume when it's half empty.
+        assert stream_fifo_depth >= 4
 
         self._sclk = sclk
         self._cs = cs
         self._io = io
         self._buffer_size = buffer_size
+        self._stream_fifo_depth = stream_fifo_depth
         self._flash_params = flash_params
 
     @property
@@ -63,14 +105,24 @@ class FlashComponent(Component):  # type: ignore[misc]
             init=b"",
         )
 
-        # Expose the memory read port over I2C
+        # Expose the memory read port over I2C.
+        # The FSM below also uses it to push the memory into o_stream.
         rd_port = memory.read_port(domain="comb")
         m.d.comb += [
             rd_port.addr.eq(self.i_mem_addr),
             self.o_mem.eq(rd_port.data),
         ]
+        dump_addr = Signal.like(rd_port.addr)
 
-        m.submodules.controller = controller = SPIFlash(self._flash_params)
+        m.submodules.controller = controller = SPIFlash(
+            self._flash_params, perf_counters=True
+        )
+
+        m.d.comb += controller.i_perf_clear.eq(self.i_perf_clear)
+        for name in PERF_COUNTERS:
+            m.d.comb += getattr(self, f"o_perf_{name}").eq(
+                getattr(controller, f"o_perf_{name}")
+            )
 
         m.submodules.sclk_buffer = sclk_buffer = Buffer(Direction.Output, self._sclk)
         m.d.comb += sclk_buffer.o.eq(controller.o_sclk)
@@ -78,12 +130,16 @@ class FlashComponent(Component):  # type: ignore[misc]
         m.submodules.cs_buffer = cs_buffer = Buffer(Direction.Output, self._cs)
         m.d.comb += cs_buffer.o.eq(controller.o_cs_n)
 
-        m.submodules.copi_buffer = copi_buffer = Buffer(Direction.Output, self._io[0])
-        m.submodules.cipo_buffer = cipo_buffer = Buffer(Direction.Input, self._io[1])
-        m.d.comb += [
-            copi_buffer.o.eq(controller.o_copi),
-            controller.i_cipo.eq(cipo_buffer.i),
-        ]
+        # The lines change direction independently, so each gets its own buffer
+        for i in range(len(self._io)):
+            m.submodules[f"io{i}_buffer"] = io_buffer = Buffer(
+                Direction.Bidir, self._io[i]
+            )
+            m.d.comb += [
+                io_buffer.o.eq(controller.o_io[i]),
+                io_buffer.oe.eq(controller.o_oe[i]),
+                controller.i_io[i].eq(io_buffer.i),
+            ]
 
         wr_port = memory.write_port(domain="sync")
         m.d.comb += [
@@ -92,6 +148,22 @@ class FlashComponent(Component):  # type: ignore[misc]
             # The address will be set by the FSM below
         ]
 
+        m.submodules.stream_fifo = stream_fifo = SyncFIFOBuffered(
+            width=8, depth=self._stream_fifo_depth
+        )
+        wiring.connect(m, stream_fifo.r_stream, wiring.flipped(self.o_stream))
+        m.d.comb += stream_fifo.w_data.eq(controller.o_data)
+
+        stream_address = Signal.like(self.i_stream_address)
+        stream_remaining = Signal.like(self.i_stream_size)
+
+        # The bytes of a checksum read go into the CRC engine instead of
+        # the FIFO, and only the result is pushed into the FIFO.
+        m.submodules.crc = crc = catalog.CRC32_ISO_HDLC(data_width=8).create()
+        m.d.comb += crc.data.eq(controller.o_data)
+        checksum = Signal()
+        checksum_index = Signal(range(len(crc.crc) // 8))
+
         assert controller.i_read.init == 0
 
         with m.FSM():
@@ -103,23 +175,104 @@ class FlashComponent(Component):  # type: ignore[misc]
                         wr_port.addr.eq(0),
                     ]
                     m.next = "Transfer"
+                with m.Elif(
+                    (self.i_stream | self.i_checksum) & (self.i_stream_size != 0)
+                ):
+                    m.d.comb += crc.start.eq(1)
+                    m.d.sync += [
+                        checksum.eq(self.i_checksum),
+                        checksum_index.eq(0),
+                        controller.i_read.eq(1),
+                        controller.i_address.eq(self.i_stream_address),
+                        stream_address.eq(self.i_stream_address),
+                        stream_remaining.eq(self.i_stream_size),
+                    ]
+                    m.next = "Stream"
 
             with m.State("Transfer"):
                 with m.If(controller.o_data_valid):
                     with m.If(wr_port.addr == self.buffer_size - 1):
                         m.d.sync += [
                             controller.i_read.eq(0),
-                            self.o_read_done.eq(1),
+                            dump_addr.eq(0),
                         ]
-                        m.next = "Transfer done"
+                        m.next = "Dump"
                     with m.Else():
                         m.d.sync += wr_port.addr.eq(wr_port.addr + 1)
 
+            with m.State("Dump"):
+                # Send the whole memory in one go, so that the host doesn't
+                # have to read it byte-by-byte, or poll for completion.
+                m.d.comb += [
+                    rd_port.addr.eq(dump_addr),
+                    stream_fifo.w_data.eq(rd_port.data),
+                    stream_fifo.w_en.eq(1),
+                ]
+                with m.If(stream_fifo.w_rdy):
+                    with m.If(dump_addr == self.buffer_size - 1):
+                        m.d.sync += self.o_read_done.eq(1)
+                        m.next = "Transfer done"
+                    with m.Else():
+                        m.d.sync += dump_addr.eq(dump_addr + 1)
+
             with m.State("Transfer done"):
                 with m.If(~self.i_read):
                     m.d.sync += self.o_read_done.eq(0)
                     m.next = "Idle"
 
+            with m.State("Stream"):
+                with m.If(controller.o_data_valid):
+                    with m.If(checksum):
+                        m.d.comb += crc.valid.eq(1)
+                    with m.Else():
+                        m.d.comb += stream_fifo.w_en.eq(1)
+                        m.d.sync += Assert(stream_fifo.w_rdy)
+                    m.d.sync += [
+                        stream_address.eq(stream_address + 1),
+                        stream_remaining.eq(stream_remaining - 1),
+                    ]
+                    with m.If((stream_remaining == 1) & checksum):
+                        m.d.sync += controller.i_read.eq(0)
+                        m.next = "Checksum dump"
+                    with m.Elif(stream_remaining == 1):
+                        m.d.sync += controller.i_read.eq(0)
+                        m.next = "Stream done"
+                    with m.Elif(
+                        ~checksum & (stream_fifo.w_level >= self._stream_fifo_depth - 2)
+                    ):
+                        # The controller can't pause in the middle of a read,
+                        # so end this one before the FIFO overflows.
+                        m.d.sync += controller.i_read.eq(0)
+                        m.next = "Stream wait"
+
+            with m.State("Stream wait"):
+                m.d.sync += Assert(~controller.o_data_valid)
+                with m.If(
+                    controller.o_cs_n
+                    & (stream_fifo.w_level <= self._stream_fifo_depth // 2)
+                ):
+                    m.d.sync += [
+                        controller.i_read.eq(1),
+                        controller.i_address.eq(stream_address),
+                    ]
+                    m.next = "Stream"
+
+            with m.State("Checksum dump"):
+                # The CRC engine has the result a cycle after the last byte
+                m.d.comb += [
+                    stream_fifo.w_data.eq(crc.crc.word_select(checksum_index, 8)),
+                    stream_fifo.w_en.eq(1),
+                ]
+                with m.If(stream_fifo.w_rdy):
+                    with m.If(checksum_index == len(crc.crc) // 8 - 1):
+                        m.next = "Stream done"
+                    with m.Else():
+                        m.d.sync += checksum_index.eq(checksum_index + 1)
+
+            with m.State("Stream done"):
+                with m.If(~self.i_stream & ~self.i_checksum):
+                    m.next = "Idle"
+
         return m
 
 
@@ -131,6 +284,7 @@ class FlashInterface:
         sclk: GlasgowPin,
         cs: GlasgowPin,
         io: tuple[GlasgowPin, ...],
+        flash_params: FlashParams = FlashParams(),
     ) -> None:
         self._logger = logger
 
@@ -149,7 +303,9 @@ class FlashInterface:
         io_port = assembly.add_port(io, "io")
 
         self._component = assembly.add_submodule(
-            FlashComponent(sclk=sclk_port, cs=cs_port, io=io_port)
+            FlashComponent(
+                sclk=sclk_port, cs=cs_port, io=io_port, flash_params=flash_params
+            )
         )
 
         self._read_reg = assembly.add_rw_register(self._component.i_read)
@@ -159,6 +315,20 @@ class FlashInterface:
         self._mem_addr_reg = assembly.add_rw_register(self._component.i_mem_addr)
         self._mem_reg = assembly.add_ro_register(self._component.o_mem)
 
+        self._stream_reg = assembly.add_rw_register(self._component.i_stream)
+        self._stream_addr_reg = assembly.add_rw_register(
+            self._component.i_stream_address
+        )
+        self._stream_size_reg = assembly.add_rw_register(self._component.i_stream_size)
+        self._checksum_reg = assembly.add_rw_register(self._component.i_checksum)
+        self._pipe = assembly.add_in_pipe(self._component.o_stream)
+
+        self._perf_clear_reg = assembly.add_rw_register(self._component.i_perf_clear)
+        self._perf_regs = {
+            name: assembly.add_ro_register(getattr(self._component, f"o_perf_{name}"))
+            for name in PERF_COUNTERS
+        }
+
         self._assembly = assembly
 
     async def read(self, address: int, size: int = -1) -> bytes:
@@ -168,9 +338,10 @@ class FlashInterface:
         await self._addr_reg.set(address)
         await self._read_reg.set(True)
 
-        while not (await self._read_done_reg.get()):
-            if isinstance(self._assembly, SimulationAssembly):
-                await self._assembly._context.tick()
+        # The component pushes the whole buffer into the pipe when the read
+        # is done, so there's no need to poll for completion.
+        result = await self._pipe.recv(self._component.buffer_size)
+
         await self._read_reg.set(False)
         for _ in range(5):
             if not (await self._read_done_reg.get()):
@@ -183,14 +354,70 @@ class FlashInterface:
         if size < 0 or size > self._component.buffer_size:
             size = self._component.buffer_size
 
-        result = bytearray(size)
+        return bytes(result[:size])
+
+    async def peek(self, index: int) -> int:
+        """
+        Returns a byte from the buffer of the last read, over the register
+        interface. For debugging.
+        """
+        await self._mem_addr_reg.set(index)
+        return int(await self._mem_reg.get())
+
+    @property
+    def max_stream_size(self) -> int:
+        return int(1 << self._component.flash_params.address_width_bits)
+
+    async def read_stream(self, address: int, size: int) -> bytes:
+        assert 0 < size <= self.max_stream_size
+        assert not (await self._stream_reg.get())
 
-        for i in range(size):
-            await self._mem_addr_reg.set(i)
-            result[i] = await self._mem_reg.get()
+        await self._stream_addr_reg.set(address)
+        await self._stream_size_reg.set(size)
+        await self._stream_reg.set(True)
+
+        result = await self._pipe.recv(size)
+
+        # All the data has been pushed, so the component is waiting for us
+        # to deassert i_stream.
+        await self._stream_reg.set(False)
 
         return bytes(result)
 
+    async def crc32(self, address: int, size: int) -> int:
+        """
+        Returns the CRC-32 of the given range, as computed by zlib.crc32.
+        The data is read on the device, so only the result is transferred.
+        """
+        assert 0 < size <= self.max_stream_size
+        assert not (await self._checksum_reg.get())
+
+        await self._stream_addr_reg.set(address)
+        await self._stream_size_reg.set(size)
+        await self._checksum_reg.set(True)
+
+        result = await self._pipe.recv(4)
+
+        await self._checksum_reg.set(False)
+
+        return int.from_bytes(result, "little")
+
+    async def clear_perf_counters(self) -> None:
+        await self._perf_clear_reg.set(True)
+        if isinstance(self._assembly, SimulationAssembly):
+            await self._assembly._context.tick()
+        await self._perf_clear_reg.set(False)
+
+    async def get_perf_counters(self) -> dict[str, int]:
+        return {name: await reg.get() for name, reg in self._perf_regs.items()}
+
+
+def _flash_params(args: Namespace) -> FlashParams:
+    params = _READ_COMMANDS[args.read_command]
+    if args.address_width == 32:
+        params = params.with_four_byte_address()
+    return dataclasses.replace(params, full_rate_sclk=args.full_rate_sclk)
+
 
 class FlashApplet(GlasgowAppletV2):  # type: ignore[misc]
     logger = logging.getLogger(__name__)
@@ -213,12 +440,40 @@ class FlashApplet(GlasgowAppletV2):  # type: ignore[misc]
             help="bind the applet I/O lines 'copi', 'cipo', 'wp', 'hold' to PINS",
         )
         access.add_pins_argument(parser, "sclk", required=True, default="A1")
+        parser.add_argument(
+            "--read-command",
+            choices=_READ_COMMANDS.keys(),
+            default="0x03",
+            help=(
+                "read with READ (0x03), FAST READ DUAL OUTPUT (0x3B), "
+                "FAST READ QUAD OUTPUT (0x6B), or FAST READ QUAD I/O (0xEB). "
+                "The quad commands require the QE bit to be set in the flash"
+            ),
+        )
+        parser.add_argument(
+            "--full-rate-sclk",
+            action="store_true",
+            help="toggle SCLK at the system clock frequency, instead of half of it",
+        )
+        parser.add_argument(
+            "--address-width",
+            type=int,
+            choices=(24, 32),
+            default=24,
+            help="address width in bits. 32 bits use the 4-byte variant of the read "
+            "command, for flashes larger than 16 MiB",
+        )
 
     def build(self, args: Namespace) -> None:
         with self.assembly.add_applet(self):
             self.assembly.use_voltage(args.voltage)
             self.flash_iface = FlashInterface(
-                self.logger, self.assembly, sclk=args.sclk, cs=args.cs, io=args.io
+                self.logger,
+                self.assembly,
+                sclk=args.sclk,
+                cs=args.cs,
+                io=args.io,
+                flash_params=_flash_params(args),
             )
 
     @classmethod
@@ -232,16 +487,50 @@ class FlashApplet(GlasgowAppletV2):  # type: ignore[misc]
         )
         parser.add_argument("--address", type=lambda s: int(s, 0), default=0)
         parser.add_argument("--size", type=lambda s: int(s, 0))
+        parser.add_argument(
+            "--registers",
+            action="store_true",
+            help="read through the debug buffer, one buffer at a time",
+        )
+        parser.add_argument(
+            "--crc32",
+            action="store_true",
+            help="compute the CRC-32 of the data on the device, "
+            "and output it in hex instead of the data",
+        )
+        parser.add_argument(
+            "--perf-counters",
+            action="store_true",
+            help="log the performance counters of the flash controller",
+        )
 
     async def run(self, args: Namespace) -> None:
-        remaining = args.size if args.size else self.flash_iface._component.buffer_size
+        if args.perf_counters:
+            await self.flash_iface.clear_perf_counters()
+
+        size = args.size if args.size else self.flash_iface._component.buffer_size
+        remaining = size
         addr = args.address
-        while remaining:
-            data = await self.flash_iface.read(addr, remaining)
-            args.output.write(data)
-            remaining -= len(data)
-            addr += len(data)
-            self.logger.info("Read %d/%d bytes", args.size - remaining, args.size)
+        if args.crc32:
+            crc = await self.flash_iface.crc32(addr, size)
+            args.output.write(f"{crc:08x}\n".encode())
+        else:
+            while remaining:
+                if args.registers:
+                    data = await self.flash_iface.read(addr, remaining)
+                else:
+                    # Read in chunks, to report progress
+                    data = await self.flash_iface.read_stream(
+                        addr, min(remaining, _STREAM_CHUNK_SIZE)
+                    )
+                args.output.write(data)
+                remaining -= len(data)
+                addr += len(data)
+                self.logger.info("Read %d/%d bytes", size - remaining, size)
+
+        if args.perf_counters:
+            for name, value in (await self.flash_iface.get_perf_counters()).items():
+                self.logger.info("%s: %d", name, value)
 
     @classmethod
     def tests(cls) -> type[GlasgowAppletV2TestCase]:
@@ -1 +0,0 @@
-../../../../rtl/spi_flash.py
\ No newline at end of file
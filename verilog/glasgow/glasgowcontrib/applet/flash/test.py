@@ -1,9 +1,11 @@
 import itertools
 import random
-from enum import Enum, auto
-from typing import assert_never
+import zlib
 
+from amaranth import Cat
 from amaranth.sim import SimulatorContext
+from flash_model import SPIFlashEngine
+from flash_model.amaranth import AmaranthFlash
 from glasgow.applet import (
     GlasgowAppletV2TestCase,
     SimulationAssembly,
@@ -14,13 +16,6 @@ from glasgow.applet import (
 from . import FlashApplet, FlashComponent
 
 
-class State(Enum):
-    IDLE = auto()
-    READ_COMMAND = auto()
-    READ_ADDRESS = auto()
-    SEND_DATA = auto()
-
-
 class FlashAppletTestCase(GlasgowAppletV2TestCase, applet=FlashApplet):  # type: ignore[misc, call-arg]
     @synthesis_test  # type: ignore[misc]
     def test_build(self) -> None:
@@ -33,8 +28,7 @@ class FlashAppletTestCase(GlasgowAppletV2TestCase, applet=FlashApplet):  # type:
         # HACK based on the defaults in FlashApplet.add_build_arguments
         sclk_port = assembly.get_pin("A1")
         cs_port = assembly.get_pin("A5")
-        copi_port = assembly.get_pin("A2")
-        cipo_port = assembly.get_pin("A4")
+        io_ports = [assembly.get_pin(pin) for pin in ("A2", "A4", "A3", "A0")]
 
         # Find the single module that is our QSPI applet
         (component,) = (
@@ -42,84 +36,33 @@ class FlashAppletTestCase(GlasgowAppletV2TestCase, applet=FlashApplet):  # type:
             for module, _ in assembly._modules
             if isinstance(module, FlashComponent)
         )
-
-        async def testbench(ctx: SimulatorContext) -> None:
-            state = State.IDLE
-
-            prev_sclk = bool(ctx.get(sclk_port.o))
-
-            async for _, _, sclk, cs, copi in ctx.tick().sample(
-                sclk_port.o, cs_port.o, copi_port.o
-            ):
-                sclk = bool(sclk)
-                rising = sclk and not prev_sclk
-                falling = not sclk and prev_sclk
-                prev_sclk = sclk
-
-                # Chip-select is active-low
-                if cs:
-                    state = State.IDLE
-                    continue
-
-                match state:
-                    case State.IDLE:
-                        command = 0
-                        command_bits = 0
-                        address = 0
-                        address_bits = 0
-                        current_bit = 7
-
-                        if rising:
-                            command <<= 1
-                            command |= int(copi)
-                            command_bits += 1
-                            state = State.READ_COMMAND
-
-                    case State.READ_COMMAND:
-                        if rising:
-                            command <<= 1
-                            command |= int(copi)
-                            command_bits += 1
-
-                            if (
-                                command_bits
-                                == component.flash_params.command_width_bits
-                            ):
-                                self.assertEqual(
-                                    command, component.flash_params.read_command
-                                )
-                                state = State.READ_ADDRESS
-
-                    case State.READ_ADDRESS:
-                        if rising:
-                            address <<= 1
-                            address |= int(copi)
-                            address_bits += 1
-
-                            if (
-                                address_bits
-                                == component.flash_params.address_width_bits
-                            ):
-                                address %= len(self._payload)
-                                state = State.SEND_DATA
-
-                    case State.SEND_DATA:
-                        # Shift data out on the falling edge of the clock,
-                        # so that it's available on the rising edge (CPHA=1)
-                        if falling:
-                            ctx.set(
-                                cipo_port.i,
-                                (self._payload[address] >> current_bit) & 1,
-                            )
-                            current_bit -= 1
-                            if current_bit == -1:
-                                address = (address + 1) % len(self._payload)
-                                current_bit = 7
-
-                    case _:
-                        assert_never(state)
-
-        assembly.add_testbench(testbench, background=True)
+        params = component.flash_params
+
+        if params.data_io_width == 1:
+            # COPI and CIPO
+            out = io_ports[0].o
+            in_ = io_ports[1].i
+        else:
+            out = Cat(port.o for port in io_ports[: params.data_io_width])
+            in_ = Cat(port.i for port in io_ports[: params.data_io_width])
+
+        flash = AmaranthFlash(
+            SPIFlashEngine(
+                self._payload,
+                command_width_bits=params.command_width_bits,
+                address_width_bits=params.address_width_bits,
+                read_command=params.read_command,
+                address_io_width=params.address_io_width,
+                data_io_width=params.data_io_width,
+                read_mode_bits=params.read_mode_bits,
+                read_dummy_cycles=params.read_dummy_cycles,
+            ),
+            cs_n=cs_port.o,
+            sclk=sclk_port.o,
+            out=out,
+            in_=in_,
+        )
+        assembly.add_testbench(flash.run, background=True)
 
     @applet_v2_simulation_test(prepare=_prepare_read)  # type: ignore[misc]
     async def test_read(self, applet: FlashApplet, ctx: SimulatorContext) -> None:
@@ -134,6 +77,66 @@ class FlashAppletTestCase(GlasgowAppletV2TestCase, applet=FlashApplet):  # type:
             )
         )
 
-        for _ in range(random.randrange(1, 6)):
+        reads = random.randrange(1, 6)
+        for _ in range(reads):
             result = await applet.flash_iface.read(address)
             self.assertEqual(result, expected)
+
+        # The buffer is still accessible over registers
+        index = random.randrange(component.buffer_size)
+        self.assertEqual(await applet.flash_iface.peek(index), expected[index])
+
+        perf_counters = await applet.flash_iface.get_perf_counters()
+        self.assertEqual(perf_counters["reads"], reads)
+        self.assertEqual(
+            perf_counters["first_byte_cycles"],
+            component.flash_params.cycles_until_first_read_byte,
+        )
+        self.assertEqual(perf_counters["bytes"], reads * component.buffer_size)
+
+        await applet.flash_iface.clear_perf_counters()
+        perf_counters = await applet.flash_iface.get_perf_counters()
+        self.assertEqual(perf_counters["reads"], 0)
+        self.assertEqual(perf_counters["bytes"], 0)
+
+    @applet_v2_simulation_test(prepare=_prepare_read)  # type: ignore[misc]
+    async def test_read_stream(
+        self, applet: FlashApplet, ctx: SimulatorContext
+    ) -> None:
+        component = applet.flash_iface._component
+        assert isinstance(component, FlashComponent)
+
+        for _ in range(random.randrange(1, 4)):
+            address = random.randrange(1 << component.flash_params.address_width_bits)
+            size = random.randrange(1, 2 * len(self._payload))
+
+            expected = bytes(
+                itertools.islice(
+                    itertools.cycle(self._payload), address, address + size
+                )
+            )
+
+            result = await applet.flash_iface.read_stream(address, size)
+            self.assertEqual(result, expected)
+
+    @applet_v2_simulation_test(prepare=_prepare_read)  # type: ignore[misc]
+    async def test_crc32(self, applet: FlashApplet, ctx: SimulatorContext) -> None:
+        component = applet.flash_iface._component
+        assert isinstance(component, FlashComponent)
+
+        for _ in range(random.randrange(1, 4)):
+            address = random.randrange(1 << component.flash_params.address_width_bits)
+            size = random.randrange(1, 2 * len(self._payload))
+
+            expected = bytes(
+                itertools.islice(
+                    itertools.cycle(self._payload), address, address + size
+                )
+            )
+
+            crc = await applet.flash_iface.crc32(address, size)
+            self.assertEqual(crc, zlib.crc32(expected))
+
+            # Only the checksum was pushed into the stream
+            result = await applet.flash_iface.read_stream(address, size)
+            self.assertEqual(result, expected)
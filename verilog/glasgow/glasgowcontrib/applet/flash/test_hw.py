@@ -4,10 +4,10 @@ import os
 import random
 import subprocess
 import sys
+import zlib
 
 # From the IS25WP128 datasheet
 # https://www.mouser.com/datasheet/2/198/IS25WP032_064_128-737458.pdf
-PAGE_SIZE = 256
 VOLTAGE = "1.8"
 FLASH_SIZE_BITS = 128 * 1024 * 1024
 FLASH_SIZE_BYTES = FLASH_SIZE_BITS // 8
@@ -37,60 +37,34 @@ def main() -> None:
         raise RuntimeError(f"Expected only 1 device, but got: {devices}")
     logging.info("Found device %s", devices[0])
 
-    logging.info("Erasing flash")
+    logging.info("Loading 0x%X bytes to address 0x%X", len(payload), address)
     subprocess.run(
         [
             sys.executable,
             "-m",
             "glasgow.cli",
             "run",
-            "memory-25x",
+            "flash-program",
             f"--voltage={VOLTAGE}",
-            "erase-chip",
-        ],
-        check=True,
-        capture_output=True,
-    )
-
-    logging.info("Writing 0x%X bytes to address 0x%X", len(payload), address)
-    subprocess.run(
-        [
-            sys.executable,
-            "-m",
-            "glasgow.cli",
-            "run",
-            "memory-25x",
-            f"--voltage={VOLTAGE}",
-            "program",
-            f"--page-size={PAGE_SIZE}",
-            "--file=-",
-            hex(address),
-        ],
-        check=True,
-        capture_output=True,
-        input=payload,
-    )
-
-    logging.info("Verifying written data")
-    subprocess.run(
-        [
-            sys.executable,
-            "-m",
-            "glasgow.cli",
-            "run",
-            "memory-25x",
-            f"--voltage={VOLTAGE}",
-            "verify",
-            "--file=-",
-            hex(address),
+            f"--address-width={args.address_width}",
+            "load",
+            f"--address=0x{address:X}",
+            "-",
         ],
         check=True,
         capture_output=True,
         input=payload,
+        env={
+            **os.environ,
+            "GLASGOW_OUT_OF_TREE_APPLETS": "I-am-okay-with-breaking-changes",
+        },
     )
 
-    logging.info("Reading data using *our* code")
-    readback = subprocess.run(
+    if args.readback:
+        logging.info("Reading data using *our* code")
+    else:
+        logging.info("Computing the CRC-32 of the data using *our* code")
+    output = subprocess.run(
         [
             sys.executable,
             "-m",
@@ -98,6 +72,10 @@ def main() -> None:
             "run",
             "flash",
             f"--voltage={VOLTAGE}",
+            f"--read-command={args.read_command}",
+            f"--address-width={args.address_width}",
+            *(["--full-rate-sclk"] if args.full_rate_sclk else []),
+            *([] if args.readback else ["--crc32"]),
             "--output=-",
             f"--address=0x{address:X}",
             f"--size=0x{len(payload):X}",
@@ -110,7 +88,11 @@ def main() -> None:
         },
     ).stdout
 
-    if readback != payload:
+    if args.readback:
+        verified = output == payload
+    else:
+        verified = int(output, 16) == zlib.crc32(payload)
+    if not verified:
         raise RuntimeError("Verification failed")
 
     logging.info("Verification succeeded")
@@ -120,6 +102,28 @@ def _parse_command_line() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--size", type=lambda s: int(s, 0), default=0x1000)
+    parser.add_argument(
+        "--read-command",
+        default="0x03",
+        help="read command to use, see the flash applet",
+    )
+    parser.add_argument(
+        "--full-rate-sclk",
+        action="store_true",
+        help="read with SCLK at the system clock frequency",
+    )
+    parser.add_argument(
+        "--address-width",
+        type=int,
+        choices=(24, 32),
+        default=24,
+        help="program and read using 4-byte address commands if 32",
+    )
+    parser.add_argument(
+        "--readback",
+        action="store_true",
+        help="verify by reading the data back, instead of by its CRC-32",
+    )
 
     return parser.parse_args()
 
@@ -1 +0,0 @@
-../../../../rtl/qspi_flash_dtr.py
\ No newline at end of file
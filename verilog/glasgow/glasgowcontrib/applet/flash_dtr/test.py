@@ -1,11 +1,12 @@
 import itertools
 import operator
 import random
-from enum import Enum, auto
+import zlib
 from functools import reduce
-from typing import assert_never
 
 from amaranth.sim import SimulatorContext
+from flash_model import QSPIFlashDTREngine
+from flash_model.amaranth import AmaranthFlash
 from glasgow.applet import (
     GlasgowAppletV2TestCase,
     SimulationAssembly,
@@ -16,16 +17,6 @@ from glasgow.applet import (
 from . import FlashDTRApplet, FlashDTRComponent
 
 
-class State(Enum):
-    IDLE = auto()
-    READ_COMMAND = auto()
-    READ_ADDRESS = auto()
-    READ_MODE = auto()
-    DUMMY = auto()
-    SEND_DATA = auto()
-    UNREACHABLE = auto()
-
-
 class FlashDTRAppletTestCase(GlasgowAppletV2TestCase, applet=FlashDTRApplet):  # type: ignore[misc, call-arg]
     @synthesis_test  # type: ignore[misc]
     def test_build(self) -> None:
@@ -47,133 +38,18 @@ class FlashDTRAppletTestCase(GlasgowAppletV2TestCase, applet=FlashDTRApplet):  #
             if isinstance(module, FlashDTRComponent)
         )
 
-        async def testbench(ctx: SimulatorContext) -> None:
-            state = State.IDLE
-
-            prev_sclk = False
-
-            command = 0
-            command_bits = 0
-            address = 0
-            address_bits = 0
-            dummy_cycles = 0
-            rst_start = False
-
-            async for _, _, sclk_value, cs_value, data_o, data_oe in ctx.tick().sample(
-                sclk.o, cs.o, io.o, io.oe
-            ):
-                sclk_value = bool(sclk_value)
-                rising = sclk_value and not prev_sclk
-                falling = not sclk_value and prev_sclk
-                prev_sclk = sclk_value
-
-                # Chip-select is active-low
-                if cs_value:
-                    state = State.IDLE
-                    continue
-
-                match state:
-                    case State.IDLE:
-                        command = 0
-                        command_bits = 0
-                        address = 0
-                        address_bits = 0
-                        dummy_cycles = 0
-
-                        if rising:
-                            self.assertEqual(data_oe & 1, 1)
-                            command <<= 1
-                            command |= int(data_o & 1)
-                            command_bits += 1
-                            state = State.READ_COMMAND
-
-                    case State.READ_COMMAND:
-                        if rising:
-                            self.assertEqual(data_oe & 1, 1)
-                            command <<= 1
-                            command |= int(data_o & 1)
-                            command_bits += 1
-
-                        if falling:
-                            if (
-                                command_bits
-                                == component.flash_params.command_width_bits
-                            ):
-                                match command:
-                                    case component.flash_params.rsten_command:
-                                        self.assertFalse(rst_start)
-                                        rst_start = True
-                                        # Immediately after this the chip-select
-                                        # must be deasserted.
-                                        state = State.UNREACHABLE
-                                    case component.flash_params.rst_command:
-                                        self.assertTrue(rst_start)
-                                        rst_start = False
-                                        state = State.UNREACHABLE
-                                    case component.flash_params.read_command:
-                                        self.assertFalse(rst_start)
-                                        # The next trigger will be on the rising edge,
-                                        # when the first bits of the address will be
-                                        # sent.
-                                        state = State.READ_ADDRESS
-                                    case _:
-                                        self.fail(f"Unexpected command 0x{command:X}")
-
-                    case State.READ_ADDRESS:
-                        if rising or falling:
-                            self.assertEqual(data_oe & 0xF, 0xF)
-                            address <<= 4
-                            address |= int(data_o & 0xF)
-                            address_bits += 4
-
-                            if (
-                                address_bits
-                                == component.flash_params.address_width_bits
-                            ):
-                                address %= len(self._payload)
-                                state = State.READ_MODE
-
-                    case State.READ_MODE:
-                        if rising or falling:
-                            self.assertEqual(data_oe & 0xF, 0xF)
-                            self.assertEqual(data_o & 0xF, 0)
-
-                        # The are 8 mode bits. We entered this state on
-                        # the rising edge, so we're leaving on the next
-                        # falling edge.
-                        if falling:
-                            state = State.DUMMY
-
-                    case State.DUMMY:
-                        if rising:
-                            self.assertEqual(data_oe & 0xF, 0)
-                            dummy_cycles += 1
-
-                        if falling:
-                            if (
-                                dummy_cycles
-                                # The first dummy cycle is for the mode bits
-                                == component.flash_params.read_dummy_cycles - 1
-                            ):
-                                self.assertEqual(data_oe & 0xF, 0)
-                                ctx.set(io.i, self._payload[address] >> 4)
-                                state = State.SEND_DATA
-
-                    case State.SEND_DATA:
-                        self.assertEqual(data_oe & 0xF, 0)
-                        if rising:
-                            ctx.set(io.i, self._payload[address] & 0xF)
-                            address = (address + 1) % len(self._payload)
-                        if falling:
-                            ctx.set(io.i, self._payload[address] >> 4)
-
-                    case State.UNREACHABLE:
-                        self.fail("Unreachable state reached")
-
-                    case _:
-                        assert_never(state)
-
-        assembly.add_testbench(testbench, background=True)
+        params = component.flash_params
+        self._flash = QSPIFlashDTREngine(
+            self._payload,
+            command_width_bits=params.command_width_bits,
+            address_width_bits=params.address_width_bits,
+            rsten_command=params.rsten_command,
+            rst_command=params.rst_command,
+            read_command=params.read_command,
+            read_dummy_cycles=params.read_dummy_cycles,
+        )
+        flash = AmaranthFlash(self._flash, cs_n=cs.o, sclk=sclk.o, out=io.o, in_=io.i)
+        assembly.add_testbench(flash.run, background=True)
 
     @applet_v2_simulation_test(prepare=_prepare_read)  # type: ignore[misc]
     async def test_read(self, applet: FlashDTRApplet, ctx: SimulatorContext) -> None:
@@ -188,6 +64,72 @@ class FlashDTRAppletTestCase(GlasgowAppletV2TestCase, applet=FlashDTRApplet):  #
             )
         )
 
-        for _ in range(random.randrange(1, 6)):
+        reads = random.randrange(1, 6)
+        for _ in range(reads):
             result = await applet.flash_dtr_iface.read(address)
             self.assertEqual(result, expected)
+
+        # The buffer is still accessible over registers
+        index = random.randrange(component.buffer_size)
+        self.assertEqual(await applet.flash_dtr_iface.peek(index), expected[index])
+
+        perf_counters = await applet.flash_dtr_iface.get_perf_counters()
+        self.assertEqual(perf_counters["reads"], reads)
+        self.assertEqual(
+            perf_counters["first_byte_cycles"],
+            component.flash_params.cycles_until_first_read_byte,
+        )
+        self.assertEqual(perf_counters["bytes"], reads * component.buffer_size)
+
+        await applet.flash_dtr_iface.clear_perf_counters()
+        perf_counters = await applet.flash_dtr_iface.get_perf_counters()
+        self.assertEqual(perf_counters["reads"], 0)
+        self.assertEqual(perf_counters["bytes"], 0)
+
+    @applet_v2_simulation_test(prepare=_prepare_read)  # type: ignore[misc]
+    async def test_read_stream(
+        self, applet: FlashDTRApplet, ctx: SimulatorContext
+    ) -> None:
+        component = applet.flash_dtr_iface._component
+        assert isinstance(component, FlashDTRComponent)
+
+        for _ in range(random.randrange(1, 4)):
+            address = random.randrange(1 << component.flash_params.address_width_bits)
+            size = random.randrange(1, 4 * len(self._payload))
+
+            expected = bytes(
+                itertools.islice(
+                    itertools.cycle(self._payload), address, address + size
+                )
+            )
+
+            result = await applet.flash_dtr_iface.read_stream(address, size)
+            self.assertEqual(result, expected)
+
+        # The flash is configured only before the first read
+        self.assertEqual(self._flash.resets, 1)
+
+    @applet_v2_simulation_test(prepare=_prepare_read)  # type: ignore[misc]
+    async def test_crc32(self, applet: FlashDTRApplet, ctx: SimulatorContext) -> None:
+        component = applet.flash_dtr_iface._component
+        assert isinstance(component, FlashDTRComponent)
+
+        for _ in range(random.randrange(1, 4)):
+            address = random.randrange(1 << component.flash_params.address_width_bits)
+            size = random.randrange(1, 4 * len(self._payload))
+
+            expected = bytes(
+                itertools.islice(
+                    itertools.cycle(self._payload), address, address + size
+                )
+            )
+
+            crc = await applet.flash_dtr_iface.crc32(address, size)
+            self.assertEqual(crc, zlib.crc32(expected))
+
+            # Only the checksum was pushed into the stream
+            result = await applet.flash_dtr_iface.read_stream(address, size)
+            self.assertEqual(result, expected)
+
+        # The flash is configured only before the first read
+        self.assertEqual(self._flash.resets, 1)
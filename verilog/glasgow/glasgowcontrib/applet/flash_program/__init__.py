@@ -0,0 +1,888 @@
+import hashlib
+import logging
+import struct
+from argparse import ArgumentParser, BooleanOptionalAction, FileType, Namespace
+from enum import IntEnum
+from typing import Any
+
+from amaranth import Assert, Cat, Module, Mux, Signal, unsigned
+from amaranth.lib import stream, wiring
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth.lib.io import Buffer, Direction, PortLike
+from amaranth.lib.wiring import Component, In, Out
+from glasgow.abstract import PullState
+from glasgow.applet import (
+    AbstractAssembly,
+    GlasgowAppletArguments,
+    GlasgowAppletError,
+    GlasgowAppletV2,
+    GlasgowAppletV2TestCase,
+    GlasgowPin,
+)
+from tt10_rtl.spi_flash import FlashParams, SPIFlash
+
+# From the IS25WP128 datasheet
+# https://www.mouser.com/datasheet/2/198/IS25WP032_064_128-737458.pdf
+PAGE_SIZE = 256
+SECTOR_SIZE = 4 * 1024
+
+CMD_WRITE_STATUS_REGISTER = 0x01
+CMD_PAGE_PROGRAM = 0x02
+CMD_READ_STATUS_REGISTER = 0x05
+CMD_WRITE_ENABLE = 0x06
+CMD_SECTOR_ERASE = 0x20
+# The variants of the commands that always take a 4-byte address
+CMD_PAGE_PROGRAM_4B = 0x12
+CMD_SECTOR_ERASE_4B = 0x21
+CMD_READ_READ_PARAMETERS = 0x61
+CMD_SET_READ_PARAMETERS = 0x65  # Volatile
+CMD_CHIP_ERASE = 0xC7
+
+STATUS_WIP_BIT_POSITION = 0
+STATUS_QE_BIT_POSITION = 6
+DUMMY_CYCLES_BIT_POSITION = 3
+DUMMY_CYCLES_BIT_WIDTH = 4
+DUMMY_CYCLES_MASK = ((1 << DUMMY_CYCLES_BIT_WIDTH) - 1) << DUMMY_CYCLES_BIT_POSITION
+
+# Maximum number of bytes in a single Op.WRITE or Op.READ
+_MAX_TRANSFER_SIZE = 0xFFFF
+
+# Number of program or erase operations to queue before waiting for them
+# to complete
+_WRITE_BATCH_SIZE = 64
+
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class Op(IntEnum):
+    """
+    Commands accepted by FlashProgramComponent on i_stream.
+    Multi-byte arguments are big-endian.
+    """
+
+    # Asserts chip-select
+    SELECT = 0x01
+    # Deasserts chip-select
+    DESELECT = 0x02
+    # 2 bytes of length, followed by that many bytes to send
+    WRITE = 0x03
+    # 2 bytes of length. Reads that many bytes into o_stream.
+    READ = 0x04
+    # Command and mask, 1 byte each. Sends the command in a transaction
+    # of its own, and reads the response until none of the bits in the mask
+    # are set. The last byte read is pushed into o_stream.
+    POLL = 0x05
+    # 4 bytes of address, 4 bytes of size. Reads that many bytes into o_stream
+    # with the SPIFlash controller, at full speed.
+    STREAM = 0x06
+
+
+_ARGUMENT_SIZES = {
+    Op.WRITE: 2,
+    Op.READ: 2,
+    Op.POLL: 2,
+    Op.STREAM: 8,
+}
+
+
+def _sector_hash(sector: bytes) -> bytes:
+    return hashlib.sha256(sector).digest()
+
+
+class FlashProgramComponent(Component):  # type: ignore[misc]
+    """
+    Executes commands (see Op) to program a SPI flash, and reads it back
+    with our own controller.
+
+    Everything except for the streaming reads goes through a simple
+    byte-oriented SPI engine (CPOL=1, CPHA=1), so that the host can build
+    any transaction it needs. The engine is slower than the controller,
+    but programming is limited by the flash anyway.
+    """
+
+    def __init__(
+        self,
+        sclk: PortLike,
+        cs: PortLike,
+        io: PortLike,
+        *,
+        sclk_half_period_cycles: int = 2,
+        fifo_depth: int = 512,
+        flash_params: FlashParams = FlashParams(),
+    ) -> None:
+        super().__init__(
+            {
+                # Commands, see Op
+                "i_stream": In(stream.Signature(unsigned(8))),
+                # Data read from the flash
+                "o_stream": Out(stream.Signature(unsigned(8))),
+            }
+        )
+
+        assert sclk_half_period_cycles > 0
+        # We stop streaming when the FIFO is almost full,
+        # and resume when it's half empty.
+        assert fifo_depth >= 4
+        assert flash_params.address_width_bits <= 32
+
+        self._sclk = sclk
+        self._cs = cs
+        self._io = io
+        self._sclk_half_period_cycles = sclk_half_period_cycles
+        self._fifo_depth = fifo_depth
+        self._flash_params = flash_params
+
+    @property
+    def flash_params(self) -> FlashParams:
+        return self._flash_params
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        m.submodules.controller = controller = SPIFlash(self._flash_params)
+
+        # The lines of the SPI engine
+        cs_n = Signal(init=1)
+        sclk = Signal(init=1)  # CPOL=1
+        copi = Signal(init=0)
+
+        # Both the engine and the controller idle with chip-select and SCLK
+        # high, and only one of them is active at a time.
+        m.submodules.sclk_buffer = sclk_buffer = Buffer(Direction.Output, self._sclk)
+        m.d.comb += sclk_buffer.o.eq(controller.o_sclk & sclk)
+
+        m.submodules.cs_buffer = cs_buffer = Buffer(Direction.Output, self._cs)
+        m.d.comb += cs_buffer.o.eq(controller.o_cs_n & cs_n)
+
+        # The engine drives COPI (IO0) whenever it's active, and reads CIPO (IO1)
+        # through the inputs of the controller.
+        for i in range(len(self._io)):
+            m.submodules[f"io{i}_buffer"] = io_buffer = Buffer(
+                Direction.Bidir, self._io[i]
+            )
+            m.d.comb += controller.i_io[i].eq(io_buffer.i)
+            if i == 0:
+                m.d.comb += [
+                    io_buffer.o.eq(Mux(cs_n, controller.o_io[i], copi)),
+                    io_buffer.oe.eq(Mux(cs_n, controller.o_oe[i], 1)),
+                ]
+            else:
+                m.d.comb += [
+                    io_buffer.o.eq(controller.o_io[i]),
+                    io_buffer.oe.eq(controller.o_oe[i]),
+                ]
+
+        m.submodules.fifo = fifo = SyncFIFOBuffered(width=8, depth=self._fifo_depth)
+        wiring.connect(m, fifo.r_stream, wiring.flipped(self.o_stream))
+
+        #
+        # Byte shifter of the SPI engine.
+        # Exchanges shift_data for a byte of the response when shift_start
+        # is asserted. Data is sent on the falling edge of SCLK, and sampled
+        # on the rising edge.
+        #
+
+        shift_start = Signal()
+        shift_data = Signal(8)
+        shift_busy = Signal(init=0)
+
+        shift_reg = Signal(8)
+        shift_bits = Signal(range(8))
+        half_period_timer = Signal(range(self._sclk_half_period_cycles))
+
+        with m.If(shift_start):
+            m.d.sync += [
+                Assert(~shift_busy),
+                shift_reg.eq(shift_data),
+                shift_bits.eq(0),
+                half_period_timer.eq(self._sclk_half_period_cycles - 1),
+                shift_busy.eq(1),
+            ]
+        with m.Elif(shift_busy):
+            with m.If(half_period_timer == 0):
+                m.d.sync += half_period_timer.eq(self._sclk_half_period_cycles - 1)
+                with m.If(sclk):
+                    # Data is sent MSB-first
+                    m.d.sync += [
+                        sclk.eq(0),
+                        copi.eq(shift_reg[7]),
+                    ]
+                with m.Else():
+                    m.d.sync += [
+                        sclk.eq(1),
+                        shift_reg.eq(Cat(controller.i_io[1], shift_reg[:7])),
+                        shift_bits.eq(shift_bits + 1),
+                    ]
+                    with m.If(shift_bits == 7):
+                        m.d.sync += shift_busy.eq(0)
+            with m.Else():
+                m.d.sync += half_period_timer.eq(half_period_timer - 1)
+
+        #
+        # Command FSM
+        #
+
+        op = Signal(8)
+        argument = Signal(8 * max(_ARGUMENT_SIZES.values()))
+        argument_bytes = Signal(range(max(_ARGUMENT_SIZES.values())))
+        next_argument = Cat(self.i_stream.payload, argument)[: len(argument)]
+
+        length = Signal(16)
+        poll_command = Signal(8)
+        poll_mask = Signal(8)
+        stream_address = Signal(32)
+        stream_remaining = Signal(32)
+
+        # Keep chip-select deasserted for a whole SCLK period
+        # between transactions.
+        deselect_timer = Signal(range(2 * self._sclk_half_period_cycles))
+
+        assert controller.i_read.init == 0
+
+        with m.FSM():
+            with m.State("Command"):
+                m.d.sync += Assert(controller.o_cs_n)
+
+                m.d.comb += self.i_stream.ready.eq(1)
+                with m.If(self.i_stream.valid):
+                    m.d.sync += op.eq(self.i_stream.payload)
+                    with m.Switch(self.i_stream.payload):
+                        with m.Case(Op.SELECT):
+                            m.d.sync += cs_n.eq(0)
+                        with m.Case(Op.DESELECT):
+                            m.d.sync += [
+                                cs_n.eq(1),
+                                deselect_timer.eq(
+                                    2 * self._sclk_half_period_cycles - 1
+                                ),
+                            ]
+                            m.next = "Deselect"
+                        for arg_op, size in _ARGUMENT_SIZES.items():
+                            with m.Case(arg_op):
+                                m.d.sync += argument_bytes.eq(size - 1)
+                                m.next = "Argument"
+                        # Anything else is ignored
+
+            with m.State("Deselect"):
+                with m.If(deselect_timer == 0):
+                    m.next = "Command"
+                with m.Else():
+                    m.d.sync += deselect_timer.eq(deselect_timer - 1)
+
+            with m.State("Argument"):
+                m.d.comb += self.i_stream.ready.eq(1)
+                with m.If(self.i_stream.valid):
+                    m.d.sync += [
+                        argument.eq(next_argument),
+                        argument_bytes.eq(argument_bytes - 1),
+                    ]
+                    with m.If(argument_bytes == 0):
+                        with m.Switch(op):
+                            with m.Case(Op.WRITE):
+                                m.d.sync += length.eq(next_argument[:16])
+                                m.next = "Write"
+                            with m.Case(Op.READ):
+                                m.d.sync += length.eq(next_argument[:16])
+                                m.next = "Read"
+                            with m.Case(Op.POLL):
+                                m.d.sync += [
+                                    poll_command.eq(next_argument[8:16]),
+                                    poll_mask.eq(next_argument[:8]),
+                                    cs_n.eq(0),
+                                ]
+                                m.next = "Poll"
+                            with m.Case(Op.STREAM):
+                                m.d.sync += [
+                                    stream_address.eq(next_argument[32:64]),
+                                    stream_remaining.eq(next_argument[:32]),
+                                    # The engine and the controller can't
+                                    # both be active.
+                                    cs_n.eq(1),
+                                ]
+                                m.next = "Stream start"
+
+            with m.State("Write"):
+                with m.If(length == 0):
+                    m.next = "Write done"
+                with m.Else():
+                    m.d.comb += self.i_stream.ready.eq(~shift_busy)
+                    with m.If(self.i_stream.valid & ~shift_busy):
+                        m.d.comb += [
+                            shift_start.eq(1),
+                            shift_data.eq(self.i_stream.payload),
+                        ]
+                        m.d.sync += length.eq(length - 1)
+
+            with m.State("Write done"):
+                with m.If(~shift_busy):
+                    m.next = "Command"
+
+            with m.State("Read"):
+                with m.If(length == 0):
+                    m.next = "Command"
+                with m.Elif(~shift_busy):
+                    m.d.comb += shift_start.eq(1)
+                    m.next = "Read push"
+
+            with m.State("Read push"):
+                with m.If(~shift_busy):
+                    m.d.comb += [
+                        fifo.w_data.eq(shift_reg),
+                        fifo.w_en.eq(1),
+                    ]
+                    with m.If(fifo.w_rdy):
+                        m.d.sync += length.eq(length - 1)
+                        m.next = "Read"
+
+            with m.State("Poll"):
+                m.d.comb += [
+                    shift_start.eq(1),
+                    shift_data.eq(poll_command),
+                ]
+                m.next = "Poll response"
+
+            with m.State("Poll response"):
+                with m.If(~shift_busy):
+                    m.d.comb += shift_start.eq(1)
+                    m.next = "Poll check"
+
+            with m.State("Poll check"):
+                with m.If(~shift_busy):
+                    with m.If((shift_reg & poll_mask) == 0):
+                        m.d.comb += [
+                            fifo.w_data.eq(shift_reg),
+                            fifo.w_en.eq(1),
+                        ]
+                        with m.If(fifo.w_rdy):
+                            m.d.sync += [
+                                cs_n.eq(1),
+                                deselect_timer.eq(
+                                    2 * self._sclk_half_period_cycles - 1
+                                ),
+                            ]
+                            m.next = "Deselect"
+                    with m.Else():
+                        # The response can be read continuously
+                        m.d.comb += shift_start.eq(1)
+
+            with m.State("Stream start"):
+                with m.If(stream_remaining == 0):
+                    m.next = "Command"
+                with m.Elif(fifo.w_level <= self._fifo_depth // 2):
+                    m.d.sync += [
+                        controller.i_read.eq(1),
+                        controller.i_address.eq(stream_address),
+                    ]
+                    m.next = "Stream"
+
+            with m.State("Stream"):
+                with m.If(controller.o_data_valid):
+                    m.d.comb += [
+                        fifo.w_data.eq(controller.o_data),
+                        fifo.w_en.eq(1),
+                    ]
+                    m.d.sync += Assert(fifo.w_rdy)
+                    m.d.sync += [
+                        stream_address.eq(stream_address + 1),
+                        stream_remaining.eq(stream_remaining - 1),
+                    ]
+                    with m.If(
+                        (stream_remaining == 1)
+                        # The controller can't pause in the middle of a read,
+                        # so end this one before the FIFO overflows.
+                        | (fifo.w_level >= self._fifo_depth - 2)
+                    ):
+                        m.d.sync += controller.i_read.eq(0)
+                        m.next = "Stream wait"
+
+            with m.State("Stream wait"):
+                m.d.sync += Assert(~controller.o_data_valid)
+                with m.If(controller.o_cs_n):
+                    m.next = "Stream start"
+
+        return m
+
+
+class FlashProgramInterface:
+    def __init__(
+        self,
+        logger: logging.Logger,
+        assembly: AbstractAssembly,
+        sclk: GlasgowPin,
+        cs: GlasgowPin,
+        io: tuple[GlasgowPin, ...],
+        flash_params: FlashParams = FlashParams(),
+    ) -> None:
+        self._logger = logger
+
+        assembly.use_pulls(
+            {
+                sclk: PullState.High,
+                cs: PullState.High,
+                # IO pins should be pulled high so that WP# and HOLD#/RESET#
+                # are not active.
+                io: PullState.High,
+            }
+        )
+
+        sclk_port = assembly.add_port(sclk, "sclk")
+        cs_port = assembly.add_port(cs, "cs")
+        io_port = assembly.add_port(io, "io")
+
+        self._component = assembly.add_submodule(
+            FlashProgramComponent(
+                sclk=sclk_port, cs=cs_port, io=io_port, flash_params=flash_params
+            )
+        )
+
+        # Wider addresses need the variants of the commands that take them
+        if flash_params.address_width_bits > 24:
+            assert flash_params.address_width_bits == 32
+            self._page_program_command = CMD_PAGE_PROGRAM_4B
+            self._sector_erase_command = CMD_SECTOR_ERASE_4B
+        else:
+            self._page_program_command = CMD_PAGE_PROGRAM
+            self._sector_erase_command = CMD_SECTOR_ERASE
+
+        self._pipe = assembly.add_inout_pipe(
+            self._component.o_stream, self._component.i_stream
+        )
+
+    @property
+    def flash_size(self) -> int:
+        return int(1 << self._component.flash_params.address_width_bits)
+
+    def _address_bytes(self, address: int) -> bytes:
+        assert 0 <= address < self.flash_size
+        width = self._component.flash_params.address_width_bits
+        return address.to_bytes((width + 7) // 8, "big")
+
+    async def _queue_transaction(self, command: bytes, read_size: int = 0) -> None:
+        """
+        Queues a single transaction: sends the command, then reads
+        read_size bytes of the response.
+        """
+        packet = bytearray([Op.SELECT])
+        for offset in range(0, len(command), _MAX_TRANSFER_SIZE):
+            chunk = command[offset : offset + _MAX_TRANSFER_SIZE]
+            packet += struct.pack(">BH", Op.WRITE, len(chunk)) + chunk
+        for offset in range(0, read_size, _MAX_TRANSFER_SIZE):
+            chunk_size = min(read_size - offset, _MAX_TRANSFER_SIZE)
+            packet += struct.pack(">BH", Op.READ, chunk_size)
+        packet.append(Op.DESELECT)
+        await self._pipe.send(packet)
+
+    async def _queue_write(self, command: bytes) -> None:
+        """
+        Queues a command that modifies the flash, together with
+        the write-enable before it, and the polling for completion after it.
+        The last status register value is pushed into the pipe.
+        """
+        await self._queue_transaction(bytes([CMD_WRITE_ENABLE]))
+        await self._queue_transaction(command)
+        await self._pipe.send(
+            struct.pack(
+                ">BBB",
+                Op.POLL,
+                CMD_READ_STATUS_REGISTER,
+                1 << STATUS_WIP_BIT_POSITION,
+            )
+        )
+
+    async def _complete_writes(self, count: int) -> None:
+        await self._pipe.flush()
+        await self._pipe.recv(count)
+
+    async def _transaction(self, command: bytes, read_size: int) -> bytes:
+        await self._queue_transaction(command, read_size)
+        await self._pipe.flush()
+        return bytes(await self._pipe.recv(read_size))
+
+    async def read_status_register(self) -> int:
+        (status,) = await self._transaction(bytes([CMD_READ_STATUS_REGISTER]), 1)
+        return status
+
+    async def write_status_register(self, status: int) -> None:
+        await self._queue_write(bytes([CMD_WRITE_STATUS_REGISTER, status]))
+        await self._complete_writes(1)
+
+    async def read_read_parameters(self) -> int:
+        (params,) = await self._transaction(bytes([CMD_READ_READ_PARAMETERS]), 1)
+        return params
+
+    async def write_read_parameters(self, params: int) -> None:
+        await self._queue_write(bytes([CMD_SET_READ_PARAMETERS, params]))
+        await self._complete_writes(1)
+
+    async def erase_chip(self) -> None:
+        await self._queue_write(bytes([CMD_CHIP_ERASE]))
+        await self._complete_writes(1)
+
+    async def erase(self, address: int, size: int) -> None:
+        """
+        Erases the sectors in the given range, which must be sector-aligned.
+        """
+        assert address % SECTOR_SIZE == 0
+        assert size % SECTOR_SIZE == 0
+        assert address + size <= self.flash_size
+
+        await self._erase_sectors(list(range(address, address + size, SECTOR_SIZE)))
+
+    async def _erase_sectors(self, sectors: list[int]) -> None:
+        for batch_start in range(0, len(sectors), _WRITE_BATCH_SIZE):
+            batch = sectors[batch_start : batch_start + _WRITE_BATCH_SIZE]
+            for sector in batch:
+                await self._queue_write(
+                    bytes([self._sector_erase_command]) + self._address_bytes(sector)
+                )
+            await self._complete_writes(len(batch))
+            self._logger.info(
+                "Erased %d/%d sectors", batch_start + len(batch), len(sectors)
+            )
+
+    async def program(self, address: int, data: bytes) -> None:
+        """
+        Programs already erased flash.
+        """
+        assert address + len(data) <= self.flash_size
+
+        # Split the data on page boundaries
+        pages: list[tuple[int, bytes]] = []
+        offset = 0
+        while offset < len(data):
+            page_address = address + offset
+            page_size = min(
+                PAGE_SIZE - page_address % PAGE_SIZE,
+                len(data) - offset,
+            )
+            pages.append((page_address, data[offset : offset + page_size]))
+            offset += page_size
+
+        await self._program_pages(pages)
+
+    async def _program_pages(self, pages: list[tuple[int, bytes]]) -> None:
+        # Programming 0xFF doesn't change erased flash
+        pages = [(address, page) for address, page in pages if page.strip(b"\xff")]
+
+        for batch_start in range(0, len(pages), _WRITE_BATCH_SIZE):
+            batch = pages[batch_start : batch_start + _WRITE_BATCH_SIZE]
+            for page_address, page in batch:
+                await self._queue_write(
+                    bytes([self._page_program_command])
+                    + self._address_bytes(page_address)
+                    + page
+                )
+            await self._complete_writes(len(batch))
+            self._logger.info(
+                "Programmed %d/%d pages", batch_start + len(batch), len(pages)
+            )
+
+    async def sector_hashes(self, address: int, size: int) -> list[bytes]:
+        """
+        Hashes every sector in the given range, which must be sector-aligned.
+        The sectors are read with our own controller, and only the hashes
+        are kept, so this takes constant memory.
+        """
+        assert address % SECTOR_SIZE == 0
+        assert size % SECTOR_SIZE == 0
+        assert _STREAM_CHUNK_SIZE % SECTOR_SIZE == 0
+
+        hashes: list[bytes] = []
+        for offset in range(0, size, _STREAM_CHUNK_SIZE):
+            chunk = await self.read(
+                address + offset, min(size - offset, _STREAM_CHUNK_SIZE)
+            )
+            hashes += (
+                _sector_hash(chunk[i : i + SECTOR_SIZE])
+                for i in range(0, len(chunk), SECTOR_SIZE)
+            )
+            self._logger.info("Hashed %d/%d bytes", offset + len(chunk), size)
+        return hashes
+
+    async def sync(self, address: int, data: bytes) -> int:
+        """
+        Makes the flash at the given sector-aligned address match the data,
+        padded with 0xFF to a whole sector. Only the sectors that differ
+        are erased and programmed, and then verified.
+        Returns the number of sectors that were rewritten.
+        """
+        assert address % SECTOR_SIZE == 0
+
+        padding = -len(data) % SECTOR_SIZE
+        data += b"\xff" * padding
+        assert address + len(data) <= self.flash_size
+
+        erased_hash = _sector_hash(b"\xff" * SECTOR_SIZE)
+
+        to_erase: list[int] = []
+        to_program: list[tuple[int, bytes]] = []
+        for index, current_hash in enumerate(
+            await self.sector_hashes(address, len(data))
+        ):
+            sector = data[index * SECTOR_SIZE : (index + 1) * SECTOR_SIZE]
+            if _sector_hash(sector) == current_hash:
+                continue
+            sector_address = address + index * SECTOR_SIZE
+            if current_hash != erased_hash:
+                to_erase.append(sector_address)
+            to_program.append((sector_address, sector))
+
+        self._logger.info(
+            "%d/%d sectors differ", len(to_program), len(data) // SECTOR_SIZE
+        )
+
+        await self._erase_sectors(to_erase)
+        await self._program_pages(
+            [
+                (sector_address + offset, sector[offset : offset + PAGE_SIZE])
+                for sector_address, sector in to_program
+                for offset in range(0, SECTOR_SIZE, PAGE_SIZE)
+            ]
+        )
+
+        for sector_address, sector in to_program:
+            if await self.read(sector_address, SECTOR_SIZE) != sector:
+                raise GlasgowAppletError(
+                    f"Verification failed at sector 0x{sector_address:X}"
+                )
+
+        return len(to_program)
+
+    async def read(self, address: int, size: int) -> bytes:
+        """
+        Reads from the flash with our own controller.
+        """
+        assert 0 <= address < self.flash_size
+        assert 0 < size <= self.flash_size
+
+        await self._pipe.send(struct.pack(">BII", Op.STREAM, address, size))
+        await self._pipe.flush()
+        return bytes(await self._pipe.recv(size))
+
+    async def verify(self, address: int, data: bytes) -> None:
+        for offset in range(0, len(data), _STREAM_CHUNK_SIZE):
+            expected = data[offset : offset + _STREAM_CHUNK_SIZE]
+            actual = await self.read(address + offset, len(expected))
+            if actual != expected:
+                mismatch = next(
+                    i for i, (a, b) in enumerate(zip(actual, expected)) if a != b
+                )
+                raise GlasgowAppletError(
+                    f"Verification failed at address 0x{address + offset + mismatch:X}"
+                )
+            self._logger.info("Verified %d/%d bytes", offset + len(expected), len(data))
+
+
+class FlashProgramApplet(GlasgowAppletV2):  # type: ignore[misc]
+    logger = logging.getLogger(__name__)
+    help = "program a SPI flash chip, and verify it with our own controller"
+    required_revision = "C3"
+
+    @classmethod
+    def add_build_arguments(
+        cls, parser: ArgumentParser, access: GlasgowAppletArguments
+    ) -> None:
+        access.add_voltage_argument(parser)
+        # This is the same pinout as for the memory-25x applet
+        access.add_pins_argument(parser, "cs", required=True, default="A5")
+        access.add_pins_argument(
+            parser,
+            "io",
+            required=True,
+            width=4,
+            default="A2,A4,A3,A0",
+            help="bind the applet I/O lines 'copi', 'cipo', 'wp', 'hold' to PINS",
+        )
+        access.add_pins_argument(parser, "sclk", required=True, default="A1")
+        parser.add_argument(
+            "--address-width",
+            type=int,
+            choices=(24, 32),
+            default=24,
+            help="address width in bits. 32 bits use the 4-byte variants of "
+            "the commands, for flashes larger than 16 MiB",
+        )
+
+    def build(self, args: Namespace) -> None:
+        with self.assembly.add_applet(self):
+            self.assembly.use_voltage(args.voltage)
+            self.flash_iface = FlashProgramInterface(
+                self.logger,
+                self.assembly,
+                sclk=args.sclk,
+                cs=args.cs,
+                io=args.io,
+                flash_params=(
+                    FlashParams().with_four_byte_address()
+                    if args.address_width == 32
+                    else FlashParams()
+                ),
+            )
+
+    @classmethod
+    def add_run_arguments(cls, parser: ArgumentParser) -> None:
+        def address(s: str) -> int:
+            return int(s, 0)
+
+        p_operation = parser.add_subparsers(
+            dest="operation", metavar="OPERATION", required=True
+        )
+
+        p_configure = p_operation.add_parser(
+            "configure", help="configure quad mode and the read dummy cycles"
+        )
+        p_configure.add_argument(
+            "--quad-enable",
+            action=BooleanOptionalAction,
+            help="set or clear the QE bit of the status register",
+        )
+        p_configure.add_argument(
+            "--dummy-cycles",
+            type=int,
+            choices=range(1 << DUMMY_CYCLES_BIT_WIDTH),
+            help="set the dummy cycles of fast reads (volatile)",
+        )
+
+        p_erase = p_operation.add_parser("erase", help="erase the whole chip")
+        p_erase.add_argument(
+            "--address",
+            type=address,
+            help="erase only the sectors starting at ADDRESS",
+        )
+        p_erase.add_argument(
+            "--size",
+            type=address,
+            default=SECTOR_SIZE,
+            help="with --address, erase SIZE bytes (default: one sector)",
+        )
+
+        p_read = p_operation.add_parser("read", help="read the flash")
+        p_read.add_argument(
+            "-o",
+            "--output",
+            help="output file",
+            default="-",
+            type=FileType("wb"),
+        )
+        p_read.add_argument("--address", type=address, default=0)
+        p_read.add_argument("--size", type=address, required=True)
+
+        p_load = p_operation.add_parser(
+            "load", help="erase, program, and verify an image"
+        )
+        p_load.add_argument("file", type=FileType("rb"), help="image to load")
+        p_load.add_argument("--address", type=address, default=0)
+        p_load.add_argument(
+            "--erase-chip",
+            action="store_true",
+            help="erase the whole chip, instead of only the sectors of the image",
+        )
+
+        p_sync = p_operation.add_parser(
+            "sync",
+            help="rewrite only the sectors that differ from an image",
+        )
+        p_sync.add_argument(
+            "file",
+            type=FileType("rb"),
+            help="image to sync, padded with 0xFF to a whole sector",
+        )
+        p_sync.add_argument(
+            "--address",
+            type=address,
+            default=0,
+            help="sector-aligned address of the image",
+        )
+
+    async def run(self, args: Namespace) -> None:
+        match args.operation:
+            case "configure":
+                await self._configure(args.quad_enable, args.dummy_cycles)
+
+            case "erase":
+                if args.address is None:
+                    self.logger.info("Erasing chip")
+                    await self.flash_iface.erase_chip()
+                else:
+                    if args.address % SECTOR_SIZE or args.size % SECTOR_SIZE:
+                        raise GlasgowAppletError(
+                            f"Address and size must be multiples of 0x{SECTOR_SIZE:X}"
+                        )
+                    await self.flash_iface.erase(args.address, args.size)
+
+            case "read":
+                remaining = args.size
+                address = args.address
+                while remaining:
+                    data = await self.flash_iface.read(
+                        address, min(remaining, _STREAM_CHUNK_SIZE)
+                    )
+                    args.output.write(data)
+                    remaining -= len(data)
+                    address += len(data)
+                    self.logger.info(
+                        "Read %d/%d bytes", args.size - remaining, args.size
+                    )
+
+            case "sync":
+                data = args.file.read()
+                if args.address % SECTOR_SIZE:
+                    raise GlasgowAppletError(
+                        f"Address must be a multiple of 0x{SECTOR_SIZE:X}"
+                    )
+                if args.address + len(data) > self.flash_iface.flash_size:
+                    raise GlasgowAppletError("The image doesn't fit in the flash")
+
+                rewritten = await self.flash_iface.sync(args.address, data)
+                self.logger.info(
+                    "Synced 0x%X bytes at 0x%X, rewrote %d sectors",
+                    len(data),
+                    args.address,
+                    rewritten,
+                )
+
+            case "load":
+                data = args.file.read()
+                if args.address + len(data) > self.flash_iface.flash_size:
+                    raise GlasgowAppletError("The image doesn't fit in the flash")
+
+                if args.erase_chip:
+                    self.logger.info("Erasing chip")
+                    await self.flash_iface.erase_chip()
+                else:
+                    start = args.address - args.address % SECTOR_SIZE
+                    end = -(-(args.address + len(data)) // SECTOR_SIZE) * SECTOR_SIZE
+                    await self.flash_iface.erase(start, end - start)
+
+                await self.flash_iface.program(args.address, data)
+                await self.flash_iface.verify(args.address, data)
+                self.logger.info("Loaded 0x%X bytes at 0x%X", len(data), args.address)
+
+    async def _configure(
+        self, quad_enable: bool | None, dummy_cycles: int | None
+    ) -> None:
+        if quad_enable is not None:
+            status = await self.flash_iface.read_status_register()
+            self.logger.info("Status register: 0x%X", status)
+            if quad_enable:
+                status |= 1 << STATUS_QE_BIT_POSITION
+            else:
+                status &= ~(1 << STATUS_QE_BIT_POSITION)
+            await self.flash_iface.write_status_register(status)
+            if await self.flash_iface.read_status_register() != status:
+                raise GlasgowAppletError("Failed configuring quad mode")
+
+        if dummy_cycles is not None:
+            params = await self.flash_iface.read_read_parameters()
+            self.logger.info("Read parameters: 0x%X", params)
+            params &= ~DUMMY_CYCLES_MASK
+            params |= dummy_cycles << DUMMY_CYCLES_BIT_POSITION
+            await self.flash_iface.write_read_parameters(params)
+            if await self.flash_iface.read_read_parameters() != params:
+                raise GlasgowAppletError("Failed configuring dummy cycles")
+
+    @classmethod
+    def tests(cls) -> type[GlasgowAppletV2TestCase]:
+        from . import test
+
+        return test.FlashProgramAppletTestCase
@@ -0,0 +1,273 @@
+import random
+
+from amaranth.sim import SimulatorContext
+from flash_model import SPIDeviceEngine
+from flash_model.amaranth import AmaranthFlash
+from glasgow.applet import (
+    GlasgowAppletV2TestCase,
+    SimulationAssembly,
+    applet_v2_simulation_test,
+    synthesis_test,
+)
+
+from . import (
+    CMD_CHIP_ERASE,
+    CMD_PAGE_PROGRAM,
+    CMD_PAGE_PROGRAM_4B,
+    CMD_READ_READ_PARAMETERS,
+    CMD_READ_STATUS_REGISTER,
+    CMD_SECTOR_ERASE,
+    CMD_SECTOR_ERASE_4B,
+    CMD_SET_READ_PARAMETERS,
+    CMD_WRITE_ENABLE,
+    CMD_WRITE_STATUS_REGISTER,
+    DUMMY_CYCLES_BIT_POSITION,
+    DUMMY_CYCLES_MASK,
+    PAGE_SIZE,
+    SECTOR_SIZE,
+    STATUS_QE_BIT_POSITION,
+    STATUS_WIP_BIT_POSITION,
+    FlashProgramApplet,
+)
+
+CMD_READ = 0x03
+CMD_READ_4B = 0x13
+STATUS_WEL_BIT_POSITION = 1
+
+# Number of status register reads for which a program or erase
+# is still in progress
+BUSY_POLLS = 3
+
+# Length of the address of the commands that take one
+ADDRESS_BYTES = {
+    CMD_READ: 3,
+    CMD_PAGE_PROGRAM: 3,
+    CMD_SECTOR_ERASE: 3,
+    CMD_READ_4B: 4,
+    CMD_PAGE_PROGRAM_4B: 4,
+    CMD_SECTOR_ERASE_4B: 4,
+}
+
+
+class FlashModel:
+    """
+    Byte-level model of the commands we use, at 24-bit or 32-bit addresses.
+    Addresses wrap around the memory.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.memory = bytearray(random.randbytes(size))
+        self.status = 0
+        self.read_params = 0
+        self.sector_erases = 0
+        self._busy = 0
+        self._command = bytearray()
+
+    def select(self) -> None:
+        self._command.clear()
+
+    def exchange(self, byte: int) -> int:
+        """
+        Receives a byte, and returns the byte to send during the next one.
+        """
+        self._command.append(byte)
+
+        if self._busy:
+            assert self._command[0] == CMD_READ_STATUS_REGISTER, (
+                "Command while a write is in progress"
+            )
+
+        command = self._command[0]
+        if command == CMD_READ_STATUS_REGISTER:
+            status = self.status
+            if self._busy:
+                self._busy -= 1
+                if not self._busy:
+                    self.status &= ~(
+                        (1 << STATUS_WIP_BIT_POSITION) | (1 << STATUS_WEL_BIT_POSITION)
+                    )
+            return status
+        if command == CMD_READ_READ_PARAMETERS:
+            return self.read_params
+        if command in (CMD_READ, CMD_READ_4B):
+            data_start = 1 + ADDRESS_BYTES[command]
+            if len(self._command) >= data_start:
+                address = int.from_bytes(self._command[1:data_start], "big")
+                offset = len(self._command) - data_start
+                return self.memory[(address + offset) % len(self.memory)]
+        return 0xFF
+
+    def deselect(self) -> None:
+        if not self._command:
+            return
+
+        command = self._command[0]
+        write_enabled = self.status & (1 << STATUS_WEL_BIT_POSITION)
+
+        if command == CMD_WRITE_ENABLE:
+            self.status |= 1 << STATUS_WEL_BIT_POSITION
+        elif command == CMD_SET_READ_PARAMETERS and len(self._command) == 2:
+            self.read_params = self._command[1]
+        elif not write_enabled:
+            return
+        elif command == CMD_WRITE_STATUS_REGISTER and len(self._command) == 2:
+            self.status = self._command[1] & ~(
+                (1 << STATUS_WIP_BIT_POSITION) | (1 << STATUS_WEL_BIT_POSITION)
+            )
+            self._start_write()
+        elif (
+            command in (CMD_PAGE_PROGRAM, CMD_PAGE_PROGRAM_4B)
+            and len(self._command) > 1 + ADDRESS_BYTES[command]
+        ):
+            data_start = 1 + ADDRESS_BYTES[command]
+            address = int.from_bytes(self._command[1:data_start], "big")
+            page = address - address % PAGE_SIZE
+            for i, byte in enumerate(self._command[data_start:]):
+                offset = (page + (address + i) % PAGE_SIZE) % len(self.memory)
+                self.memory[offset] &= byte
+            self._start_write()
+        elif (
+            command in (CMD_SECTOR_ERASE, CMD_SECTOR_ERASE_4B)
+            and len(self._command) == 1 + ADDRESS_BYTES[command]
+        ):
+            address = int.from_bytes(self._command[1:], "big") % len(self.memory)
+            sector = address - address % SECTOR_SIZE
+            self.memory[sector : sector + SECTOR_SIZE] = b"\xff" * SECTOR_SIZE
+            self.sector_erases += 1
+            self._start_write()
+        elif command == CMD_CHIP_ERASE and len(self._command) == 1:
+            self.memory[:] = b"\xff" * len(self.memory)
+            self._start_write()
+
+    def _start_write(self) -> None:
+        self.status |= (1 << STATUS_WIP_BIT_POSITION) | (1 << STATUS_WEL_BIT_POSITION)
+        self._busy = BUSY_POLLS
+
+
+class FlashProgramAppletTestCase(GlasgowAppletV2TestCase, applet=FlashProgramApplet):  # type: ignore[misc, call-arg]
+    @synthesis_test  # type: ignore[misc]
+    def test_build(self) -> None:
+        self.assertBuilds()
+
+    def setUp(self) -> None:
+        self._flash = FlashModel(16 * SECTOR_SIZE)
+
+    def _prepare_flash(self, assembly: SimulationAssembly) -> None:
+        # HACK based on the defaults in FlashProgramApplet.add_build_arguments
+        sclk_port = assembly.get_pin("A1")
+        cs_port = assembly.get_pin("A5")
+        copi_port = assembly.get_pin("A2")
+        cipo_port = assembly.get_pin("A4")
+
+        # The engine toggles SCLK only while it's shifting a byte
+        flash = AmaranthFlash(
+            SPIDeviceEngine(self._flash),
+            cs_n=cs_port.o,
+            sclk=sclk_port.o,
+            out=copi_port.o,
+            in_=cipo_port.i,
+            free_running_sclk=False,
+        )
+        assembly.add_testbench(flash.run, background=True)
+
+    @applet_v2_simulation_test(prepare=_prepare_flash)  # type: ignore[misc]
+    async def test_configure(
+        self, applet: FlashProgramApplet, ctx: SimulatorContext
+    ) -> None:
+        status = await applet.flash_iface.read_status_register()
+        self.assertEqual(status, self._flash.status)
+
+        status |= 1 << STATUS_QE_BIT_POSITION
+        await applet.flash_iface.write_status_register(status)
+        self.assertEqual(self._flash.status, status)
+        self.assertEqual(await applet.flash_iface.read_status_register(), status)
+
+        dummy_cycles = random.randrange(16)
+        params = await applet.flash_iface.read_read_parameters()
+        params &= ~DUMMY_CYCLES_MASK
+        params |= dummy_cycles << DUMMY_CYCLES_BIT_POSITION
+        await applet.flash_iface.write_read_parameters(params)
+        self.assertEqual(self._flash.read_params, params)
+        self.assertEqual(await applet.flash_iface.read_read_parameters(), params)
+
+    @applet_v2_simulation_test(prepare=_prepare_flash)  # type: ignore[misc]
+    async def test_load(
+        self, applet: FlashProgramApplet, ctx: SimulatorContext
+    ) -> None:
+        await self._test_load(applet)
+
+    @applet_v2_simulation_test(  # type: ignore[misc]
+        prepare=_prepare_flash, args="--address-width 32"
+    )
+    async def test_load_four_byte_address(
+        self, applet: FlashProgramApplet, ctx: SimulatorContext
+    ) -> None:
+        await self._test_load(applet)
+
+    async def _test_load(self, applet: FlashProgramApplet) -> None:
+        size = random.randrange(1, 3 * SECTOR_SIZE)
+        address = random.randrange(len(self._flash.memory) - size)
+        payload = random.randbytes(size)
+
+        start = address - address % SECTOR_SIZE
+        end = -(-(address + size) // SECTOR_SIZE) * SECTOR_SIZE
+        before = bytes(self._flash.memory)
+
+        await applet.flash_iface.erase(start, end - start)
+        await applet.flash_iface.program(address, payload)
+        await applet.flash_iface.verify(address, payload)
+
+        expected = bytearray(before)
+        expected[start:end] = b"\xff" * (end - start)
+        expected[address : address + size] = payload
+        self.assertEqual(self._flash.memory, expected)
+
+        # Reads wrap around the end of the flash
+        address = random.randrange(len(self._flash.memory))
+        result = await applet.flash_iface.read(address, 100)
+        self.assertEqual(
+            result,
+            bytes(expected[(address + i) % len(expected)] for i in range(len(result))),
+        )
+
+    @applet_v2_simulation_test(prepare=_prepare_flash)  # type: ignore[misc]
+    async def test_erase_chip(
+        self, applet: FlashProgramApplet, ctx: SimulatorContext
+    ) -> None:
+        await applet.flash_iface.erase_chip()
+        self.assertEqual(self._flash.memory, b"\xff" * len(self._flash.memory))
+        self.assertEqual(
+            await applet.flash_iface.read(0, SECTOR_SIZE), b"\xff" * SECTOR_SIZE
+        )
+
+    @applet_v2_simulation_test(prepare=_prepare_flash)  # type: ignore[misc]
+    async def test_sync(
+        self, applet: FlashProgramApplet, ctx: SimulatorContext
+    ) -> None:
+        sectors = 4
+        address = SECTOR_SIZE * random.randrange(
+            len(self._flash.memory) // SECTOR_SIZE - sectors + 1
+        )
+        image = bytearray(self._flash.memory[address : address + sectors * SECTOR_SIZE])
+
+        # One sector that needs erasing, and one that's already erased
+        image[random.randrange(SECTOR_SIZE)] ^= 0xFF
+        self._flash.memory[address + SECTOR_SIZE : address + 2 * SECTOR_SIZE] = (
+            b"\xff" * SECTOR_SIZE
+        )
+        # The image ends in the middle of the last sector,
+        # which gets padded with 0xFF
+        image = image[: -SECTOR_SIZE // 2]
+
+        rewritten = await applet.flash_iface.sync(address, bytes(image))
+        self.assertEqual(rewritten, 3)
+        self.assertEqual(self._flash.sector_erases, 2)
+
+        expected = image + b"\xff" * (SECTOR_SIZE // 2)
+        self.assertEqual(
+            self._flash.memory[address : address + sectors * SECTOR_SIZE], expected
+        )
+
+        # Nothing to do the second time around
+        self.assertEqual(await applet.flash_iface.sync(address, bytes(image)), 0)
+        self.assertEqual(self._flash.sector_erases, 2)
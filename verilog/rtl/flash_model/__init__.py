@@ -0,0 +1,26 @@
+"""
+Flash models for the simulation tests. The engines and the memory don't
+depend on the simulator. To run an engine, use the adapter from
+flash_model.cocotb or flash_model.amaranth.
+"""
+
+from .engines import (
+    Bus,
+    ByteDevice,
+    Engine,
+    QSPIFlashDTREngine,
+    SPIDeviceEngine,
+    SPIFlashEngine,
+)
+from .memory import FlashMemory, SeededFlashMemory
+
+__all__ = [
+    "Bus",
+    "ByteDevice",
+    "Engine",
+    "FlashMemory",
+    "QSPIFlashDTREngine",
+    "SeededFlashMemory",
+    "SPIDeviceEngine",
+    "SPIFlashEngine",
+]
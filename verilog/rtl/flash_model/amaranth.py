@@ -0,0 +1,201 @@
+from functools import cache
+from typing import Self
+
+from amaranth.hdl import ValueLike
+from amaranth.sim import SimulatorContext
+
+from .engines import Engine
+
+__all__ = ["AmaranthFlash"]
+
+
+class AmaranthFlash:
+    """
+    Runs a flash engine on the signals of an amaranth simulation.
+    Add run() as a background testbench.
+
+    If SCLK is derived from a free-running clock, as it is in all of our
+    controllers, the model measures its half-period at the start of every
+    transaction, and from then on only wakes up on the edges where it has
+    something to do. A whole byte is driven from a precomputed schedule,
+    while waiting on a single tick trigger. Otherwise, pass
+    ``free_running_sclk=False``, and the model follows every SCLK edge.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        cs_n: ValueLike,
+        sclk: ValueLike,
+        out: ValueLike,
+        in_: ValueLike,
+        domain: str = "sync",
+        free_running_sclk: bool = True,
+    ) -> None:
+        """
+        ``out`` are the data lines as driven by the controller (COPI, or IO),
+        ``in_`` are the data lines as seen by the controller (CIPO, or IO).
+        """
+        self._engine = engine
+        self._cs_n = cs_n
+        self._sclk = sclk
+        self._out = out
+        self._in = in_
+        self._domain = domain
+        self._free_running_sclk = free_running_sclk
+
+    async def run(self, ctx: SimulatorContext) -> None:
+        while True:
+            if ctx.get(self._cs_n):
+                await ctx.negedge(self._cs_n)
+            bus = await _AmaranthBus.start(self, ctx)
+            if bus is not None:
+                await self._engine.transaction(bus)
+            if not ctx.get(self._cs_n):
+                await ctx.posedge(self._cs_n)
+
+
+class _AmaranthBus:
+    """
+    Implements engines.Bus for amaranth.sim. We look at the signals right
+    after the clock edge on which SCLK changes, so values driven by the DUT
+    on that edge are visible, and values driven by us are only sampled on
+    the next one.
+    """
+
+    def __init__(
+        self, flash: AmaranthFlash, ctx: SimulatorContext, half_period_ticks: int
+    ) -> None:
+        self._flash = flash
+        self._ctx = ctx
+        self._half_period_ticks = half_period_ticks
+
+        # Number of the current edge. Even edges are falling, odd are rising.
+        self._edge = 1
+        # Edges we've been asked to skip, but didn't wait for yet
+        self._pending_edges = 0
+
+    @classmethod
+    async def start(cls, flash: AmaranthFlash, ctx: SimulatorContext) -> Self | None:
+        """
+        Waits for the first two SCLK edges after chip-select is asserted
+        (falling, then rising: CPOL=1). Returns right after the rising edge,
+        or None if chip-select was deasserted in the meantime.
+        """
+        ticks = 0
+        for level in (0, 1):
+            ticks = 0
+            while ctx.get(flash._sclk) != level:
+                await ctx.tick(flash._domain)
+                ticks += 1
+                if ctx.get(flash._cs_n):
+                    return None
+        return cls(flash, ctx, ticks)
+
+    async def _advance(self, edges: int) -> bool:
+        edges += self._pending_edges
+        self._pending_edges = 0
+        if not edges:
+            return True
+
+        flash = self._flash
+        if flash._free_running_sclk:
+            return await self._run_schedule(((edges, None),))
+
+        # Polling is much cheaper than waiting for edge triggers on signals
+        # that rarely change, like chip-select.
+        for _ in range(edges):
+            self._edge += 1
+            while True:
+                await self._ctx.tick(flash._domain)
+                if self._ctx.get(flash._cs_n):
+                    return False
+                if self._ctx.get(flash._sclk) == self._edge % 2:
+                    break
+        return True
+
+    async def _run_schedule(self, schedule: tuple[tuple[int, int | None], ...]) -> bool:
+        """
+        For every step of the schedule, advances by its number of edges,
+        and then drives its value, if any. Only for a free-running SCLK.
+        """
+        if not schedule:
+            return True
+
+        flash = self._flash
+        ctx = self._ctx
+        steps = iter(schedule)
+        edges, value = next(steps)
+        ticks_left = edges * self._half_period_ticks
+        # A single trigger for all the steps, rather than one for every
+        # clock cycle. Not tick().repeat(): the simulator can't close it
+        # cleanly if the simulation ends while we're waiting.
+        async for _ in ctx.tick(flash._domain):
+            ticks_left -= 1
+            if ticks_left:
+                continue
+
+            self._edge += edges
+            if ctx.get(flash._cs_n) or ctx.get(flash._sclk) != self._edge % 2:
+                return False
+            if value is not None:
+                ctx.set(flash._in, value)
+
+            step = next(steps, None)
+            if step is None:
+                return True
+            edges, value = step
+            ticks_left = edges * self._half_period_ticks
+
+        raise AssertionError("Unreachable")
+
+    async def skip(self, edges: int) -> bool:
+        return await self._advance(edges)
+
+    async def sample(self, count: int, *, bits: int, stride: int = 1) -> int | None:
+        mask = (1 << bits) - 1
+        value = 0
+        for i in range(count):
+            if i and not await self.skip(stride):
+                return None
+            value = (value << bits) | (self._ctx.get(self._flash._out) & mask)
+        return value
+
+    async def drive(self, values: tuple[int | None, ...]) -> bool:
+        if self._flash._free_running_sclk:
+            schedule, trailing_edges = _schedule(values)
+            if schedule and self._pending_edges:
+                (first_edges, first_value), *rest = schedule
+                schedule = ((self._pending_edges + first_edges, first_value), *rest)
+                self._pending_edges = 0
+            self._pending_edges += trailing_edges
+            return await self._run_schedule(schedule)
+
+        for value in values:
+            if value is None:
+                self._pending_edges += 1
+                continue
+            if not await self._advance(1):
+                return False
+            self._ctx.set(self._flash._in, value)
+        return True
+
+
+@cache
+def _schedule(
+    values: tuple[int | None, ...],
+) -> tuple[tuple[tuple[int, int], ...], int]:
+    """
+    The values to drive for _AmaranthBus.drive, as steps of (edges to advance,
+    value to drive), followed by the number of edges left over at the end,
+    on which nothing is driven.
+    """
+    schedule = []
+    edges = 0
+    for value in values:
+        edges += 1
+        if value is not None:
+            schedule.append((edges, value))
+            edges = 0
+    return tuple(schedule), edges
@@ -0,0 +1,53 @@
+from .engines import Engine
+from .pins import Pins, wait_until
+from .timing import SclkTimer
+
+__all__ = ["CocotbFlash", "Pins"]
+
+
+class CocotbFlash:
+    """
+    Runs a flash engine on the wires of a cocotb DUT.
+    Start run() with cocotb.start_soon.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        cs_n: Pins,
+        sclk: Pins,
+        out: Pins,
+        in_: Pins,
+        output_delay_steps: int = 0,
+    ) -> None:
+        """
+        ``out`` are the data lines as driven by the controller (COPI, or IO),
+        ``in_`` are the data lines as seen by the controller (CIPO, or IO).
+        ``output_delay_steps`` delays the data driven by the flash, on top of
+        the quarter of an SCLK half-period it's normally driven after the edge.
+        This stands in for the delay of the flash, the pads and the board.
+        """
+        assert out.width == in_.width
+        assert output_delay_steps >= 0
+
+        self._engine = engine
+        self._cs_n = cs_n
+        self._sclk = sclk
+        self._out = out
+        self._in = in_
+        self._output_delay_steps = output_delay_steps
+
+    async def run(self) -> None:
+        while True:
+            await wait_until(lambda: self._cs_n.equals(0), self._cs_n)
+            bus = await SclkTimer.start(
+                self._cs_n,
+                self._sclk,
+                self._out,
+                self._in,
+                output_delay_steps=self._output_delay_steps,
+            )
+            if bus is not None:
+                await self._engine.transaction(bus)
+            await wait_until(lambda: self._cs_n.equals(1), self._cs_n)
@@ -0,0 +1,278 @@
+"""
+What the flash does during a transaction, independent of the simulator.
+The adapters in flash_model.cocotb and flash_model.amaranth run an engine
+against the pins of a DUT.
+"""
+
+from typing import Protocol
+
+from .memory import FlashMemory
+
+
+def _sdr_edges(io_width: int) -> tuple[tuple[int | None, ...], ...]:
+    """
+    For every byte value: what to drive on the data lines on each SCLK edge,
+    starting from a falling edge. Data is sent MSB-first, ``io_width`` bits
+    at a time, and changes only on falling edges.
+    """
+    mask = (1 << io_width) - 1
+    return tuple(
+        tuple(
+            value
+            for i in reversed(range(0, 8, io_width))
+            # Falling edge, then rising edge
+            for value in ((byte >> i) & mask, None)
+        )
+        for byte in range(256)
+    )
+
+
+_SDR_EDGES = {io_width: _sdr_edges(io_width) for io_width in (1, 2, 4)}
+
+# For every byte value: what to drive on IO[3:0] on each SCLK edge.
+# In DTR mode a nibble is sent on every edge, MSB-first.
+_IO_EDGES = tuple((byte >> 4, byte & 0xF) for byte in range(256))
+
+
+class Bus(Protocol):
+    """
+    A single transaction, as seen by the flash (SPI mode 3), timed in SCLK
+    edges. Even edges are falling, odd edges are rising. A transaction starts
+    at edge 1, the first rising edge, on which the first bit of the command
+    is sampled.
+
+    The "out" lines are driven by the controller, and the "in" lines
+    by the flash.
+    """
+
+    async def sample(self, count: int, *, bits: int, stride: int = 1) -> int | None:
+        """
+        Samples ``bits`` low bits of the out lines ``count`` times, every
+        ``stride`` SCLK edges, starting from the current edge.
+        Data is MSB-first. Returns None if the transaction has ended.
+        """
+        ...
+
+    async def skip(self, edges: int) -> bool:
+        """
+        Advances by the given number of SCLK edges.
+        Returns False if the transaction has ended.
+        """
+        ...
+
+    async def drive(self, values: tuple[int | None, ...]) -> bool:
+        """
+        Drives one value on the in lines per SCLK edge, starting from
+        the next one. None leaves the lines unchanged on that edge.
+        Implementations may skip waking up on such edges, so they must not
+        be falling edges. Returns False if the transaction has ended.
+        """
+        ...
+
+
+class Engine(Protocol):
+    async def transaction(self, bus: Bus) -> None: ...
+
+
+class SPIFlashEngine:
+    """
+    Responds to SDR read commands: the plain 1-bit READ (0x03) by default,
+    or the dual and quad fast reads, with the same parameters as
+    spi_flash.FlashParams.
+
+    The out lines are IO0 and up, as many as there are data lines.
+    The in lines are the data lines: CIPO (IO1) for 1-bit data,
+    and IO0 and up otherwise.
+    """
+
+    def __init__(
+        self,
+        memory: FlashMemory | bytes,
+        *,
+        command_width_bits: int = 8,
+        address_width_bits: int = 24,
+        read_command: int = 0x03,
+        address_io_width: int = 1,
+        data_io_width: int = 1,
+        read_mode_bits: int = 0,
+        read_dummy_cycles: int = 0,
+    ) -> None:
+        assert address_width_bits % address_io_width == 0
+        assert read_mode_bits % address_io_width == 0
+
+        self._memory = (
+            memory if isinstance(memory, FlashMemory) else FlashMemory(memory)
+        )
+        self._command_width_bits = command_width_bits
+        self._address_width_bits = address_width_bits
+        self._read_command = read_command
+        self._address_io_width = address_io_width
+        self._data_edges = _SDR_EDGES[data_io_width]
+        self._mode_clocks = read_mode_bits // address_io_width
+        self._read_dummy_cycles = read_dummy_cycles
+
+    @property
+    def memory(self) -> FlashMemory:
+        return self._memory
+
+    async def transaction(self, bus: Bus) -> None:
+        # Data is sampled on rising edges, so every other edge
+        command = await bus.sample(self._command_width_bits, bits=1, stride=2)
+        if command != self._read_command:
+            return
+
+        if not await bus.skip(2):
+            return
+        address = await bus.sample(
+            self._address_width_bits // self._address_io_width,
+            bits=self._address_io_width,
+            stride=2,
+        )
+        if address is None:
+            return
+
+        # We don't support continuous read mode, so we don't care about
+        # the value of the mode bits.
+        if not await bus.skip(2 * (self._mode_clocks + self._read_dummy_cycles)):
+            return
+
+        # The first data bits go out on the falling edge right after the
+        # last address bits, or the last dummy cycle.
+        for byte in self._memory.stream(address):
+            if not await bus.drive(self._data_edges[byte]):
+                return
+
+
+class QSPIFlashDTREngine:
+    """
+    Responds to the Fast Read Quad I/O DTR command (FRQDTR, 1S-4D-4D),
+    and to the software reset sequence.
+    """
+
+    def __init__(
+        self,
+        memory: FlashMemory | bytes,
+        *,
+        command_width_bits: int = 8,
+        address_width_bits: int = 24,
+        rsten_command: int = 0x66,
+        rst_command: int = 0x99,
+        read_command: int = 0xED,
+        read_dummy_cycles: int = 15,
+    ) -> None:
+        assert address_width_bits % 4 == 0
+        assert read_dummy_cycles > 1
+
+        self._memory = (
+            memory if isinstance(memory, FlashMemory) else FlashMemory(memory)
+        )
+        self._command_width_bits = command_width_bits
+        self._address_width_bits = address_width_bits
+        self._rsten_command = rsten_command
+        self._rst_command = rst_command
+        self._read_command = read_command
+        self._read_dummy_cycles = read_dummy_cycles
+
+        self._reset_enabled = False
+        self._resets = 0
+
+    @property
+    def memory(self) -> FlashMemory:
+        return self._memory
+
+    @property
+    def resets(self) -> int:
+        """
+        How many times the software reset sequence was received.
+        """
+        return self._resets
+
+    async def transaction(self, bus: Bus) -> None:
+        # The command is sent in 1S mode: on IO0, sampled on rising edges
+        command = await bus.sample(self._command_width_bits, bits=1, stride=2)
+        if command is None:
+            return
+
+        # Reset-enable must immediately precede the reset command
+        reset_enabled = self._reset_enabled
+        self._reset_enabled = False
+
+        if command == self._rsten_command:
+            self._reset_enabled = True
+            return
+        if command == self._rst_command:
+            if reset_enabled:
+                self._resets += 1
+            return
+        if command != self._read_command:
+            return
+
+        # The address starts on the next rising edge, 4 bits per edge
+        if not await bus.skip(2):
+            return
+        address = await bus.sample(self._address_width_bits // 4, bits=4)
+        if address is None:
+            return
+
+        # 8 mode bits. We don't support continuous read mode, so we
+        # don't care about their value.
+        if not await bus.skip(2):
+            return
+
+        # The mode bits take up the first dummy cycle
+        if not await bus.skip(2 * (self._read_dummy_cycles - 1)):
+            return
+
+        for byte in self._memory.stream(address):
+            if not await bus.drive(_IO_EDGES[byte]):
+                return
+
+
+class ByteDevice(Protocol):
+    """
+    A peripheral that exchanges whole bytes with the controller.
+    """
+
+    def select(self) -> None: ...
+
+    def exchange(self, byte: int) -> int:
+        """
+        Receives a byte, and returns the byte to send during the next one.
+        """
+        ...
+
+    def deselect(self) -> None: ...
+
+
+class SPIDeviceEngine:
+    """
+    Runs a ByteDevice over 1-bit SPI, for commands that aren't worth
+    an engine of their own.
+    """
+
+    def __init__(self, device: ByteDevice) -> None:
+        self._device = device
+
+    async def transaction(self, bus: Bus) -> None:
+        self._device.select()
+        try:
+            received = await bus.sample(8, bits=1, stride=2)
+            while received is not None:
+                received = await self._exchange(bus, self._device.exchange(received))
+        finally:
+            self._device.deselect()
+
+    async def _exchange(self, bus: Bus, response: int) -> int | None:
+        # Each bit goes out on a falling edge, and the bit from
+        # the controller comes in on the next rising edge.
+        received = 0
+        for i in reversed(range(8)):
+            if not await bus.drive(((response >> i) & 1,)):
+                return None
+            if not await bus.skip(1):
+                return None
+            bit = await bus.sample(1, bits=1)
+            if bit is None:
+                return None
+            received = (received << 1) | bit
+        return received
@@ -0,0 +1,93 @@
+import random
+from typing import Iterator
+
+
+class FlashMemory:
+    """
+    Contents of a flash chip. Addresses wrap around at the end of the array,
+    the same way sequential reads on a real chip do.
+
+    The contents are never copied or rotated: reads index into the original
+    buffer using modulo arithmetic.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        if not data:
+            raise ValueError("Flash memory can't be empty")
+        self._data = memoryview(data).toreadonly()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, address: int) -> int:
+        return self._data[address % len(self._data)]
+
+    def read(self, address: int, size: int) -> bytes:
+        """
+        Reads ``size`` bytes starting from ``address``, wrapping around
+        as needed.
+        """
+        result = bytearray()
+        offset = address % len(self._data)
+        while len(result) < size:
+            chunk = self._data[offset : offset + size - len(result)]
+            result += chunk
+            offset = 0
+        return bytes(result)
+
+    def stream(self, address: int) -> Iterator[int]:
+        """
+        Yields bytes starting from ``address``, indefinitely.
+        """
+        offset = address % len(self._data)
+        while True:
+            yield from self._data[offset:]
+            offset = 0
+
+
+class SeededFlashMemory(FlashMemory):
+    """
+    Random contents of a flash chip, generated from a seed a block at a time,
+    so that even a large flash takes little memory. The same seed always
+    gives the same contents.
+    """
+
+    BLOCK_SIZE = 4096
+
+    def __init__(self, seed: int, size: int) -> None:
+        if size <= 0:
+            raise ValueError("Flash memory can't be empty")
+        self._seed = seed
+        self._size = size
+        # Reads are mostly sequential, so the last block is kept
+        self._block_index = -1
+        self._block_data = b""
+
+    @property
+    def seed(self) -> int:
+        return self._seed
+
+    def _block(self, index: int) -> bytes:
+        if index != self._block_index:
+            size = min(self.BLOCK_SIZE, self._size - index * self.BLOCK_SIZE)
+            self._block_data = random.Random(f"{self._seed}:{index}").randbytes(size)
+            self._block_index = index
+        return self._block_data
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, address: int) -> int:
+        index, offset = divmod(address % self._size, self.BLOCK_SIZE)
+        return self._block(index)[offset]
+
+    def read(self, address: int, size: int) -> bytes:
+        stream = self.stream(address)
+        return bytes(next(stream) for _ in range(size))
+
+    def stream(self, address: int) -> Iterator[int]:
+        offset = address % self._size
+        while True:
+            index, start = divmod(offset, self.BLOCK_SIZE)
+            yield from self._block(index)[start:]
+            offset = min((index + 1) * self.BLOCK_SIZE, self._size) % self._size
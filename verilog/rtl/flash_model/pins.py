@@ -0,0 +1,97 @@
+from typing import Callable
+
+from cocotb.handle import ModifiableObject
+from cocotb.triggers import Edge, First, ReadOnly
+
+
+class Pins:
+    """
+    One or more DUT wires, viewed as a single unsigned value.
+    The first wire holds the least significant bits.
+
+    A wire is either a whole handle, or a ``(handle, index)`` pair selecting
+    a single bit of a wider handle. Some simulators don't support creating
+    triggers on individual bits, so in the latter case we trigger on the whole
+    handle, and check the bit we want manually.
+    """
+
+    def __init__(self, *wires: ModifiableObject | tuple[ModifiableObject, int]) -> None:
+        if not wires:
+            raise ValueError("At least one wire is required")
+
+        self._handles: list[ModifiableObject] = []
+        self._widths: list[int] = []
+        self._trigger_handles: list[ModifiableObject] = []
+
+        for wire in wires:
+            if isinstance(wire, tuple):
+                bus, index = wire
+                handle = bus[index]
+                trigger_handle = bus
+            else:
+                handle = trigger_handle = wire
+
+            self._handles.append(handle)
+            self._widths.append(handle.value.n_bits)
+            if not any(trigger_handle is h for h in self._trigger_handles):
+                self._trigger_handles.append(trigger_handle)
+
+        self._width = sum(self._widths)
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def is_resolvable(self) -> bool:
+        return all(handle.value.is_resolvable for handle in self._handles)
+
+    @property
+    def value(self) -> int:
+        if len(self._handles) == 1:
+            return int(self._handles[0].value)
+
+        value = 0
+        bit_offset = 0
+        for handle, width in zip(self._handles, self._widths, strict=True):
+            value |= int(handle.value) << bit_offset
+            bit_offset += width
+        return value
+
+    @value.setter
+    def value(self, value: int) -> None:
+        if len(self._handles) == 1:
+            self._handles[0].value = value
+            return
+
+        bit_offset = 0
+        for handle, width in zip(self._handles, self._widths, strict=True):
+            handle.value = (value >> bit_offset) & ((1 << width) - 1)
+            bit_offset += width
+
+    def equals(self, value: int) -> bool:
+        """
+        Same as ``pins.value == value``, but is False instead of raising
+        when the wires are not resolvable.
+        """
+        return self.is_resolvable and self.value == value
+
+
+async def wait_until(condition: Callable[[], bool], *pins: Pins) -> None:
+    """
+    Waits until the condition is true, re-evaluating it whenever any of the
+    given pins may have changed. Returns in the read-only phase.
+    """
+    trigger_handles: list[ModifiableObject] = []
+    for p in pins:
+        for handle in p._trigger_handles:
+            if not any(handle is h for h in trigger_handles):
+                trigger_handles.append(handle)
+
+    while True:
+        # A signal may change multiple times during a time step, until it
+        # settles. Only look at the value once everything has settled.
+        await ReadOnly()
+        if condition():
+            return
+        await First(*(Edge(handle) for handle in trigger_handles))
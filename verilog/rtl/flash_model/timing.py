@@ -0,0 +1,147 @@
+from typing import Self
+
+import cocotb
+from cocotb.triggers import Timer
+from cocotb.utils import get_sim_time
+
+from .pins import Pins, wait_until
+
+
+class SclkTimer:
+    """
+    Implements engines.Bus for cocotb: keeps time in SCLK half-periods
+    ("edges") during a single transaction.
+
+    Instead of waiting for every SCLK edge, which costs several Python-level
+    triggers per edge, we wait for the first two edges of the transaction
+    to measure the half-period, and from then on wake up with a plain timer
+    a quarter of a half-period after the edges we're interested in.
+    This assumes SCLK is derived from a free-running clock, as it is in all
+    of our controllers.
+
+    With an output delay, the values are driven that much later than that,
+    without waiting for them.
+
+    On every wake-up we check that chip-select is still asserted, and that
+    SCLK is at the level we expect (CPOL=1: low after a falling edge).
+    SCLK idles high while chip-select is deasserted, and stays high until
+    the first falling edge of the next transaction. So, as long as we wake up
+    on every falling edge, we'll notice the end of the transaction, even if
+    chip-select was deasserted only for a single edge in between.
+    """
+
+    def __init__(
+        self,
+        cs_n: Pins,
+        sclk: Pins,
+        out: Pins,
+        in_: Pins,
+        half_period_steps: int,
+        *,
+        output_delay_steps: int = 0,
+    ) -> None:
+        self._cs_n = cs_n
+        self._sclk = sclk
+        self._out = out
+        self._in = in_
+        self._half_period_steps = half_period_steps
+        self._timers: dict[int, Timer] = {}
+        self._output_delay_steps = output_delay_steps
+
+        # Number of the current edge. Even edges are falling, odd are rising.
+        self._edge = 1
+        # Edges we've been asked to skip, but didn't wait for yet
+        self._pending_edges = 0
+
+    @classmethod
+    async def start(
+        cls,
+        cs_n: Pins,
+        sclk: Pins,
+        out: Pins,
+        in_: Pins,
+        *,
+        output_delay_steps: int = 0,
+    ) -> Self | None:
+        """
+        Waits for the first two SCLK edges after chip-select is asserted
+        (falling, then rising: CPOL=1).
+        Returns shortly after the rising edge, or None if chip-select
+        was deasserted in the meantime.
+        """
+
+        await wait_until(lambda: cs_n.equals(1) or sclk.equals(0), cs_n, sclk)
+        if cs_n.value:
+            return None
+        falling_edge_time = get_sim_time("step")
+
+        await wait_until(lambda: cs_n.equals(1) or sclk.equals(1), cs_n, sclk)
+        if cs_n.value:
+            return None
+        half_period_steps = get_sim_time("step") - falling_edge_time
+
+        # Move away from the edge, so that values driven by the DUT on this
+        # edge are visible, and values driven by us are only sampled on
+        # the next one.
+        await Timer(max(half_period_steps // 4, 1), units="step")
+
+        return cls(
+            cs_n,
+            sclk,
+            out,
+            in_,
+            half_period_steps,
+            output_delay_steps=output_delay_steps,
+        )
+
+    async def _advance(self, edges: int) -> bool:
+        """
+        Waits for the given number of edges (plus any pending ones).
+        Returns False if the transaction has ended.
+        """
+        edges += self._pending_edges
+        self._pending_edges = 0
+        if not edges:
+            return True
+
+        timer = self._timers.get(edges)
+        if timer is None:
+            timer = self._timers[edges] = Timer(
+                edges * self._half_period_steps, units="step"
+            )
+        await timer
+        self._edge += edges
+
+        return not self._cs_n.value and self._sclk.value == self._edge % 2
+
+    async def skip(self, edges: int) -> bool:
+        for _ in range(edges):
+            if not await self._advance(1):
+                return False
+        return True
+
+    async def sample(self, count: int, *, bits: int, stride: int = 1) -> int | None:
+        mask = (1 << bits) - 1
+        value = 0
+        for i in range(count):
+            if i and not await self.skip(stride):
+                return None
+            value = (value << bits) | (self._out.value & mask)
+        return value
+
+    async def drive(self, values: tuple[int | None, ...]) -> bool:
+        for value in values:
+            if value is None:
+                self._pending_edges += 1
+                continue
+            if not await self._advance(1):
+                return False
+            if self._output_delay_steps:
+                cocotb.start_soon(self._drive_later(value))
+            else:
+                self._in.value = value
+        return True
+
+    async def _drive_later(self, value: int) -> None:
+        await Timer(self._output_delay_steps, units="step")
+        self._in.value = value
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import argparse
+import ast
+import dataclasses
 import importlib
 import inspect
 import re
@@ -94,7 +96,7 @@ def _main() -> None:
             elaboratable.__name__,
         ).lower()
 
-    instance = elaboratable()
+    instance = elaboratable(**_constructor_arguments(elaboratable, args.arg))
     if args.async_reset or args.active_low_reset:
         instance = Wrapper(
             instance,
@@ -155,11 +157,24 @@ def _parse_command_line() -> argparse.Namespace:
         "--python-class",
         help=(
             "Amaranth class to convert. Must derive from Elaboratable. "
-            "Must be constructible without arguments. If unspecified, "
+            "Must be constructible with the arguments given by --arg. If unspecified, "
             "the imported module must have exactly one Elaboratable-derived class, "
             "which will be used."
         ),
     )
+    parser.add_argument(
+        "--arg",
+        action="append",
+        default=[],
+        type=_parse_keyword_argument,
+        metavar="NAME=VALUE",
+        help=(
+            "Keyword argument to pass to the constructor of the Amaranth class. "
+            "VALUE is a Python literal. NAME may also be ARGUMENT.FIELD, to set "
+            "a single field of a dataclass argument, such as the flash parameters. "
+            "May be specified multiple times."
+        ),
+    )
     parser.add_argument(
         "--verilog-module-name",
         help=(
@@ -190,6 +205,46 @@ def _parse_command_line() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def _parse_keyword_argument(argument: str) -> tuple[str, Any]:
+    name, separator, value = argument.partition("=")
+    if not separator or not all(part.isidentifier() for part in name.split(".")):
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {argument!r}")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError) as e:
+        raise argparse.ArgumentTypeError(f"Invalid value for {name}: {e}") from e
+
+
+def _constructor_arguments(
+    klass: type[Any], arguments: list[tuple[str, Any]]
+) -> dict[str, Any]:
+    """
+    Arguments named ARGUMENT.FIELD replace a field of a dataclass argument,
+    starting from the argument's default value.
+    """
+    parameters = inspect.signature(klass).parameters
+    result: dict[str, Any] = {}
+    fields: dict[str, dict[str, Any]] = {}
+    for name, value in arguments:
+        name, _, field = name.partition(".")
+        if field:
+            fields.setdefault(name, {})[field] = value
+        else:
+            result[name] = value
+    # All the fields are replaced at once, since the dataclass may validate
+    # them together.
+    for name, values in fields.items():
+        if name not in result and (
+            name not in parameters
+            or parameters[name].default is inspect.Parameter.empty
+        ):
+            raise RuntimeError(f"Argument {name} of {klass.__name__} has no default")
+        result[name] = dataclasses.replace(
+            result.get(name, parameters[name].default), **values
+        )
+    return result
+
+
 def _get_cls_from_module(module: types.ModuleType, cls: type[_T]) -> type[_T]:
     candidates = tuple(
         item
@@ -0,0 +1,5 @@
+"""
+The digital part of the design, and the flash controllers it's built from.
+The Glasgow applets and the Verilog generation flow both import these modules,
+so there's a single copy of every controller.
+"""
@@ -0,0 +1,257 @@
+from collections.abc import Sequence
+from typing import Any
+
+from amaranth import Cat, Module, Mux, Signal, unsigned
+from amaranth.lib.data import ArrayLayout
+from amaranth.lib.wiring import Component, In, Out
+
+from . import qspi_flash_dtr, spi_flash
+
+
+class Arbiter(Component):  # type: ignore[misc]
+    """
+    Shares a flash controller between several requesters. Every requester
+    has the read interface of the controllers, so a reader like Player can
+    be connected to the arbiter instead of to the controller.
+
+    Every requester has a priority class, 0 being the highest. When the
+    controller is free, it's granted to the waiting class with the highest
+    priority, and within the class, to the first waiting requester after
+    the one that had it last, wrapping around. Once a class is granted the
+    controller, it yields to the classes below it: while one of them is
+    waiting, the class isn't granted again before one of them is. So a
+    higher class gets more turns, but never starves the lower ones.
+
+    Once a requester gets burst_bytes bytes, and another requester is
+    waiting, its read is stopped, and the controller goes to the next one
+    as above. The read is resumed from where it stopped once the requester
+    gets the controller again, so to the requester the stream only has a
+    gap. A requester is done when it deasserts i_read, like with the
+    controllers.
+
+    The controllers finish the command of a read even if it's stopped, so
+    the controller is only granted again once i_spi_busy is deasserted.
+
+    See max_wait_cycles for the resulting latency bound.
+    """
+
+    def __init__(
+        self,
+        flash_params: spi_flash.FlashParams
+        | qspi_flash_dtr.FlashParams = spi_flash.FlashParams(),
+        *,
+        burst_bytes: Sequence[int],
+        priorities: Sequence[int] | None = None,
+    ) -> None:
+        assert len(burst_bytes) > 1
+        assert all(burst > 0 for burst in burst_bytes)
+        # By default, all the requesters are in the same class
+        if priorities is None:
+            priorities = [0] * len(burst_bytes)
+        assert len(priorities) == len(burst_bytes)
+        assert all(priority >= 0 for priority in priorities)
+        address_shape = unsigned(flash_params.address_width_bits)
+        requesters = len(burst_bytes)
+        super().__init__(
+            {
+                # Interface to the requesters. Bytes go to all of them, and
+                # o_data_valid tells which one a byte is for.
+                "i_read": In(requesters),
+                "i_address": In(ArrayLayout(address_shape, requesters)),
+                "o_data": Out(unsigned(8), init=0),
+                "o_data_valid": Out(requesters, init=0),
+                # The requester that owns the controller, if any
+                "o_grant": Out(requesters),
+                # Interface to the SPI controller
+                "o_spi_read": Out(1),
+                "o_spi_address": Out(address_shape, init=0),
+                "i_spi_data_valid": In(1),
+                "i_spi_data": In(unsigned(8)),
+                # Whether the controller is in the middle of a read. This is
+                # the inverse of its chip-select.
+                "i_spi_busy": In(1),
+            }
+        )
+        self._burst_bytes = tuple(burst_bytes)
+        self._priorities = tuple(priorities)
+        self._first_byte_cycles = flash_params.cycles_until_first_read_byte
+        self._cycles_per_byte = flash_params.cycles_per_byte
+
+    @property
+    def requesters(self) -> int:
+        return len(self._burst_bytes)
+
+    @property
+    def burst_bytes(self) -> tuple[int, ...]:
+        return self._burst_bytes
+
+    @property
+    def priorities(self) -> tuple[int, ...]:
+        return self._priorities
+
+    @property
+    def _classes(self) -> list[list[int]]:
+        """
+        The requesters of every priority class, from the highest.
+        """
+        return [
+            [
+                requester
+                for requester, other in enumerate(self.priorities)
+                if other == priority
+            ]
+            for priority in sorted(set(self.priorities))
+        ]
+
+    def max_wait_cycles(self, requester: int) -> int:
+        """
+        Worst-case cycles from the edge at which the arbiter sees i_read of
+        the requester, until the edge at which it can sample its first byte,
+        when every other requester reads as much as it can.
+        """
+
+        def burst_cycles(requester: int) -> int:
+            # From the edge at which a burst is granted, until the edge at
+            # which the next one is. The read is started on the edge after
+            # the grant, and stopped a cycle after the last byte. The
+            # controller deasserts chip-select a cycle after that.
+            return (
+                3
+                + self._first_byte_cycles
+                + (self.burst_bytes[requester] - 1) * self._cycles_per_byte
+            )
+
+        def longest_burst(requesters: list[int]) -> int:
+            return max((burst_cycles(other) for other in requesters), default=0)
+
+        classes = self._classes
+        rank = next(i for i, members in enumerate(classes) if requester in members)
+        members = classes[rank]
+        higher = [other for members in classes[:rank] for other in members]
+        lower = [other for members in classes[rank + 1 :] for other in members]
+
+        # Every other requester of the class may get a burst first. Before
+        # each of those, and before the requester's own, the classes above
+        # may get bursts until each of them has yielded, which is at most
+        # 2**rank - 1 bursts, like a binary counter with a bit for every
+        # class. If the class has yielded, a class below gets a burst, which
+        # clears all the yields, and the classes above get to count again.
+        higher_bursts = (1 << rank) - 1
+        if lower:
+            higher_bursts *= 2
+        per_turn = higher_bursts * longest_burst(higher) + longest_burst(lower)
+        # Bytes are passed on a cycle after the controller delivers them.
+        return (
+            sum(burst_cycles(other) for other in members if other != requester)
+            + len(members) * per_turn
+            + self._first_byte_cycles
+            + 1
+        )
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        # The requester that owns the controller, or owned it last
+        current = Signal(range(self.requesters), init=0)
+        burst_left = Signal(range(max(self.burst_bytes)), init=0)
+        # Address of the next byte of every requester, and whether it was
+        # stopped in the middle of its read
+        address = Signal(ArrayLayout(self.o_spi_address.shape(), self.requesters))
+        resuming = Signal(self.requesters, init=0)
+
+        # A read that was stopped is forgotten once the requester is done
+        m.d.sync += resuming.eq(resuming & self.i_read)
+
+        # Ensure the valid signal is asserted only for a single clock
+        m.d.sync += self.o_data_valid.eq(0)
+
+        def grant(requester: int) -> None:
+            start_address = Mux(
+                resuming[requester],
+                address[requester],
+                self.i_address[requester],
+            )
+            m.d.sync += [
+                current.eq(requester),
+                burst_left.eq(self.burst_bytes[requester] - 1),
+                address[requester].eq(start_address),
+                self.o_spi_address.eq(start_address),
+            ]
+            m.next = "Granted"
+
+        classes = self._classes
+        # The classes that have been granted the controller since a class
+        # below them was
+        yielded = Signal(len(classes), init=0)
+        # The position in the class of the requester that was granted the
+        # controller last. Starts at the last one, so that the first one
+        # goes first.
+        last = [
+            Signal(range(len(members)), init=len(members) - 1) for members in classes
+        ]
+
+        class_waiting = Signal(len(classes))
+        m.d.comb += class_waiting.eq(
+            Cat(
+                Cat(self.i_read[requester] for requester in members).any()
+                for members in classes
+            )
+        )
+
+        def grant_class(rank: int) -> None:
+            m.d.sync += yielded[rank].eq(1)
+            if rank:
+                m.d.sync += yielded[:rank].eq(0)
+
+            members = classes[rank]
+            if len(members) == 1:
+                grant(members[0])
+                return
+            with m.Switch(last[rank]):
+                for previous in range(len(members)):
+                    with m.Case(previous):
+                        order = [
+                            (previous + offset) % len(members)
+                            for offset in range(1, len(members) + 1)
+                        ]
+                        for i, position in enumerate(order):
+                            with (m.If if i == 0 else m.Elif)(
+                                self.i_read[members[position]]
+                            ):
+                                m.d.sync += last[rank].eq(position)
+                                grant(members[position])
+
+        with m.FSM():
+            with m.State("Idle"):
+                with m.If(~self.i_spi_busy):
+                    for rank in range(len(classes)):
+                        eligible = class_waiting[rank]
+                        if rank < len(classes) - 1:
+                            lower_waiting = class_waiting[rank + 1 :].any()
+                            eligible &= ~(yielded[rank] & lower_waiting)
+                        with (m.If if rank == 0 else m.Elif)(eligible):
+                            grant_class(rank)
+
+            with m.State("Granted"):
+                m.d.comb += [
+                    self.o_spi_read.eq(self.i_read.bit_select(current, 1)),
+                    self.o_grant.bit_select(current, 1).eq(1),
+                ]
+
+                waiting = (self.i_read & ~self.o_grant).any()
+
+                with m.If(~self.i_read.bit_select(current, 1)):
+                    m.next = "Idle"
+                with m.Elif(self.i_spi_data_valid):
+                    m.d.sync += [
+                        self.o_data.eq(self.i_spi_data),
+                        self.o_data_valid.bit_select(current, 1).eq(1),
+                        address[current].eq(address[current] + 1),
+                    ]
+                    with m.If(burst_left != 0):
+                        m.d.sync += burst_left.eq(burst_left - 1)
+                    with m.Elif(waiting):
+                        m.d.sync += resuming.bit_select(current, 1).eq(1)
+                        m.next = "Idle"
+
+        return m
@@ -0,0 +1,200 @@
+from enum import Enum
+from typing import Any
+
+from amaranth import Assert, Module, Signal, unsigned
+from amaranth.lib.wiring import Component, In, Out
+
+from .interpolator import Interpolator
+from .line_cache import LineCache
+from .player import Player
+from .spi_flash import FlashParams, SPIFlash
+
+
+class Mode(Enum):
+    DEBUG_DAC_R_PT = 0
+    DEBUG_DAC_L_PT = 1
+    PRODUCTION_R = 2
+    # We're using uio[7:6] for the mode-select. When using the QSPI Pmod,
+    # these pins are connected to the CS# of the SRAM chips through a pull-up.
+    # To be compatible with the Pmod, we make it so the production mode
+    # works when both of these lines are pulled up.
+    # To use the debug mode, either cut the traces on the Pmod, or don't use
+    # it at all :)
+    PRODUCTION_L = 3
+
+
+class DigitalTop(Component):  # type: ignore[misc]
+    def __init__(
+        self,
+        *,
+        flash_params: FlashParams = FlashParams(),
+        upsampling: int = 1,
+        cache_lines: int = 0,
+    ) -> None:
+        # Updates the DACs this many times per frame read from the flash,
+        # interpolating between the frames. See Interpolator.
+        assert upsampling in (1, 2, 4)
+        # Puts a LineCache with this many lines between the player and the
+        # flash controller, so that short clips that are played repeatedly
+        # start without a read from the flash.
+        assert cache_lines >= 0
+        super().__init__(
+            {
+                "ui_in": In(8),
+                "uo_out": Out(8, init=0),
+                "uio_in": In(8),
+                "uio_out": Out(8, init=0),
+                "uio_oe": Out(8, init=0),  # Everything Hi-Z by default
+                "o_digital": Out(unsigned(16), init=0),  # 2 8-bit channels
+            }
+        )
+        self._flash_params = flash_params
+        self._upsampling = upsampling
+        self._cache_lines = cache_lines
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        m.submodules.spi_flash = spi_flash = SPIFlash(self._flash_params)
+
+        m.submodules.player = player = Player(
+            spi_address_width_bits=self._flash_params.address_width_bits,
+            channels=2,
+        )
+
+        if self._cache_lines:
+            m.submodules.line_cache = line_cache = LineCache(
+                self._flash_params, lines=self._cache_lines
+            )
+            m.d.comb += [
+                spi_flash.i_read.eq(line_cache.o_spi_read),
+                spi_flash.i_address.eq(line_cache.o_spi_address),
+                line_cache.i_spi_data_valid.eq(spi_flash.o_data_valid),
+                line_cache.i_spi_data.eq(spi_flash.o_data),
+                line_cache.i_spi_busy.eq(~spi_flash.o_cs_n),
+            ]
+            reader = line_cache
+        else:
+            reader = spi_flash
+
+        if self._upsampling > 1:
+            m.submodules.interpolator = interpolator = Interpolator(
+                channels=2,
+                factor=self._upsampling,
+                # The player outputs a frame whenever it's read
+                frame_period_cycles=2 * self._flash_params.cycles_per_byte,
+            )
+            m.d.comb += [
+                interpolator.i_frame.eq(player.o_digital),
+                interpolator.i_frame_valid.eq(player.o_digital_valid),
+                interpolator.i_clear.eq(~player.o_busy),
+            ]
+            digital = interpolator.o_digital
+        else:
+            digital = player.o_digital
+
+        # With quad I/O, the controller drives uio[5:4] as IO2 and IO3
+        # in production mode.
+        quad_io = self._flash_params.data_io_width == 4
+
+        # SPI bus
+        # Pinout compatible with https://tinytapeout.com/specs/pinouts/#qspi-flash-and-psram
+        m.d.comb += [
+            # Chip-select
+            self.uio_out[0].eq(spi_flash.o_cs_n),
+            self.uio_oe[0].eq(1),
+            # IO0 (COPI)
+            self.uio_out[1].eq(spi_flash.o_io[0]),
+            self.uio_oe[1].eq(spi_flash.o_oe[0]),
+            spi_flash.i_io[0].eq(self.uio_in[1]),
+            # IO1 (CIPO)
+            self.uio_out[2].eq(spi_flash.o_io[1]),
+            self.uio_oe[2].eq(spi_flash.o_oe[1]),
+            spi_flash.i_io[1].eq(self.uio_in[2]),
+            # Clock
+            self.uio_out[3].eq(spi_flash.o_sclk),
+            self.uio_oe[3].eq(1),
+            # IO2 and IO3. They're driven only in production mode,
+            # and only with quad I/O. See below.
+            spi_flash.i_io[2:4].eq(self.uio_in[4:6]),
+        ]
+
+        #
+        # Mode selection
+        #
+
+        mode = Signal(Mode)
+        assert mode.width == 2
+        m.d.comb += [
+            mode.eq(self.uio_in[6:8]),
+            self.uio_oe[6:8].eq(0),
+        ]
+
+        with m.Switch(mode):
+            with m.Case(Mode.PRODUCTION_L, Mode.PRODUCTION_R):
+                if quad_io:
+                    m.d.comb += [
+                        self.uio_out[4:6].eq(spi_flash.o_io[2:4]),
+                        self.uio_oe[4:6].eq(spi_flash.o_oe[2:4]),
+                    ]
+                else:
+                    # Pull up IO3 on the QSPI Pmod, which is the
+                    # HOLD# / RESET# pin
+                    m.d.comb += [self.uio_out[5].eq(1), self.uio_oe[5].eq(1)]
+
+                # Player <-> SPI controller connection, through the cache
+                # if there's one
+                m.d.comb += [
+                    reader.i_read.eq(player.o_spi_read),
+                    reader.i_address.eq(player.o_spi_address),
+                    player.i_spi_data_valid.eq(reader.o_data_valid),
+                    player.i_spi_data.eq(reader.o_data),
+                ]
+
+                # Player digital output; will be wired to the analog module outside
+                assert self.o_digital.width == digital.shape().size
+                m.d.comb += self.o_digital.eq(digital)
+
+                # Play-pause
+                m.d.comb += player.i_play.eq(self.ui_in[0])
+
+                # Busy signal. With quad I/O its pin is IO2.
+                if not quad_io:
+                    m.d.comb += [
+                        self.uio_out[4].eq(player.o_busy),
+                        self.uio_oe[4].eq(1),
+                    ]
+
+                # Passthrough of a selected audio channel
+                assert self.uo_out.width == digital.shape().elem_shape.width
+                with m.If(mode == Mode.PRODUCTION_L):
+                    m.d.comb += self.uo_out.eq(digital[0])
+                with m.Else():
+                    m.d.comb += Assert(mode == Mode.PRODUCTION_R)
+                    m.d.comb += self.uo_out.eq(digital[1])
+
+            with m.Case(Mode.DEBUG_DAC_L_PT, Mode.DEBUG_DAC_R_PT):
+                with m.If(mode == Mode.DEBUG_DAC_L_PT):
+                    m.d.comb += self.o_digital[0:8].eq(self.ui_in)
+                with m.Else():
+                    m.d.comb += Assert(mode == Mode.DEBUG_DAC_R_PT)
+                    m.d.comb += self.o_digital[8:16].eq(self.ui_in)
+
+                # Passthrough of SPI controller signals.
+                # This uses the pins of IO2 and IO3, so the flash can only
+                # be read with up to 2 lines.
+                m.d.comb += [
+                    spi_flash.i_read.eq(self.uio_in[5]),
+                    self.uio_oe[5].eq(0),
+                    spi_flash.i_address.eq(self.ui_in),
+                    self.uo_out.eq(spi_flash.o_data),
+                    self.uio_out[4].eq(spi_flash.o_data_valid),
+                    self.uio_oe[4].eq(1),
+                ]
+
+            # Commented-out because this results in an empty always_comb
+            # block being generated, which iverilog can't deal with.
+            # with m.Default():
+            #     m.d.comb += Assert(False)
+
+        return m
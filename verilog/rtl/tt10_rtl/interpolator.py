@@ -0,0 +1,127 @@
+from typing import Any
+
+from amaranth import Module, Mux, Signal, unsigned
+from amaranth.lib.data import ArrayLayout
+from amaranth.lib.wiring import Component, In, Out
+
+
+class Interpolator(Component):  # type: ignore[misc]
+    """
+    Linear interpolator that updates the output factor times per input frame.
+
+    When a frame arrives, the output steps from the previous frame to the new
+    one, reaching it on the last step. Every step but the last moves the
+    output towards the new frame by |new - previous| // factor, per channel,
+    and the last one lands on it. So there are no multipliers, just an adder
+    per channel. The first step is output on the edge after i_frame_valid,
+    and the rest follow every frame_period_cycles // factor cycles.
+
+    i_clear clears the output and the previous frame, so that the next frame
+    is approached from 0.
+
+    NOTE: Keep in sync with player_model.upsample.
+    """
+
+    def __init__(
+        self,
+        *,
+        channels: int = 2,
+        factor: int,
+        frame_period_cycles: int,
+    ) -> None:
+        assert channels > 0
+        assert factor in (2, 4)
+        # Every frame is done before the next one arrives
+        assert frame_period_cycles % factor == 0
+        super().__init__(
+            {
+                "i_frame": In(ArrayLayout(unsigned(8), channels)),
+                "i_frame_valid": In(1),
+                "i_clear": In(1),
+                "o_digital": Out(
+                    ArrayLayout(unsigned(8), channels), init=[0] * channels
+                ),
+            }
+        )
+        self._factor = factor
+        self._step_cycles = frame_period_cycles // factor
+
+    @property
+    def channels(self) -> int:
+        return len(self.o_digital)
+
+    @property
+    def factor(self) -> int:
+        return self._factor
+
+    @property
+    def step_cycles(self) -> int:
+        return self._step_cycles
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        target = Signal.like(self.o_digital)
+        # Per channel, whether the output steps down, and by how much
+        down = Signal(self.channels, init=0)
+        increment = Signal.like(self.o_digital)
+        # The step that is output next. Stepping stops after the last one.
+        step = Signal(range(self.factor + 2), init=self.factor + 1)
+        step_timer = Signal(range(self.step_cycles), init=0)
+
+        shift = (self.factor - 1).bit_length()
+
+        def advance(value: Any, down: Any, increment: Any) -> Any:
+            return Mux(down, value - increment, value + increment)
+
+        with m.If(self.i_clear):
+            m.d.sync += [
+                target.eq(0),
+                step.eq(self.factor + 1),
+                self.o_digital.eq(0),
+            ]
+        with m.Elif(self.i_frame_valid):
+            # Start from the last frame, even if the output didn't reach it yet
+            m.d.sync += [
+                target.eq(self.i_frame),
+                step.eq(2),
+                step_timer.eq(self.step_cycles - 1),
+            ]
+            for channel in range(self.channels):
+                new_down = self.i_frame[channel] < target[channel]
+                new_increment = (
+                    Mux(
+                        new_down,
+                        target[channel] - self.i_frame[channel],
+                        self.i_frame[channel] - target[channel],
+                    )
+                    >> shift
+                )
+                m.d.sync += [
+                    down[channel].eq(new_down),
+                    increment[channel].eq(new_increment),
+                    self.o_digital[channel].eq(
+                        advance(target[channel], new_down, new_increment)
+                    ),
+                ]
+        with m.Elif(step != self.factor + 1):
+            with m.If(step_timer == 0):
+                m.d.sync += [
+                    step.eq(step + 1),
+                    step_timer.eq(self.step_cycles - 1),
+                ]
+                with m.If(step == self.factor):
+                    m.d.sync += self.o_digital.eq(target)
+                with m.Else():
+                    for channel in range(self.channels):
+                        m.d.sync += self.o_digital[channel].eq(
+                            advance(
+                                self.o_digital[channel],
+                                down[channel],
+                                increment[channel],
+                            )
+                        )
+            with m.Else():
+                m.d.sync += step_timer.eq(step_timer - 1)
+
+        return m
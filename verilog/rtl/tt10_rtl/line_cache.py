@@ -0,0 +1,218 @@
+from typing import Any
+
+from amaranth import Module, Signal, unsigned
+from amaranth.lib.memory import Memory
+from amaranth.lib.wiring import Component, In, Out
+
+from . import qspi_flash_dtr, spi_flash
+from .perf_counters import perf_counter_members
+
+PERF_COUNTERS = (
+    # Number of lines that were served from the cache
+    "hits",
+    # Number of reads that went to the flash
+    "misses",
+)
+
+
+class LineCache(Component):  # type: ignore[misc]
+    """
+    Direct-mapped cache of lines of the flash, between a reader and a flash
+    controller. Has the read interface of the controllers on both sides,
+    so it can be put in front of either one.
+
+    When a read starts, and whenever it crosses into another line, the line
+    is looked up. Hits are served from the cache without starting a read on
+    the controller, so the first byte is available 3 cycles after i_read is
+    asserted. Bytes are delivered at the rate of the controller either way,
+    so a reader that's paced by the controller, like Player, plays at the same
+    rate.
+
+    On a miss, a read is started on the controller from the missing address,
+    and its bytes are passed on to the reader. This read continues until the
+    reader stops, even through lines that are cached. Every line that's
+    read in full is stored, replacing the line that it maps to. So clips
+    that are meant to be cached should start at the beginning of a line.
+    The controllers finish the command of a read even if it's stopped, so
+    a new read is only started once i_spi_busy is deasserted.
+    """
+
+    def __init__(
+        self,
+        flash_params: spi_flash.FlashParams
+        | qspi_flash_dtr.FlashParams = spi_flash.FlashParams(),
+        *,
+        lines: int = 16,
+        line_bytes: int = 16,
+        perf_counters: bool = False,
+    ) -> None:
+        assert lines > 0 and lines & (lines - 1) == 0
+        # A line is invalidated on its first byte, and validated on its last
+        assert line_bytes > 1 and line_bytes & (line_bytes - 1) == 0
+        # The next byte is read from the memory while the timer runs
+        assert flash_params.cycles_per_byte > 1
+        address_shape = unsigned(flash_params.address_width_bits)
+        super().__init__(
+            {
+                # Interface to the reader
+                "i_read": In(1),
+                "i_address": In(address_shape),
+                "o_data": Out(unsigned(8), init=0),
+                "o_data_valid": Out(1, init=0),
+                # Interface to the SPI controller
+                "o_spi_read": Out(1),
+                "o_spi_address": Out(address_shape, init=0),
+                "i_spi_data_valid": In(1),
+                "i_spi_data": In(unsigned(8)),
+                # Whether the controller is in the middle of a read. This is
+                # the inverse of its chip-select.
+                "i_spi_busy": In(1),
+                **(perf_counter_members(PERF_COUNTERS) if perf_counters else {}),
+            }
+        )
+        self._lines = lines
+        self._line_bytes = line_bytes
+        self._cycles_per_byte = flash_params.cycles_per_byte
+        self._perf_counters = perf_counters
+
+    @property
+    def lines(self) -> int:
+        return self._lines
+
+    @property
+    def line_bytes(self) -> int:
+        return self._line_bytes
+
+    @property
+    def size_bytes(self) -> int:
+        return self.lines * self.line_bytes
+
+    @property
+    def perf_counters(self) -> bool:
+        return self._perf_counters
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        offset_bits = (self.line_bytes - 1).bit_length()
+        index_bits = (self.lines - 1).bit_length()
+        tag_bits = len(self.i_address) - offset_bits - index_bits
+        assert tag_bits > 0
+
+        m.submodules.data = data = Memory(
+            shape=unsigned(8), depth=self.size_bytes, init=[]
+        )
+        m.submodules.tags = tags = Memory(
+            shape=unsigned(tag_bits), depth=self.lines, init=[]
+        )
+        data_read = data.read_port()
+        data_write = data.write_port()
+        tag_read = tags.read_port(domain="comb")
+        tag_write = tags.write_port()
+
+        # Cleared on reset, unlike the memories
+        valid = Signal(self.lines, init=0)
+
+        # Address of the next byte to deliver
+        address = Signal.like(self.i_address)
+        offset = address[:offset_bits]
+        index = address[offset_bits : offset_bits + index_bits]
+        tag = address[offset_bits + index_bits :]
+        last_in_line = offset == self.line_bytes - 1
+
+        hit = Signal()
+        m.d.comb += [
+            tag_read.addr.eq(index),
+            hit.eq(valid.bit_select(index, 1) & (tag_read.data == tag)),
+            data_read.addr.eq(address),
+            data_write.addr.eq(address),
+            data_write.data.eq(self.i_spi_data),
+            tag_write.addr.eq(index),
+            tag_write.data.eq(tag),
+        ]
+
+        # Cycles until the next byte is delivered from the cache
+        byte_timer = Signal(range(self._cycles_per_byte), init=0)
+        # Whether the bytes received from the controller are stored
+        filling = Signal()
+
+        # Ensure the valid signal is asserted only for a single clock
+        m.d.sync += self.o_data_valid.eq(0)
+
+        with m.FSM() as fsm:
+            with m.State("Idle"):
+                with m.If(self.i_read):
+                    m.d.sync += [
+                        address.eq(self.i_address),
+                        byte_timer.eq(0),
+                    ]
+                    m.next = "Lookup"
+
+            with m.State("Lookup"):
+                with m.If(byte_timer != 0):
+                    m.d.sync += byte_timer.eq(byte_timer - 1)
+
+                with m.If(~self.i_read):
+                    m.next = "Idle"
+                with m.Elif(hit):
+                    # The read port has the byte on the next cycle
+                    m.next = "Hit"
+                with m.Elif(~self.i_spi_busy):
+                    # Lines are only stored if they're read from the start
+                    m.d.sync += [
+                        self.o_spi_address.eq(address),
+                        filling.eq(0),
+                    ]
+                    m.next = "Miss"
+
+            with m.State("Hit"):
+                with m.If(~self.i_read):
+                    m.next = "Idle"
+                with m.Elif(byte_timer == 0):
+                    m.d.sync += [
+                        self.o_data.eq(data_read.data),
+                        self.o_data_valid.eq(1),
+                        address.eq(address + 1),
+                        byte_timer.eq(self._cycles_per_byte - 1),
+                    ]
+                    with m.If(last_in_line):
+                        m.next = "Lookup"
+                with m.Else():
+                    m.d.sync += byte_timer.eq(byte_timer - 1)
+
+            with m.State("Miss"):
+                m.d.comb += self.o_spi_read.eq(self.i_read)
+
+                with m.If(~self.i_read):
+                    m.next = "Idle"
+                with m.Elif(self.i_spi_data_valid):
+                    m.d.sync += [
+                        self.o_data.eq(self.i_spi_data),
+                        self.o_data_valid.eq(1),
+                        address.eq(address + 1),
+                    ]
+                    with m.If(filling | (offset == 0)):
+                        m.d.comb += data_write.en.eq(1)
+                        m.d.sync += filling.eq(1)
+                        # The line is invalid until all of it is stored
+                        with m.If(offset == 0):
+                            m.d.sync += valid.bit_select(index, 1).eq(0)
+                        with m.If(last_in_line):
+                            m.d.comb += tag_write.en.eq(1)
+                            m.d.sync += valid.bit_select(index, 1).eq(1)
+
+        if self.perf_counters:
+            lookup = Signal()
+            # A miss may be looked up until the controller is free
+            m.d.comb += lookup.eq(
+                fsm.ongoing("Lookup") & self.i_read & (hit | ~self.i_spi_busy)
+            )
+            with m.If(self.i_perf_clear):
+                for name in PERF_COUNTERS:
+                    m.d.sync += getattr(self, f"o_perf_{name}").eq(0)
+            with m.Elif(lookup & hit):
+                m.d.sync += self.o_perf_hits.eq(self.o_perf_hits + 1)
+            with m.Elif(lookup):
+                m.d.sync += self.o_perf_misses.eq(self.o_perf_misses + 1)
+
+        return m
@@ -0,0 +1,297 @@
+import math
+from typing import Any
+
+from amaranth import Cat, Module, ResetInserter, Signal, unsigned
+from amaranth.lib.data import ArrayLayout
+from amaranth.lib.fifo import SyncFIFO
+from amaranth.lib.wiring import Component, In, Out
+
+from . import qspi_flash_dtr, spi_flash
+
+VOICES = 2
+
+# The value of a sample when a voice is silent
+SILENCE = 1 << 7
+
+
+class Mixer(Component):  # type: ignore[misc]
+    """
+    Plays two voices at once through a single flash controller, and sums
+    them into o_digital, saturating at the limits of the samples.
+
+    Asserting i_start for a voice (re)starts it, playing the frames in
+    [i_start_address, i_end_address). The addresses must be multiples of
+    the frame size. Setting the end to the start plays the whole address
+    space.
+
+    The voices take turns reading bursts of burst_frames from the
+    controller into their FIFOs, and a frame of each voice is mixed every
+    frame_period_cycles. A voice asks for a burst whenever its FIFO has
+    room for one, and the voice that wasn't read last goes first, so
+    a voice waits for at most one burst of the other voice. Every burst
+    is a new read, so the latency of the controller is paid on every one.
+    The constructor checks that both voices are kept fed given the timing
+    of the controller, which is why the DTR controller is the default.
+    A configured QSPIFlashDTR has the same read interface as SPIFlash.
+    """
+
+    def __init__(
+        self,
+        *,
+        flash_params: (
+            spi_flash.FlashParams | qspi_flash_dtr.FlashParams
+        ) = qspi_flash_dtr.FlashParams(),
+        channels: int = 2,
+        frame_period_cycles: int,
+        burst_frames: int,
+    ) -> None:
+        assert channels > 0
+        assert frame_period_cycles > 0
+        assert burst_frames > 0
+
+        # The read is deasserted for a cycle after a burst, the controller
+        # deasserts chip-select on the next one, the next voice is picked on
+        # the cycle after that, and the controller sees the read on the next
+        # edge.
+        self._burst_cycles = (
+            4
+            + flash_params.cycles_until_first_read_byte
+            + (burst_frames * channels - 1) * flash_params.cycles_per_byte
+        )
+        # When both voices are playing, each one gets a burst at least once
+        # in this many cycles, and has to play at least as many frames as
+        # it reads.
+        round_cycles = VOICES * self._burst_cycles
+        assert round_cycles <= burst_frames * frame_period_cycles, (
+            f"Bursts of {burst_frames} frames take {self._burst_cycles} cycles, "
+            f"which is too slow for a frame every {frame_period_cycles} cycles"
+        )
+        # A voice asks for a burst when it has room for one. It gets all the
+        # frames of the burst within a round, and plays at most one frame
+        # more than fits in the round until then.
+        self._fifo_depth = (
+            burst_frames + math.ceil(round_cycles / frame_period_cycles) + 1
+        )
+
+        address_shape = unsigned(flash_params.address_width_bits)
+        super().__init__(
+            {
+                "i_start": In(VOICES),
+                "i_start_address": In(ArrayLayout(address_shape, VOICES)),
+                "i_end_address": In(ArrayLayout(address_shape, VOICES)),
+                "o_busy": Out(VOICES),
+                # Interface to the SPI controller
+                "o_spi_read": Out(1, init=0),
+                "o_spi_address": Out(address_shape, init=0),
+                "i_spi_data_valid": In(1),
+                "i_spi_data": In(unsigned(8)),
+                # Whether the controller is in the middle of a read, which
+                # it may finish even if o_spi_read is deasserted. This is the
+                # inverse of its chip-select.
+                "i_spi_busy": In(1),
+                # Interface to the DACs
+                "o_digital": Out(
+                    ArrayLayout(unsigned(8), channels), init=[0] * channels
+                ),
+            }
+        )
+        self._frame_period_cycles = frame_period_cycles
+        self._burst_frames = burst_frames
+
+    @property
+    def channels(self) -> int:
+        return len(self.o_digital)
+
+    @property
+    def frame_period_cycles(self) -> int:
+        return self._frame_period_cycles
+
+    @property
+    def burst_frames(self) -> int:
+        return self._burst_frames
+
+    @property
+    def burst_cycles(self) -> int:
+        """
+        Worst-case cycles from the end of a burst until the last byte
+        of the next one.
+        """
+        return self._burst_cycles
+
+    @property
+    def fifo_depth(self) -> int:
+        """
+        Frames buffered for each voice.
+        """
+        return self._fifo_depth
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        frame_layout = ArrayLayout(unsigned(8), self.channels)
+        silent_frame = frame_layout.const([SILENCE] * self.channels)
+
+        # Starting a voice drops whatever it had buffered
+        fifos = []
+        for voice in range(VOICES):
+            fifo = ResetInserter(self.i_start[voice])(
+                SyncFIFO(width=frame_layout.size, depth=self.fifo_depth)
+            )
+            m.submodules[f"fifo_{voice}"] = fifo
+            fifos.append(fifo)
+
+        # Voices that have frames left to read
+        reading = Signal(VOICES, init=0)
+        # Voices that take frames from their FIFO
+        playing = Signal(VOICES, init=0)
+        # Address of the next frame to read, and the end of the voice
+        address = Signal(ArrayLayout(self.o_spi_address.shape(), VOICES))
+        end_address = Signal.like(address)
+
+        # Voices that can take a burst
+        hungry = Signal(VOICES)
+        for voice, fifo in enumerate(fifos):
+            m.d.comb += hungry[voice].eq(
+                reading[voice]
+                & ~self.i_start[voice]
+                & (fifo.level <= fifo.depth - self.burst_frames)
+            )
+
+        m.d.comb += self.o_busy.eq(reading | playing)
+
+        #
+        # Reading bursts
+        #
+
+        current = Signal(range(VOICES), init=0)
+        frames_left = Signal(range(self.burst_frames), init=0)
+        received_samples = Signal(range(self.channels))
+        buffer = Signal(ArrayLayout(unsigned(8), self.channels - 1))
+        next_address = Signal.like(self.o_spi_address)
+        push = Signal()
+
+        m.d.comb += next_address.eq(address[current] + self.channels)
+        for voice, fifo in enumerate(fifos):
+            m.d.comb += [
+                fifo.w_data.eq(Cat(buffer, self.i_spi_data)),
+                fifo.w_en.eq(push & (current == voice)),
+            ]
+
+        def start_burst(voice: Any) -> None:
+            m.d.sync += [
+                current.eq(voice),
+                frames_left.eq(self.burst_frames - 1),
+                received_samples.eq(0),
+                self.o_spi_address.eq(address[voice]),
+                self.o_spi_read.eq(1),
+            ]
+            m.next = "Burst"
+
+        with m.FSM():
+            with m.State("Idle"):
+                # The controller doesn't stop a read until it gets to the
+                # data, so a burst that was cut short may still be going.
+                # With two voices, the next one is the one that wasn't
+                # read last.
+                other = ~current
+                with m.If(~self.i_spi_busy):
+                    with m.If(hungry.bit_select(other, 1)):
+                        start_burst(other)
+                    with m.Elif(hungry.bit_select(current, 1)):
+                        start_burst(current)
+
+            with m.State("Burst"):
+                # A restarted voice doesn't want the rest of the burst
+                with m.If(self.i_start.bit_select(current, 1)):
+                    m.d.sync += self.o_spi_read.eq(0)
+                    m.next = "Idle"
+                with m.Elif(self.i_spi_data_valid):
+                    with m.If(received_samples == self.channels - 1):
+                        m.d.comb += push.eq(1)
+                        m.d.sync += [
+                            address[current].eq(next_address),
+                            received_samples.eq(0),
+                            frames_left.eq(frames_left - 1),
+                        ]
+                        with m.If(next_address == end_address[current]):
+                            m.d.sync += [
+                                reading.bit_select(current, 1).eq(0),
+                                self.o_spi_read.eq(0),
+                            ]
+                            m.next = "Idle"
+                        with m.Elif(frames_left == 0):
+                            m.d.sync += self.o_spi_read.eq(0)
+                            m.next = "Idle"
+                    with m.Else():
+                        m.d.sync += [
+                            buffer[received_samples].eq(self.i_spi_data),
+                            received_samples.eq(received_samples + 1),
+                        ]
+
+        #
+        # Playback. Every voice starts playing once its FIFO has no room
+        # for another burst, or once it has nothing left to read.
+        #
+
+        frame_timer = Signal(range(self.frame_period_cycles), init=0)
+        with m.If(frame_timer == 0):
+            m.d.sync += frame_timer.eq(self.frame_period_cycles - 1)
+        with m.Else():
+            m.d.sync += frame_timer.eq(frame_timer - 1)
+
+        frames = Signal(
+            ArrayLayout(frame_layout, VOICES),
+            init=[[SILENCE] * self.channels] * VOICES,
+        )
+
+        for voice, fifo in enumerate(fifos):
+            # Whether the voice can start playing
+            ready = (fifo.level > fifo.depth - self.burst_frames) | (
+                ~reading[voice] & fifo.r_rdy
+            )
+
+            with m.If(self.i_start[voice]):
+                m.d.sync += [
+                    address[voice].eq(self.i_start_address[voice]),
+                    end_address[voice].eq(self.i_end_address[voice]),
+                    reading[voice].eq(1),
+                    playing[voice].eq(0),
+                    frames[voice].eq(silent_frame),
+                ]
+            with m.Elif((frame_timer == 0) & (playing[voice] | ready)):
+                with m.If(fifo.r_rdy):
+                    m.d.comb += fifo.r_en.eq(1)
+                    m.d.sync += [
+                        frames[voice].eq(fifo.r_data),
+                        playing[voice].eq(1),
+                    ]
+                with m.Elif(~reading[voice]):
+                    # Done. If the FIFO ran dry while reading, the last
+                    # frame is repeated instead.
+                    m.d.sync += [
+                        playing[voice].eq(0),
+                        frames[voice].eq(silent_frame),
+                    ]
+
+        #
+        # Mixing. The samples are offset by SILENCE, so the sum is offset
+        # by it once for every voice.
+        #
+
+        with m.If(~playing.any()):
+            m.d.sync += self.o_digital.eq(0)  # Quiet down
+        with m.Else():
+            for channel in range(self.channels):
+                total = Signal(range(VOICES * 256))
+                m.d.comb += total.eq(
+                    sum(frames[voice][channel] for voice in range(VOICES))
+                )
+                offset = (VOICES - 1) * SILENCE
+                with m.If(total < offset):
+                    m.d.sync += self.o_digital[channel].eq(0)
+                with m.Elif(total > offset + 255):
+                    m.d.sync += self.o_digital[channel].eq(255)
+                with m.Else():
+                    m.d.sync += self.o_digital[channel].eq(total - offset)
+
+        return m
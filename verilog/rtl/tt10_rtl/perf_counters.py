@@ -0,0 +1,86 @@
+"""
+Performance counters, enabled at elaboration time, shared by the flash
+controllers and the modules in front of them.
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+from amaranth import Module, Signal, unsigned
+from amaranth.hdl import ValueLike
+from amaranth.lib.wiring import In, Out
+
+PERF_COUNTER_WIDTH_BITS = 32
+
+# The counters of the flash controllers
+PERF_COUNTERS = (
+    # Number of reads started
+    "reads",
+    # Cycles from the assertion of i_read until the first byte of
+    # the last read was available on o_data
+    "first_byte_cycles",
+    # Number of bytes delivered
+    "bytes",
+    # Cycles spent idle, waiting for a read
+    "idle_cycles",
+)
+
+
+def perf_counter_members(names: Iterable[str]) -> dict[str, Any]:
+    """
+    The members of a component with the given counters: an o_perf_<name>
+    output for every one, and i_perf_clear.
+    """
+    return {
+        # Clears all the counters
+        "i_perf_clear": In(1),
+        **{
+            f"o_perf_{name}": Out(unsigned(PERF_COUNTER_WIDTH_BITS), init=0)
+            for name in names
+        },
+    }
+
+
+def elaborate_controller_perf_counters(
+    m: Module,
+    controller: Any,
+    *,
+    read_start: ValueLike,
+    idle: ValueLike,
+    data_valid: ValueLike,
+) -> None:
+    """
+    Adds performance counters to the controller's module.
+    The counters wrap around on overflow.
+
+    :param read_start: Asserted when the controller starts a read.
+    :param idle: Asserted when the controller is idle and doesn't start a read.
+    :param data_valid: Asserted when there's a new byte on o_data.
+    """
+
+    first_byte_pending = Signal(init=0)
+    first_byte_cycles = Signal.like(controller.o_perf_first_byte_cycles)
+
+    with m.If(read_start):
+        m.d.sync += [
+            controller.o_perf_reads.eq(controller.o_perf_reads + 1),
+            first_byte_pending.eq(1),
+            first_byte_cycles.eq(1),
+        ]
+    with m.Elif(first_byte_pending):
+        m.d.sync += first_byte_cycles.eq(first_byte_cycles + 1)
+
+    with m.If(idle):
+        m.d.sync += controller.o_perf_idle_cycles.eq(controller.o_perf_idle_cycles + 1)
+
+    with m.If(data_valid):
+        m.d.sync += controller.o_perf_bytes.eq(controller.o_perf_bytes + 1)
+        with m.If(first_byte_pending):
+            m.d.sync += [
+                controller.o_perf_first_byte_cycles.eq(first_byte_cycles),
+                first_byte_pending.eq(0),
+            ]
+
+    with m.If(controller.i_perf_clear):
+        for name in PERF_COUNTERS:
+            m.d.sync += getattr(controller, f"o_perf_{name}").eq(0)
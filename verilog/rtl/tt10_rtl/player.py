@@ -0,0 +1,250 @@
+from typing import Any
+
+from amaranth import Assert, Cat, Module, Signal, unsigned
+from amaranth.lib.data import ArrayLayout
+from amaranth.lib.fifo import SyncFIFO
+from amaranth.lib.wiring import Component, In, Out
+
+from .perf_counters import perf_counter_members
+
+PERF_COUNTERS = (
+    # Number of frame periods in which the buffer was empty, so the last
+    # frame was repeated
+    "underruns",
+)
+
+
+class Player(Component):  # type: ignore[misc]
+    """
+    Plays frames of samples, one for each channel, read from consecutive
+    addresses through a flash controller. Works with both SPIFlash and
+    QSPIFlashDTR.
+
+    By default, a frame is output as soon as it's read, so the playback
+    rate is the rate of the controller.
+
+    With buffer_frames, frames are read ahead into a FIFO, and output
+    every frame_period_cycles. This allows looping over the region
+    [i_loop_start, i_loop_end) while i_loop is asserted: when the end is
+    reached, a new read is started at the beginning of the region while
+    the buffer is still playing, so no frames are dropped. This requires
+    the controller to deliver frames faster than frame_period_cycles,
+    and the buffer to last longer than it takes the controller to start
+    a new read and deliver a frame from it. A few frames more than that
+    cover the restarts that happen whenever the buffer fills up.
+
+    With perf_counters, the buffered player counts the frame periods in
+    which the buffer ran dry. Unbuffered, frames are output at the rate
+    they're read, so there's nothing to count.
+    """
+
+    def __init__(
+        self,
+        *,
+        spi_address_width_bits: int = 24,
+        channels: int = 2,
+        buffer_frames: int = 0,
+        frame_period_cycles: int | None = None,
+        perf_counters: bool = False,
+    ) -> None:
+        assert spi_address_width_bits > 0
+        assert channels > 0
+        # A single frame can't be read while another one is playing
+        assert buffer_frames == 0 or buffer_frames >= 2
+        assert (frame_period_cycles is not None) == (buffer_frames > 0)
+        assert frame_period_cycles is None or frame_period_cycles > 0
+        assert not perf_counters or buffer_frames > 0
+        super().__init__(
+            {
+                "i_play": In(1),
+                "o_busy": Out(1),
+                # Interface to the SPI controller
+                "o_spi_read": Out(1, init=0),
+                "o_spi_address": Out(unsigned(spi_address_width_bits), init=0),
+                "i_spi_data_valid": In(1),
+                "i_spi_data": In(unsigned(8)),
+                # Interface to the DACs,
+                "o_digital": Out(ArrayLayout(unsigned(8), channels), init=[0, 0]),
+                # Asserted for a single cycle when there's a new frame on o_digital
+                "o_digital_valid": Out(1, init=0),
+                **(
+                    {
+                        # Loop region, sampled whenever a frame is read
+                        "i_loop": In(1),
+                        "i_loop_start": In(unsigned(spi_address_width_bits)),
+                        "i_loop_end": In(unsigned(spi_address_width_bits)),
+                    }
+                    if buffer_frames
+                    else {}
+                ),
+                **(perf_counter_members(PERF_COUNTERS) if perf_counters else {}),
+            }
+        )
+        self._buffer_frames = buffer_frames
+        self._frame_period_cycles = frame_period_cycles
+        self._perf_counters = perf_counters
+
+    @property
+    def channels(self) -> int:
+        return len(self.o_digital)
+
+    @property
+    def buffer_frames(self) -> int:
+        return self._buffer_frames
+
+    @property
+    def frame_period_cycles(self) -> int | None:
+        return self._frame_period_cycles
+
+    @property
+    def perf_counters(self) -> bool:
+        return self._perf_counters
+
+    def elaborate(self, platform: Any) -> Module:
+        if self.buffer_frames:
+            return self._elaborate_buffered()
+
+        m = Module()
+
+        received_samples = Signal(range(self.channels))
+        buffer = Signal(ArrayLayout(unsigned(8), self.channels - 1))
+
+        m.d.sync += self.o_digital_valid.eq(0)
+
+        with m.FSM() as fsm:
+            with m.State("Paused"):
+                m.d.sync += Assert(received_samples == 0)
+                m.d.sync += self.o_digital.eq(0)  # Quiet down
+                with m.If(self.i_play):
+                    m.next = "Playing"
+
+            with m.State("Playing"):
+                m.d.comb += self.o_spi_read.eq(1)
+
+                with m.If(self.i_spi_data_valid):
+                    with m.If(received_samples == self.channels - 1):
+                        m.d.sync += [
+                            self.o_digital[:-1].eq(buffer),
+                            self.o_digital[-1].eq(self.i_spi_data),
+                            self.o_digital_valid.eq(1),
+                            self.o_spi_address.eq(self.o_spi_address + self.channels),
+                            received_samples.eq(0),
+                        ]
+                        with m.If(~self.i_play):
+                            m.next = "Paused"
+                    with m.Else():
+                        m.d.sync += [
+                            buffer[received_samples].eq(self.i_spi_data),
+                            received_samples.eq(received_samples + 1),
+                        ]
+
+        m.d.comb += self.o_busy.eq(~fsm.ongoing("Paused"))
+
+        return m
+
+    def _elaborate_buffered(self) -> Module:
+        m = Module()
+
+        assert self.frame_period_cycles is not None
+
+        m.submodules.fifo = fifo = SyncFIFO(
+            width=self.o_digital.shape().size, depth=self.buffer_frames
+        )
+
+        #
+        # Playback. Once the buffer is full, a frame is taken from it
+        # every frame_period_cycles.
+        #
+
+        frame_timer = Signal(range(self.frame_period_cycles), init=0)
+
+        m.d.sync += self.o_digital_valid.eq(0)
+
+        with m.FSM() as fsm:
+            with m.State("Paused"):
+                m.d.sync += self.o_digital.eq(0)  # Quiet down
+                with m.If(self.i_play):
+                    m.next = "Filling"
+
+            with m.State("Filling"):
+                with m.If(~self.i_play):
+                    m.next = "Paused"
+                with m.Elif(~fifo.w_rdy):
+                    m.d.sync += frame_timer.eq(0)
+                    m.next = "Playing"
+
+            with m.State("Playing"):
+                with m.If(frame_timer == 0):
+                    m.d.sync += frame_timer.eq(self.frame_period_cycles - 1)
+                    # If the buffer ran dry, the last frame is repeated
+                    with m.If(fifo.r_rdy):
+                        m.d.comb += fifo.r_en.eq(1)
+                        m.d.sync += [
+                            self.o_digital.eq(fifo.r_data),
+                            self.o_digital_valid.eq(1),
+                        ]
+                    if self.perf_counters:
+                        with m.Else():
+                            m.d.sync += self.o_perf_underruns.eq(
+                                self.o_perf_underruns + 1
+                            )
+                    with m.If(~self.i_play):
+                        m.next = "Paused"
+                with m.Else():
+                    m.d.sync += frame_timer.eq(frame_timer - 1)
+
+        m.d.comb += self.o_busy.eq(~fsm.ongoing("Paused"))
+
+        if self.perf_counters:
+            with m.If(self.i_perf_clear):
+                for name in PERF_COUNTERS:
+                    m.d.sync += getattr(self, f"o_perf_{name}").eq(0)
+
+        #
+        # Reading. o_spi_address is the address of the next frame to read.
+        # The read is stopped when the buffer can't take another frame, and
+        # restarted at the beginning of the loop when its end is reached.
+        # Both take deasserting o_spi_read for a cycle. A frame that was
+        # being read when playback is paused is read again on resume.
+        #
+
+        received_samples = Signal(range(self.channels))
+        buffer = Signal(ArrayLayout(unsigned(8), self.channels - 1))
+        next_address = Signal.like(self.o_spi_address)
+
+        m.d.comb += [
+            fifo.w_data.eq(Cat(buffer, self.i_spi_data)),
+            next_address.eq(self.o_spi_address + self.channels),
+        ]
+
+        with m.If(fsm.ongoing("Paused")):
+            m.d.sync += [
+                self.o_spi_read.eq(0),
+                received_samples.eq(0),
+            ]
+        with m.Elif(~self.o_spi_read):
+            with m.If(fifo.w_rdy):
+                m.d.sync += self.o_spi_read.eq(1)
+        with m.Elif(self.i_spi_data_valid):
+            with m.If(received_samples == self.channels - 1):
+                m.d.sync += Assert(fifo.w_rdy)
+                m.d.comb += fifo.w_en.eq(1)
+                m.d.sync += received_samples.eq(0)
+
+                with m.If(self.i_loop & (next_address >= self.i_loop_end)):
+                    m.d.sync += [
+                        self.o_spi_address.eq(self.i_loop_start),
+                        self.o_spi_read.eq(0),
+                    ]
+                with m.Else():
+                    m.d.sync += self.o_spi_address.eq(next_address)
+                    # Make sure there's room for the next frame
+                    with m.If(fifo.level + 1 == fifo.depth):
+                        m.d.sync += self.o_spi_read.eq(0)
+            with m.Else():
+                m.d.sync += [
+                    buffer[received_samples].eq(self.i_spi_data),
+                    received_samples.eq(received_samples + 1),
+                ]
+
+        return m
@@ -0,0 +1,518 @@
+from dataclasses import dataclass, replace
+from typing import Any
+
+from amaranth import (
+    Array,
+    Assert,
+    Cat,
+    ClockDomain,
+    ClockSignal,
+    Const,
+    Module,
+    Mux,
+    ResetSignal,
+    Signal,
+    unsigned,
+)
+from amaranth.lib.wiring import Component, In, Out
+
+from .perf_counters import (
+    PERF_COUNTERS,
+    elaborate_controller_perf_counters,
+    perf_counter_members,
+)
+
+# The read commands that take a 4-byte address, by their 3-byte counterparts
+FOUR_BYTE_READ_COMMANDS = {
+    0xED: 0xEE,  # FAST READ QUAD I/O DTR
+}
+
+# Read during calibration, which must be programmed into the flash at
+# FlashParams.calibration_address. Both nibbles of every byte differ from
+# their neighbors, so sampling a nibble early or late always corrupts it.
+CALIBRATION_PATTERN = bytes([0x0F, 0xF0, 0x5A, 0xA5, 0x3C, 0xC3, 0x96, 0x69])
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class FlashParams:
+    command_width_bits: int = 8
+    address_width_bits: int = 24
+    rsten_command: int = 0x66
+    rst_command: int = 0x99
+    read_command: int = 0xED
+    read_dummy_cycles: int = 15
+    # Largest delay of the sampling of the data from the flash, in half cycles
+    # of the module clock. If nonzero, the controller can be calibrated.
+    # See QSPIFlashDTR.
+    max_sample_delay: int = 0
+    # The last bytes of a 16 MiB flash. Smaller flashes wrap the address
+    # around, so that's the end of those as well.
+    calibration_address: int = (1 << 24) - len(CALIBRATION_PATTERN)
+
+    def __post_init__(self) -> None:
+        assert self.command_width_bits > 0
+
+        assert self.address_width_bits > 0
+        # This assertion makes the mode bits implementation easier.
+        # See the FSM implementation for more info.
+        assert self.address_width_bits % 8 == 0
+
+        assert self.rsten_command.bit_length() <= self.command_width_bits
+        assert self.rst_command.bit_length() <= self.command_width_bits
+
+        # This makes the implementation easier, since we don't need to
+        # special-case when there's only 1 dummy cycle, which overlaps
+        # with the mode bits.
+        assert self.read_dummy_cycles > 1
+
+        assert self.max_sample_delay >= 0
+        assert 0 <= self.calibration_address < (1 << self.address_width_bits)
+
+    def with_four_byte_address(self) -> "FlashParams":
+        """
+        The same read, with a 4-byte address, for flashes larger than 16 MiB.
+        This uses the variant of the command that always takes a 4-byte
+        address, instead of switching the flash to 4-byte address mode,
+        which the software reset in the configuration sequence would undo.
+        """
+        assert self.address_width_bits == 24
+        return replace(
+            self,
+            address_width_bits=32,
+            read_command=FOUR_BYTE_READ_COMMANDS[self.read_command],
+        )
+
+    @property
+    def cycles_until_first_read_byte(self) -> int:
+        """
+        Depends only on the parameters, so it can be used without
+        instantiating the controller. With a sample delay, the first byte
+        comes later by sample_delay_cycles.
+        """
+        command_clocks = (
+            # The command is send in 1S mode (1 line, 1 bit per clock)
+            self.command_width_bits
+            # The address is sent in 4D mode (4 lines DTR), so 8 bits per clock
+            + self.address_width_bits // 8
+            + self.read_dummy_cycles
+        )
+        return (
+            # Two cycles to transition from "Idle" to start sending the command
+            2
+            # The command is at the SPI clock, so 2 cycles of the main clock
+            + 2 * command_clocks
+            # The "Read" state is entered on the falling edge of the SPI clock,
+            # but the first data arrives only on the next rising edge. Skip it.
+            + 1
+            # It takes 2 clocks (1 SPI clock) for the first byte to be assembled.
+            # After this, a new byte arrives every 2 clocks.
+            + 2
+        )
+
+    @staticmethod
+    def sample_delay_cycles(sample_delay: int) -> int:
+        """
+        Cycles by which a sample delay, in half cycles, delays the bytes.
+        """
+        return (sample_delay + 1) // 2
+
+    @property
+    def cycles_per_byte(self) -> int:
+        """
+        Cycles between consecutive bytes during a read. A byte takes a single
+        SPI clock, which is 2 cycles of the main clock.
+        """
+        return 2
+
+
+class QSPIFlashDTR(Component):  # type: ignore[misc]
+    """
+    With a nonzero max_sample_delay, the data from the flash can be sampled
+    later than the edge of SCLK that follows the one it's sent on, so that
+    SCLK can be faster than the delay of the pads and the board would
+    otherwise allow. The delay is set by asserting i_calibrate while idle:
+    CALIBRATION_PATTERN is read with every delay from 0 to max_sample_delay,
+    and the delay at the center of the widest range of delays that read it
+    correctly is kept. o_calibrate_done is asserted for a single cycle when
+    that's done, along with o_calibrate_ok if any delay worked. Otherwise,
+    the delay is 0. Don't read while calibrating.
+
+    Odd delays sample the data on the falling edge of the module clock.
+    """
+
+    def __init__(
+        self,
+        params: FlashParams = FlashParams(),
+        *,
+        perf_counters: bool = False,
+    ) -> None:
+        super().__init__(
+            {
+                "i_configure": In(1),
+                "o_configure_done": Out(1, init=0),
+                "i_read": In(1),
+                "i_address": In(unsigned(params.address_width_bits)),
+                "o_data": Out(unsigned(8), init=0),
+                "o_data_valid": Out(1, init=0),
+                "o_cs_n": Out(1, init=1),
+                "o_sclk": Out(1, init=1),
+                "i_io": In(4),
+                "o_io": Out(4, init=0),
+                "o_oe": Out(4, init=0),  # Set all lines to input (high-Z)
+                **(perf_counter_members(PERF_COUNTERS) if perf_counters else {}),
+                **(
+                    {
+                        "i_calibrate": In(1),
+                        "o_calibrate_done": Out(1, init=0),
+                        "o_calibrate_ok": Out(1, init=0),
+                        "o_sample_delay": Out(
+                            range(params.max_sample_delay + 1), init=0
+                        ),
+                    }
+                    if params.max_sample_delay
+                    else {}
+                ),
+            }
+        )
+        self._params = params
+        self._perf_counters = perf_counters
+
+    @property
+    def params(self) -> FlashParams:
+        return self._params
+
+    @property
+    def perf_counters(self) -> bool:
+        return self._perf_counters
+
+    @property
+    def cycles_until_first_read_byte(self) -> int:
+        return self._params.cycles_until_first_read_byte
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        #
+        # SPI clock. Half the frequency of the module clock.
+        #
+
+        with m.If(~self.o_cs_n):
+            m.d.sync += self.o_sclk.eq(~self.o_sclk)
+        with m.Else():
+            m.d.sync += self.o_sclk.eq(1)
+
+        stb_r = Signal()
+        m.d.comb += stb_r.eq(self.o_sclk)
+
+        stb_f = Signal()
+        m.d.comb += stb_f.eq(~self.o_sclk)
+
+        # The read request. Taken over by the calibration while it runs.
+        read = Signal()
+        read_address = Signal.like(self.i_address)
+        m.d.comb += [
+            read.eq(self.i_read),
+            read_address.eq(self.i_address),
+        ]
+
+        command_cycle = Signal(range(self._params.command_width_bits), init=0)
+        command = Signal(unsigned(self._params.command_width_bits))
+        address_cycle = Signal(range(self._params.address_width_bits // 4))
+        address = Signal(self.i_address.shape())
+        dummy_cycle = Signal(range(self._params.read_dummy_cycles))
+        read_buffer = Signal(unsigned(4))
+
+        # o_data_valid is asserted for a single clock when there's a new byte
+        # on o_data. The first byte of a read is the first one that has both
+        # nibbles from the flash.
+        high_nibble_valid = Signal(init=0)
+        m.d.sync += self.o_data_valid.eq(0)
+
+        # For asserting that the delay is what we expect
+        read_cycles = Signal(unsigned(16), init=0)
+        m.d.sync += read_cycles.eq(read_cycles + 1)
+
+        def prepare_send_command(opcode: int, next_state: str) -> None:
+            m.d.sync += command_cycle.eq(0)
+            m.d.sync += command.eq(opcode)
+            m.d.sync += self.o_cs_n.eq(0)
+            m.next = next_state
+
+        def send_command(next_state: str) -> None:
+            with m.If(stb_r):
+                m.d.sync += self.o_oe[0].eq(1)
+                # Commands are sent MSB-first
+                m.d.sync += self.o_io[0].eq(command[-1])
+                m.d.sync += command.eq(command << 1)
+                with m.If(command_cycle == self._params.command_width_bits - 1):
+                    m.d.sync += command_cycle.eq(0)
+                    m.next = next_state
+                with m.Else():
+                    m.d.sync += command_cycle.eq(command_cycle + 1)
+
+        with m.FSM() as fsm:
+            with m.State("Idle"):
+                m.d.sync += Assert(self.o_cs_n)
+                m.d.sync += Assert(~self.o_data_valid)
+
+                m.d.sync += read_cycles.eq(0)
+                m.d.sync += high_nibble_valid.eq(0)
+
+                with m.If(self.i_configure):
+                    m.d.sync += self.o_configure_done.eq(0)
+                    prepare_send_command(self._params.rsten_command, "RSTEN send")
+                with m.Elif(read):
+                    m.d.sync += address.eq(read_address)
+                    m.d.sync += address_cycle.eq(0)
+                    prepare_send_command(self._params.read_command, "FRQDTR send")
+
+                    m.d.sync += read_cycles.eq(1)
+
+            with m.State("RSTEN send"):
+                send_command("RSTEN send done")
+
+            with m.State("RSTEN send done"):
+                with m.If(stb_r):
+                    m.d.sync += self.o_cs_n.eq(1)
+                    m.d.sync += self.o_sclk.eq(1)
+                    m.d.sync += self.o_oe[0].eq(0)
+                    m.next = "RST send start"
+
+            with m.State("RST send start"):
+                prepare_send_command(self._params.rst_command, "RST send")
+
+            with m.State("RST send"):
+                send_command("RST send done")
+
+            with m.State("RST send done"):
+                with m.If(stb_r):
+                    m.d.sync += self.o_cs_n.eq(1)
+                    m.d.sync += self.o_sclk.eq(1)
+                    m.d.sync += self.o_oe[0].eq(0)
+                    m.d.sync += self.o_configure_done.eq(1)
+                    m.next = "Config done"
+
+            with m.State("Config done"):
+                m.d.sync += self.o_configure_done.eq(0)
+                m.next = "Idle"
+
+            with m.State("FRQDTR send"):
+                send_command("FRQDTR send done")
+
+            with m.State("FRQDTR send done"):
+                with m.If(stb_r):
+                    m.next = "Address send"
+
+            with m.State("Address send"):
+                # The address is sent on both edges of the clock.
+                m.d.sync += self.o_oe.eq(0xF)
+                # Send the next 4 MSBits
+                m.d.sync += self.o_io.eq(address[-4:])
+                m.d.sync += address.eq(address << 4)
+                with m.If(address_cycle == self._params.address_width_bits // 4 - 1):
+                    m.d.sync += address_cycle.eq(0)
+                    # The next state assumes it's starting on a falling edge.
+                    m.d.sync += Assert(stb_r)
+                    m.next = "Mode bits"
+                with m.Else():
+                    m.d.sync += address_cycle.eq(address_cycle + 1)
+
+            with m.State("Mode bits"):
+                # Explicitly drive 0 for the mode bits, since we don't
+                # want continuous reading without a command.
+                # It's easier this way.
+                m.d.sync += self.o_io.eq(0)
+
+                # We checked that the address is a multiple of 8 bits,
+                # which means that we entered this state on the falling
+                # edge of the SPI clock. On the rising edge we drive
+                # the low 4 mode bits, and move on to the next state.
+                with m.If(stb_r):
+                    m.d.sync += dummy_cycle.eq(1)
+                    m.next = "Dummy cycles"
+
+            with m.State("Dummy cycles"):
+                m.d.sync += self.o_oe.eq(0)
+                with m.If(stb_r):
+                    with m.If(dummy_cycle == self._params.read_dummy_cycles - 1):
+                        m.d.sync += Assert(
+                            # We're on the rising edge of the last dummy cycle.
+                            # The next byte will *begin* transmitting on the next
+                            # rising edge, so after 2 main clock ticks.
+                            # After 2 more ticks (1 SPI clock), the full byte
+                            # will have been read.
+                            read_cycles == self.cycles_until_first_read_byte - 4
+                        )
+
+                        m.d.sync += dummy_cycle.eq(0)
+                        m.next = "Read"
+                    with m.Else():
+                        m.d.sync += dummy_cycle.eq(dummy_cycle + 1)
+
+            with m.State("Read"):
+                with m.If(~read):
+                    m.d.sync += self.o_cs_n.eq(1)
+                    m.d.sync += self.o_sclk.eq(1)
+                    m.next = "Idle"
+
+        #
+        # Sampling the data. The high nibble of a byte is sampled on the
+        # falling edge of SCLK, and the low nibble on the rising edge,
+        # each on the edge after the one the flash sends it on.
+        #
+
+        reading = fsm.ongoing("Read") & read
+        sample_high = Signal()
+        sample_low = Signal()
+        io_in = Signal.like(self.i_io)
+
+        if self._params.max_sample_delay:
+            # The samples are taken the given number of half cycles later.
+            # Whole cycles are a delay of the strobes, and a half cycle is
+            # sampling on the falling edge of the module clock beforehand.
+            m.domains.sample = cd_sample = ClockDomain(clk_edge="neg", local=True)
+            m.d.comb += [
+                cd_sample.clk.eq(ClockSignal()),
+                cd_sample.rst.eq(ResetSignal()),
+            ]
+            io_neg = Signal.like(self.i_io)
+            m.d.sample += io_neg.eq(self.i_io)
+
+            delay = self.o_sample_delay
+            max_cycles = self._params.sample_delay_cycles(self._params.max_sample_delay)
+            high_strobes = Signal(max_cycles + 1)
+            low_strobes = Signal(max_cycles + 1)
+            m.d.comb += [
+                high_strobes[0].eq(reading & stb_r),
+                low_strobes[0].eq(reading & ~stb_r),
+            ]
+            m.d.sync += [
+                high_strobes[1:].eq(high_strobes[:-1]),
+                low_strobes[1:].eq(low_strobes[:-1]),
+            ]
+
+            # The strobes of a read that was stopped are dropped
+            delay_cycles = (delay + 1) >> 1
+            m.d.comb += [
+                sample_high.eq(reading & high_strobes.bit_select(delay_cycles, 1)),
+                sample_low.eq(reading & low_strobes.bit_select(delay_cycles, 1)),
+                io_in.eq(Mux(delay[0], io_neg, self.i_io)),
+            ]
+        else:
+            m.d.comb += [
+                sample_high.eq(reading & stb_r),
+                sample_low.eq(reading & ~stb_r),
+                io_in.eq(self.i_io),
+            ]
+
+        with m.If(sample_high):
+            m.d.sync += read_buffer.eq(io_in)
+            m.d.sync += high_nibble_valid.eq(1)
+        with m.If(sample_low):
+            # This is also the case upon first transitioning to the "Read"
+            # state, since we move immediately after counting the last dummy
+            # cycle on the previous rising edge. This means we sample the
+            # input lines before there's anything meaningful on them.
+            # This should be fine, since the user shouldn't be sampling *us*
+            # at this point anyway.
+            m.d.sync += self.o_data.eq(Cat(io_in, read_buffer))
+            m.d.sync += self.o_data_valid.eq(high_nibble_valid)
+
+        if self._params.max_sample_delay:
+            self._elaborate_calibration(m, read=read, read_address=read_address)
+
+        if self.perf_counters:
+            idle = fsm.ongoing("Idle") & ~self.i_configure
+            elaborate_controller_perf_counters(
+                m,
+                self,
+                read_start=idle & read,
+                idle=idle & ~read,
+                data_valid=self.o_data_valid,
+            )
+
+        return m
+
+    def _elaborate_calibration(
+        self, m: Module, *, read: Signal, read_address: Signal
+    ) -> None:
+        """
+        Reads the calibration pattern with every sample delay, and keeps the
+        one at the center of the widest range of delays that work.
+        """
+
+        pattern = Array(Const(byte, 8) for byte in CALIBRATION_PATTERN)
+        received = Signal(range(len(CALIBRATION_PATTERN)))
+        mismatch = Signal()
+
+        # The current range of delays that work, and the widest one so far.
+        # The range starts at the delay before the width is reached.
+        delay = self.o_sample_delay
+        width = Signal(range(self._params.max_sample_delay + 2))
+        best_start = Signal.like(delay)
+        best_width = Signal.like(width)
+        start = Signal.like(delay)
+        m.d.comb += start.eq(delay - width)
+
+        m.d.sync += self.o_calibrate_done.eq(0)
+
+        with m.FSM(name="calibration"):
+            with m.State("Idle"):
+                with m.If(self.i_calibrate):
+                    m.d.sync += [
+                        delay.eq(0),
+                        width.eq(0),
+                        best_width.eq(0),
+                        received.eq(0),
+                        mismatch.eq(0),
+                        self.o_calibrate_ok.eq(0),
+                    ]
+                    m.next = "Read"
+
+            with m.State("Read"):
+                m.d.comb += [
+                    read.eq(1),
+                    read_address.eq(self._params.calibration_address),
+                ]
+                with m.If(self.o_data_valid):
+                    with m.If(self.o_data != pattern[received]):
+                        m.d.sync += mismatch.eq(1)
+                    with m.If(received == len(CALIBRATION_PATTERN) - 1):
+                        m.next = "Check"
+                    with m.Else():
+                        m.d.sync += received.eq(received + 1)
+
+            with m.State("Check"):
+                # The read is stopped for this cycle
+                m.d.comb += read.eq(0)
+
+                with m.If(~mismatch):
+                    m.d.sync += width.eq(width + 1)
+                    with m.If(width + 1 > best_width):
+                        m.d.sync += [
+                            best_start.eq(start),
+                            best_width.eq(width + 1),
+                        ]
+                with m.Else():
+                    m.d.sync += width.eq(0)
+
+                m.d.sync += [
+                    received.eq(0),
+                    mismatch.eq(0),
+                ]
+                with m.If(delay == self._params.max_sample_delay):
+                    m.next = "Done"
+                with m.Else():
+                    m.d.sync += delay.eq(delay + 1)
+                    m.next = "Read"
+
+            with m.State("Done"):
+                with m.If(best_width != 0):
+                    m.d.sync += [
+                        delay.eq(best_start + ((best_width - 1) >> 1)),
+                        self.o_calibrate_ok.eq(1),
+                    ]
+                with m.Else():
+                    m.d.sync += delay.eq(0)
+                m.d.sync += self.o_calibrate_done.eq(1)
+                m.next = "Idle"
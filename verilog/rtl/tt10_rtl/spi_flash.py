@@ -0,0 +1,433 @@
+from dataclasses import dataclass, replace
+from typing import Any
+
+from amaranth import (
+    Assert,
+    ClockDomain,
+    ClockSignal,
+    Module,
+    ResetSignal,
+    Signal,
+    unsigned,
+)
+from amaranth.lib.wiring import Component, In, Out
+
+from .perf_counters import (
+    PERF_COUNTERS,
+    elaborate_controller_perf_counters,
+    perf_counter_members,
+)
+
+# The read commands that take a 4-byte address, by their 3-byte counterparts
+FOUR_BYTE_READ_COMMANDS = {
+    0x03: 0x13,  # READ
+    0x0B: 0x0C,  # FAST READ
+    0x3B: 0x3C,  # FAST READ DUAL OUTPUT
+    0x6B: 0x6C,  # FAST READ QUAD OUTPUT
+    0xBB: 0xBC,  # FAST READ DUAL I/O
+    0xEB: 0xEC,  # FAST READ QUAD I/O
+}
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class FlashParams:
+    """
+    The command is always sent on IO0. The address and the mode bits are sent
+    on address_io_width lines, and the data is received on data_io_width lines.
+    Some common read commands:
+
+    - READ (0x03, 1-1-1): the defaults
+    - FAST READ DUAL OUTPUT (0x3B, 1-1-2): data_io_width=2, read_dummy_cycles=8
+    - FAST READ QUAD OUTPUT (0x6B, 1-1-4): data_io_width=4, read_dummy_cycles=8
+    - FAST READ QUAD I/O (0xEB, 1-4-4): address_io_width=4, data_io_width=4,
+      read_mode_bits=8, read_dummy_cycles=4
+
+    The quad commands require the QE bit to be set in the flash.
+    For flashes larger than 16 MiB, see with_four_byte_address.
+    """
+
+    command_width_bits: int = 8
+    address_width_bits: int = 24
+    read_command: int = 0x03
+    address_io_width: int = 1
+    data_io_width: int = 1
+    # Sent after the address, on the address lines. They're always 0,
+    # since we don't want continuous reading without a command.
+    read_mode_bits: int = 0
+    # Not including the clocks of the mode bits
+    read_dummy_cycles: int = 0
+    # Toggle SCLK at the frequency of the module clock, instead of half of it.
+    # See SPIFlash.elaborate.
+    full_rate_sclk: bool = False
+
+    def __post_init__(self) -> None:
+        assert self.command_width_bits > 0
+        assert self.address_width_bits > 0
+        assert self.read_command.bit_length() <= self.command_width_bits
+
+        assert self.address_io_width in (1, 2, 4)
+        assert self.data_io_width in (1, 2, 4)
+        # There are no commands that send the address on more lines than
+        # the data, and this way the lines of the address are always inputs
+        # during the data phase.
+        assert self.address_io_width <= self.data_io_width
+        assert self.address_width_bits % self.address_io_width == 0
+
+        assert self.read_mode_bits >= 0
+        assert self.read_mode_bits % self.address_io_width == 0
+        assert self.read_dummy_cycles >= 0
+        # When the data comes in on IO0, we need at least one clock to stop
+        # driving it before the flash does.
+        assert self.data_io_width == 1 or self.read_dummy_cycles > 0
+
+    def with_four_byte_address(self) -> "FlashParams":
+        """
+        The same read, with a 4-byte address. This uses the variant of the
+        command that always takes a 4-byte address, instead of switching
+        the flash to 4-byte address mode, which a reset of the flash
+        would undo.
+        """
+        assert self.address_width_bits == 24
+        return replace(
+            self,
+            address_width_bits=32,
+            read_command=FOUR_BYTE_READ_COMMANDS[self.read_command],
+        )
+
+    @property
+    def address_clocks(self) -> int:
+        return self.address_width_bits // self.address_io_width
+
+    @property
+    def mode_clocks(self) -> int:
+        return self.read_mode_bits // self.address_io_width
+
+    @property
+    def byte_clocks(self) -> int:
+        """
+        SPI clocks it takes to receive a byte.
+        """
+        return 8 // self.data_io_width
+
+    @property
+    def cycles_until_first_read_byte(self) -> int:
+        """
+        Depends only on the parameters, so it can be used without
+        instantiating the controller.
+        """
+        # Every bit of the command, every part of the address and of the mode
+        # bits, and every dummy cycle take an SPI clock. There's also one
+        # more SPI clock between sending them and receiving data.
+        command_clocks = (
+            self.command_width_bits
+            + self.address_clocks
+            + self.mode_clocks
+            + self.read_dummy_cycles
+            + 1
+        )
+        if self.full_rate_sclk:
+            return (
+                # An SPI clock is a single cycle of the main clock
+                command_clocks
+                + self.byte_clocks
+                # The last bits are shifted in on the clock after they're
+                # captured
+                + 1
+            )
+        # An SPI clock is 2 cycles of the main clock
+        return 2 * command_clocks + 2 * self.byte_clocks
+
+    @property
+    def cycles_per_byte(self) -> int:
+        """
+        Cycles between consecutive bytes during a read.
+        """
+        return self.byte_clocks if self.full_rate_sclk else 2 * self.byte_clocks
+
+
+class SPIFlash(Component):  # type: ignore[misc]
+    def __init__(
+        self,
+        params: FlashParams = FlashParams(),
+        *,
+        perf_counters: bool = False,
+    ) -> None:
+        super().__init__(
+            {
+                "i_read": In(1),
+                "i_address": In(unsigned(params.address_width_bits)),
+                "o_data": Out(unsigned(8), init=0),
+                "o_data_valid": Out(1, init=0),
+                "o_cs_n": Out(1, init=1),
+                "o_sclk": Out(1, init=1),  # CPOL=1
+                # IO0 is COPI (Controller Out, Peripheral In) and IO1 is CIPO
+                # (Controller In, Peripheral Out). IO2 and IO3 are used only
+                # with quad I/O, and are inputs otherwise.
+                "i_io": In(4),
+                "o_io": Out(4, init=0),
+                "o_oe": Out(4, init=0b0001),
+                **(perf_counter_members(PERF_COUNTERS) if perf_counters else {}),
+            }
+        )
+        self._params = params
+        self._perf_counters = perf_counters
+
+    @property
+    def params(self) -> FlashParams:
+        return self._params
+
+    @property
+    def perf_counters(self) -> bool:
+        return self._perf_counters
+
+    @property
+    def cycles_until_first_read_byte(self) -> int:
+        return self._params.cycles_until_first_read_byte
+
+    def elaborate(self, platform: Any) -> Module:
+        m = Module()
+
+        #
+        # SPI clock, CPOL=1.
+        # Half the frequency of the module clock, for better timing control.
+        # We implement CPHA=1, so data is sent on the falling edge,
+        # and sampled on the rising edge. By halving the clock, we can do:
+        #   with m.If(sclk): o_io.eq(something)
+        # which will output the data in time for the next falling edge,
+        # and there will be plently of time to honor the setup conditions
+        # for the rising edge.
+        #
+        # I hope.
+        #
+        # With full_rate_sclk, SCLK is the inverted module clock, gated while
+        # chip-select is deasserted. Data is still sent on the falling edge
+        # of SCLK, which is now the rising edge of the module clock, so the
+        # FSM advances on every cycle. The flash samples it half a cycle
+        # later. Data from the flash is captured on the rising edge of SCLK
+        # by a register clocked on the falling edge of the module clock,
+        # and shifted in on the next cycle.
+        #
+
+        # Asserted on the cycles that end with a falling edge of SCLK
+        sclk_falling = Signal()
+        # The IO lines, as sampled on the rising edge of SCLK
+        io_in = Signal.like(self.i_io)
+
+        if self.params.full_rate_sclk:
+            m.domains.sclk = cd_sclk = ClockDomain(clk_edge="neg", local=True)
+            m.d.comb += [
+                cd_sclk.clk.eq(ClockSignal()),
+                cd_sclk.rst.eq(ResetSignal()),
+            ]
+
+            # Only changes on the falling edge of the module clock, while
+            # the inverted clock is high, so gating with it doesn't glitch.
+            sclk_enable = Signal()
+            m.d.comb += self.o_sclk.eq(~ClockSignal() | ~sclk_enable)
+
+            m.d.sclk += io_in.eq(self.i_io)
+            m.d.comb += sclk_falling.eq(1)
+        else:
+            with m.If(~self.o_cs_n):
+                m.d.sync += self.o_sclk.eq(~self.o_sclk)
+            with m.Else():
+                m.d.sync += self.o_sclk.eq(1)
+
+            m.d.comb += [
+                sclk_falling.eq(self.o_sclk),
+                io_in.eq(self.i_io),
+            ]
+
+        params = self.params
+
+        # Lines the data comes in on. A single line is CIPO, which is IO1.
+        if params.data_io_width == 1:
+            data_in = io_in[1]
+        else:
+            data_in = io_in[: params.data_io_width]
+
+        # Lines the address and the mode bits go out on
+        address_lines = self.o_io[: params.address_io_width]
+        address_oe = (1 << params.address_io_width) - 1
+
+        # When the data comes in on IO0, it's released during the dummy cycles.
+        # Otherwise it stays COPI.
+        data_oe = 0 if params.data_io_width > 1 else 0b0001
+
+        # With a single line, IO0 is always COPI, so we keep it driven
+        # even before reset.
+        constant_oe = address_oe == data_oe == 0b0001
+        if constant_oe:
+            m.d.comb += self.o_oe.eq(0b0001)
+
+        def set_oe(value: int) -> None:
+            if not constant_oe:
+                m.d.sync += self.o_oe.eq(value)
+
+        #
+        # Shift register to send or receive data
+        #
+
+        # The maximum width of anything we'll ever need to send or receive
+        max_width = max(
+            params.command_width_bits,
+            params.address_width_bits,
+            8,  # A single data byte
+        )
+
+        shift_reg = Signal(max_width)
+
+        # Timer for counting how many more clocks we need for the current
+        # phase of the transaction.
+        timer = Signal(
+            range(
+                max(
+                    params.command_width_bits,
+                    params.address_clocks,
+                    params.mode_clocks,
+                    params.read_dummy_cycles,
+                    params.byte_clocks,
+                )
+            ),
+            init=0,
+        )
+
+        #
+        # Main FSM
+        #
+
+        address = Signal.like(self.i_address, init=0)
+
+        # When a whole byte is shifted in we'll set o_data_valid so that
+        # the enclosing module can sample it. See below.
+        m.d.comb += self.o_data.eq(shift_reg[0:8])
+
+        def after_address() -> None:
+            # The mode bits and the dummy cycles are optional
+            if params.mode_clocks:
+                m.d.sync += timer.eq(params.mode_clocks - 1)
+                m.next = "Send mode bits"
+            else:
+                after_mode_bits()
+
+        def after_mode_bits() -> None:
+            if params.read_dummy_cycles:
+                m.d.sync += timer.eq(params.read_dummy_cycles - 1)
+                m.next = "Dummy cycles"
+            else:
+                m.next = "Delay"
+
+        with m.FSM() as fsm:
+            with m.State("Idle"):
+                m.d.sync += Assert(self.o_cs_n)
+                m.d.sync += Assert(~self.o_data_valid)
+
+                # Chip-select was deasserted on the previous cycle, so the flash
+                # isn't driving IO0 anymore.
+                set_oe(0b0001)
+
+                with m.If(self.i_read):
+                    m.d.sync += [
+                        address.eq(self.i_address),
+                        shift_reg.eq(params.read_command),
+                        timer.eq(params.command_width_bits - 1),
+                        self.o_cs_n.eq(0),
+                    ]
+                    m.next = "Send read command"
+
+            with m.State("Send read command"):
+                with m.If(sclk_falling):
+                    # Data is sent MSB-first
+                    m.d.sync += [
+                        self.o_io[0].eq(shift_reg[params.command_width_bits - 1]),
+                        shift_reg.eq(shift_reg.shift_left(1)),
+                    ]
+                    with m.If(timer == 0):
+                        m.d.sync += [
+                            shift_reg.eq(address),
+                            timer.eq(params.address_clocks - 1),
+                        ]
+                        m.next = "Send address"
+                    with m.Else():
+                        m.d.sync += timer.eq(timer - 1)
+
+            with m.State("Send address"):
+                with m.If(sclk_falling):
+                    # Data is sent MSB-first. With several lines, the highest
+                    # line gets the most significant bit.
+                    set_oe(address_oe)
+                    m.d.sync += [
+                        address_lines.eq(
+                            shift_reg[
+                                params.address_width_bits
+                                - params.address_io_width : params.address_width_bits
+                            ]
+                        ),
+                        shift_reg.eq(shift_reg.shift_left(params.address_io_width)),
+                    ]
+                    with m.If(timer == 0):
+                        after_address()
+                    with m.Else():
+                        m.d.sync += timer.eq(timer - 1)
+
+            with m.State("Send mode bits"):
+                with m.If(sclk_falling):
+                    m.d.sync += address_lines.eq(0)
+                    with m.If(timer == 0):
+                        after_mode_bits()
+                    with m.Else():
+                        m.d.sync += timer.eq(timer - 1)
+
+            with m.State("Dummy cycles"):
+                with m.If(sclk_falling):
+                    set_oe(data_oe)
+                    with m.If(timer == 0):
+                        m.next = "Delay"
+                    with m.Else():
+                        m.d.sync += timer.eq(timer - 1)
+
+            with m.State("Delay"):
+                with m.If(sclk_falling):
+                    m.d.sync += timer.eq(params.byte_clocks - 1)
+                    m.next = "Transfer"
+
+            with m.State("Transfer"):
+                # Ensure the valid signal is asserted only for a single
+                # clock.
+                m.d.sync += self.o_data_valid.eq(0)
+
+                with m.If(~self.i_read):
+                    m.d.sync += self.o_cs_n.eq(1)
+                    if not params.full_rate_sclk:
+                        m.d.sync += self.o_sclk.eq(1)
+                    m.next = "Idle"
+                with m.Else():
+                    with m.If(sclk_falling):
+                        m.d.sync += shift_reg.eq(
+                            shift_reg.shift_left(params.data_io_width) | data_in
+                        )
+                        with m.If(timer == 0):
+                            m.d.sync += [
+                                self.o_data_valid.eq(1),
+                                timer.eq(params.byte_clocks - 1),
+                            ]
+                        with m.Else():
+                            m.d.sync += timer.eq(timer - 1)
+
+        if params.full_rate_sclk:
+            # Stop SCLK before the FSM deasserts chip-select, so that there's
+            # no falling edge of SCLK along with it.
+            m.d.sclk += sclk_enable.eq(
+                ~self.o_cs_n & ~(fsm.ongoing("Transfer") & ~self.i_read)
+            )
+
+        if self.perf_counters:
+            elaborate_controller_perf_counters(
+                m,
+                self,
+                read_start=fsm.ongoing("Idle") & self.i_read,
+                idle=fsm.ongoing("Idle") & ~self.i_read,
+                data_valid=self.o_data_valid,
+            )
+
+        return m
@@ -0,0 +1,73 @@
+"""
+Stands in for a flash controller, for testing the modules that read through one
+without simulating a flash as well.
+"""
+
+from dataclasses import dataclass
+
+from cocotb.handle import HierarchyObject
+from cocotb.triggers import FallingEdge
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class ControllerTiming:
+    first_byte_cycles: int
+    cycles_per_byte: int
+
+
+# NOTE: Keep in sync with cycles_until_first_read_byte of the controllers
+SPI_FLASH = ControllerTiming(first_byte_cycles=82, cycles_per_byte=16)
+QSPI_FLASH_DTR = ControllerTiming(first_byte_cycles=57, cycles_per_byte=2)
+
+
+async def run_controller(
+    dut: HierarchyObject, image: bytes, timing: ControllerTiming
+) -> None:
+    """
+    Stands in for a flash controller holding the image, with its timing.
+    A read starts when o_spi_read is asserted. Like the controllers, it's
+    only stopped once it gets to the data, so a read that's deasserted
+    before its first byte still runs until then, without delivering it.
+    If the DUT has i_spi_busy, it's driven like the inverse of the
+    chip-select of the controllers.
+    """
+
+    drive_busy = hasattr(dut, "i_spi_busy")
+
+    address: int | None = None
+    countdown = 0
+    # Whether the read got to the data
+    streaming = False
+    busy = False
+
+    while True:
+        await FallingEdge(dut.clk)
+
+        dut.i_spi_data_valid.value = 0
+        # The controllers change chip-select on the edge after the one at
+        # which they see the read change
+        if drive_busy:
+            dut.i_spi_busy.value = int(busy)
+
+        reading = bool(dut.o_spi_read.value)
+
+        if address is None:
+            if reading:
+                address = dut.o_spi_address.value.integer
+                countdown = timing.first_byte_cycles
+                streaming = False
+                busy = True
+            continue
+
+        if (streaming or countdown == 1) and not reading:
+            address = None
+            busy = False
+            continue
+
+        countdown -= 1
+        if countdown == 0:
+            dut.i_spi_data.value = image[address % len(image)]
+            dut.i_spi_data_valid.value = 1
+            address += 1
+            countdown = timing.cycles_per_byte
+            streaming = True
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Results:
+    random_seed: int | None
+    failed: tuple[str, ...]
+
+
+def read_results(path: Path) -> Results:
+    """
+    Parses a JUnit results file written by cocotb.
+    """
+    root = ET.parse(path).getroot()
+
+    seed_property = root.find(".//property[@name='random_seed']")
+    random_seed = (
+        int(seed_property.attrib["value"]) if seed_property is not None else None
+    )
+
+    failed = tuple(
+        testcase.attrib["name"]
+        for testcase in root.iter("testcase")
+        if testcase.find("failure") is not None or testcase.find("error") is not None
+    )
+
+    return Results(random_seed=random_seed, failed=failed)
+
+
+def _main() -> None:
+    args = _parse_command_line()
+
+    results = read_results(args.results_file)
+    if not results.failed:
+        return
+
+    make_args = [f"TESTCASE={','.join(results.failed)}"]
+    if results.random_seed is not None:
+        make_args.append(f"RANDOM_SEED={results.random_seed}")
+    print(" ".join(make_args))
+
+
+def _parse_command_line() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Print the make arguments that re-run the failed tests "
+            "from a cocotb results file, with the same random seed."
+        )
+    )
+
+    parser.add_argument("results_file", type=Path, help="JUnit results file")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    _main()
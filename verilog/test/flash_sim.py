@@ -0,0 +1,69 @@
+"""
+Helpers for the tests that run modules against a real flash controller and
+the flash model, in the Amaranth simulator.
+"""
+
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from amaranth import Module
+from amaranth.sim import Simulator, SimulatorContext
+from flash_model import Engine, QSPIFlashDTREngine, SPIFlashEngine
+from flash_model.amaranth import AmaranthFlash
+from tt10_rtl.qspi_flash_dtr import QSPIFlashDTR
+from tt10_rtl.spi_flash import SPIFlash
+
+CLOCK_HZ = 48e3 * 16 * 2
+
+# Stopping a read after this many cycles leaves SPIFlash in the middle of
+# sending the address
+ABANDON_CYCLES = 20
+
+
+def connect(m: Module, reader: Any, controller: SPIFlash | QSPIFlashDTR) -> None:
+    """
+    Connects a module that reads through a flash controller to the controller.
+    """
+    m.d.comb += [
+        controller.i_read.eq(reader.o_spi_read),
+        controller.i_address.eq(reader.o_spi_address),
+        reader.i_spi_data_valid.eq(controller.o_data_valid),
+        reader.i_spi_data.eq(controller.o_data),
+        reader.i_spi_busy.eq(~controller.o_cs_n),
+    ]
+
+
+def simulate(
+    m: Module,
+    controller: SPIFlash | QSPIFlashDTR,
+    image: bytes,
+    testbench: Callable[[SimulatorContext], Coroutine[Any, Any, None]],
+) -> None:
+    """
+    Runs the testbench with a flash holding the image on the controller's pins.
+    """
+    engine: Engine
+    if isinstance(controller, QSPIFlashDTR):
+        params = controller.params
+        engine = QSPIFlashDTREngine(
+            image,
+            command_width_bits=params.command_width_bits,
+            address_width_bits=params.address_width_bits,
+            rsten_command=params.rsten_command,
+            rst_command=params.rst_command,
+            read_command=params.read_command,
+            read_dummy_cycles=params.read_dummy_cycles,
+        )
+        out, in_ = controller.o_io, controller.i_io
+    else:
+        engine = SPIFlashEngine(image)
+        out, in_ = controller.o_io[0], controller.i_io[1]
+    flash = AmaranthFlash(
+        engine, cs_n=controller.o_cs_n, sclk=controller.o_sclk, out=out, in_=in_
+    )
+
+    sim = Simulator(m)
+    sim.add_clock(1 / CLOCK_HZ)
+    sim.add_testbench(flash.run, background=True)
+    sim.add_testbench(testbench)
+    sim.run()
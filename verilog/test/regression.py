@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from failed_tests import read_results
+
+TEST_DIR = Path(__file__).parent.resolve()
+DEFAULT_MODULES = (
+    "digital_top",
+    "spi_flash",
+    "qspi_flash_dtr",
+    "player",
+    "mixer",
+    "line_cache",
+    "arbiter",
+)
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Build:
+    module: str
+    # Make variables that select the variant, such as FULL_RATE_SCLK=1
+    variables: tuple[str, ...]
+    # The Verilog generated for the variant
+    verilog: Path
+
+    @property
+    def name(self) -> str:
+        """
+        The module and its variant, such as spi_flash_full_rate_sclk.
+        """
+        return self.verilog.stem
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Job:
+    build: Build
+    seed: int
+    sim: str
+    output_dir: Path
+    timeout_s: float | None
+
+    @property
+    def results_file(self) -> Path:
+        return self.output_dir / self.build.name / f"{self.seed}.xml"
+
+    @property
+    def log_file(self) -> Path:
+        return self.output_dir / self.build.name / f"{self.seed}.log"
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Outcome:
+    job: Job
+    failed: tuple[str, ...]
+    error: str | None = None
+
+    @property
+    def passed(self) -> bool:
+        return not self.failed and self.error is None
+
+
+def _main() -> None:
+    args = _parse_command_line()
+
+    base_seed = args.base_seed if args.base_seed is not None else int(time.time())
+    seeds = args.seed or [base_seed + i for i in range(args.seeds)]
+
+    # Variants that don't apply to a module build the same Verilog as the
+    # module's default, so they're only run once.
+    builds: dict[Path, Build] = {}
+    for module in args.modules:
+        for variant in args.variant or [""]:
+            variables = tuple(variant.split())
+            verilog = Path(
+                subprocess.run(
+                    _make_command(
+                        module, args.sim, "print_generated_verilog", *variables
+                    ),
+                    cwd=TEST_DIR,
+                    check=True,
+                    capture_output=True,
+                    encoding="utf-8",
+                ).stdout.strip()
+            )
+            builds.setdefault(
+                verilog, Build(module=module, variables=variables, verilog=verilog)
+            )
+
+    # Build every simulation model once, up-front. The workers only run the
+    # pre-built models, so they never race on the build directory.
+    for build in builds.values():
+        print(f"Building {build.name}", flush=True)
+        subprocess.run(
+            _make_command(build.module, args.sim, "sim_model", *build.variables),
+            cwd=TEST_DIR,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    jobs = [
+        Job(
+            build=build,
+            seed=seed,
+            sim=args.sim,
+            output_dir=args.output_dir.resolve(),
+            timeout_s=args.timeout,
+        )
+        for seed in seeds
+        for build in builds.values()
+    ]
+
+    outcomes: list[Outcome] = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(_run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            outcome = future.result()
+            outcomes.append(outcome)
+            status = "PASS" if outcome.passed else "FAIL"
+            print(
+                f"[{len(outcomes)}/{len(jobs)}] {status} "
+                f"{outcome.job.build.name} RANDOM_SEED={outcome.job.seed}",
+                flush=True,
+            )
+
+    _merge_results(outcomes, args.output_dir / "results.xml")
+
+    failures = [outcome for outcome in outcomes if not outcome.passed]
+    if not failures:
+        print(f"All {len(jobs)} runs passed")
+        return
+
+    print(f"\n{len(failures)}/{len(jobs)} runs failed. To replay:")
+    for outcome in sorted(failures, key=lambda o: (o.job.build.name, o.job.seed)):
+        testcase = f" TESTCASE={','.join(outcome.failed)}" if outcome.failed else ""
+        settings = "".join(f" {variable}" for variable in outcome.job.build.variables)
+        print(
+            f"  make FAST=1 SIM={outcome.job.sim} WAVES=1 "
+            f"MODULE_TO_TEST={outcome.job.build.module}{settings} "
+            f"RANDOM_SEED={outcome.job.seed}{testcase}"
+            + (f"  # {outcome.error}" if outcome.error else "")
+        )
+    sys.exit(1)
+
+
+def _make_command(module: str, sim: str, target: str, *extra: str) -> list[str]:
+    return [
+        "make",
+        "FAST=1",
+        f"SIM={sim}",
+        # Parallelism comes from running many simulations at once
+        "VERILATOR_THREADS=1",
+        f"MODULE_TO_TEST={module}",
+        *extra,
+        target,
+    ]
+
+
+def _run_job(job: Job) -> Outcome:
+    job.results_file.parent.mkdir(parents=True, exist_ok=True)
+
+    with job.log_file.open("wb") as log:
+        try:
+            subprocess.run(
+                _make_command(
+                    job.build.module,
+                    job.sim,
+                    "sim",
+                    *job.build.variables,
+                    # The Verilog was generated during the build. Don't let
+                    # the workers race on regenerating it.
+                    "-o",
+                    str(job.build.verilog),
+                    f"RANDOM_SEED={job.seed}",
+                    f"COCOTB_RESULTS_FILE={job.results_file}",
+                ),
+                cwd=TEST_DIR,
+                env={
+                    **os.environ,
+                    "RESULT_TESTSUITE": f"{job.build.name}.seed{job.seed}",
+                },
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                timeout=job.timeout_s,
+            )
+        except subprocess.TimeoutExpired:
+            return Outcome(job=job, failed=(), error="timed out")
+
+    # The exit code isn't reliable: cocotb doesn't set it for failed tests,
+    # and an RTL assertion aborts the simulation before results are written.
+    if not job.results_file.exists():
+        return Outcome(job=job, failed=(), error=f"no results, see {job.log_file}")
+
+    return Outcome(job=job, failed=read_results(job.results_file).failed)
+
+
+def _merge_results(outcomes: list[Outcome], path: Path) -> None:
+    merged = ET.Element("testsuites")
+    for outcome in sorted(outcomes, key=lambda o: (o.job.build.name, o.job.seed)):
+        if not outcome.job.results_file.exists():
+            continue
+        merged.extend(ET.parse(outcome.job.results_file).getroot())
+    ET.ElementTree(merged).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def _parse_command_line() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run the cocotb test modules with many random seeds in parallel, "
+            "and report the seeds that failed."
+        )
+    )
+
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        default=DEFAULT_MODULES,
+        help=f"Modules to test (default: {' '.join(DEFAULT_MODULES)})",
+    )
+    parser.add_argument(
+        "--variant",
+        action="append",
+        metavar="VARIABLES",
+        help=(
+            "Make variables that select a variant of the modules, such as "
+            "'SPI_FLASH_READ=0x6B FOUR_BYTE_ADDRESS=1'. Can be given multiple "
+            "times, and every module is run with every variant. Variants that "
+            "don't apply to a module are skipped. An empty string is the "
+            "default variant, which is the only one by default."
+        ),
+    )
+    parser.add_argument(
+        "--seeds", type=int, default=16, help="Number of seeds to run per module"
+    )
+    parser.add_argument(
+        "--base-seed",
+        type=int,
+        help="First seed to run. Seeds are consecutive. Defaults to the current time.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        action="append",
+        help="Run this specific seed. Can be given multiple times. Overrides --seeds.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of simulations to run in parallel (default: number of CPUs)",
+    )
+    parser.add_argument("--sim", default="verilator", help="Simulator to use")
+    parser.add_argument(
+        "--timeout", type=float, help="Timeout for a single run, in seconds"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=TEST_DIR / "regression",
+        help="Directory for per-run JUnit results and logs",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,231 @@
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.handle import HierarchyObject
+from cocotb.triggers import ClockCycles, FallingEdge
+from controller_model import SPI_FLASH, run_controller
+
+ADDRESS_WIDTH_BITS = 24
+
+# NOTE: Keep in sync with the Makefile
+BURST_BYTES = (16, 8, 8)
+PRIORITIES = (0, 1, 1)
+
+
+def burst_cycles(requester: int) -> int:
+    return (
+        3
+        + SPI_FLASH.first_byte_cycles
+        + (BURST_BYTES[requester] - 1) * SPI_FLASH.cycles_per_byte
+    )
+
+
+# Bytes are passed on a cycle after the controller delivers them
+FIRST_BYTE_CYCLES = SPI_FLASH.first_byte_cycles + 1
+
+
+def max_wait_cycles(requester: int) -> int:
+    # NOTE: Keep in sync with Arbiter.max_wait_cycles. Every other requester
+    # of the class may get a burst first, and before each of those, the
+    # classes above may get theirs until they yield to a class below.
+    priority = PRIORITIES[requester]
+    rank = sorted(set(PRIORITIES)).index(priority)
+    members = [
+        other for other in range(len(PRIORITIES)) if PRIORITIES[other] == priority
+    ]
+    higher = [other for other in range(len(PRIORITIES)) if PRIORITIES[other] < priority]
+    lower = [other for other in range(len(PRIORITIES)) if PRIORITIES[other] > priority]
+    higher_bursts = ((1 << rank) - 1) * (2 if lower else 1)
+    per_turn = higher_bursts * max(map(burst_cycles, higher), default=0) + max(
+        map(burst_cycles, lower), default=0
+    )
+    return (
+        sum(burst_cycles(other) for other in members if other != requester)
+        + len(members) * per_turn
+        + FIRST_BYTE_CYCLES
+    )
+
+
+MAX_WAIT_CYCLES = tuple(map(max_wait_cycles, range(len(BURST_BYTES))))
+# A read that's stopped after a burst is resumed after the other requesters
+# get their turn. It's stopped a cycle after its last byte, and the other
+# requester is granted the controller a cycle after that.
+MAX_GAP_CYCLES = tuple(wait + 2 for wait in MAX_WAIT_CYCLES)
+
+
+async def start(dut: HierarchyObject, image: bytes) -> None:
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.i_read.value = 0
+    dut.i_address.value = 0
+    dut.i_spi_data_valid.value = 0
+    dut.i_spi_data.value = 0
+    dut.i_spi_busy.value = 0
+
+    cocotb.start_soon(run_controller(dut, image, SPI_FLASH))
+    cocotb.start_soon(check_grant(dut))
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+
+async def check_grant(dut: HierarchyObject) -> None:
+    while True:
+        await FallingEdge(dut.clk)
+        grant = dut.o_grant.value.integer
+        assert grant & (grant - 1) == 0, "Granted to several requesters"
+        if dut.o_spi_read.value:
+            assert grant & dut.i_read.value.integer, "Read without a grant"
+
+
+def set_bit(dut: HierarchyObject, requester: int, value: int) -> None:
+    read = dut.i_read.value.integer
+    dut.i_read.value = (read & ~(1 << requester)) | (value << requester)
+
+
+async def read(
+    dut: HierarchyObject, requester: int, address: int, length: int
+) -> tuple[bytes, list[int]]:
+    """
+    Reads through the arbiter as the given requester, and stops the read once
+    all the bytes are received. Returns the bytes, and the cycle at which
+    each one was received, counting from the edge at which the arbiter
+    sees i_read.
+    """
+    await FallingEdge(dut.clk)
+    address_mask = (1 << ADDRESS_WIDTH_BITS) - 1
+    shift = requester * ADDRESS_WIDTH_BITS
+    dut.i_address.value = (dut.i_address.value.integer & ~(address_mask << shift)) | (
+        address << shift
+    )
+    set_bit(dut, requester, 1)
+
+    result = bytearray()
+    cycles = []
+    cycle = 0
+    while len(result) < length:
+        await FallingEdge(dut.clk)
+        cycle += 1
+        if dut.o_data_valid.value.integer & (1 << requester):
+            result.append(dut.o_data.value.integer)
+            cycles.append(cycle)
+
+    set_bit(dut, requester, 0)
+    return bytes(result), cycles
+
+
+async def run_requester(
+    dut: HierarchyObject, requester: int, image: bytes, reads: int
+) -> list[int]:
+    """
+    Reads random clips, checking their data and timing.
+    Returns the wait for the first byte of every read.
+    """
+    waits = []
+    for _ in range(reads):
+        await ClockCycles(dut.clk, random.randrange(1, 100), rising=False)
+        address = random.randrange(len(image) - 100)
+        length = random.randrange(1, 100)
+
+        data, cycles = await read(dut, requester, address, length)
+        assert data == image[address : address + length]
+
+        assert cycles[0] <= MAX_WAIT_CYCLES[requester]
+        assert all(
+            b - a <= MAX_GAP_CYCLES[requester] for a, b in zip(cycles, cycles[1:])
+        )
+        waits.append(cycles[0])
+    return waits
+
+
+@cocotb.test()  # type: ignore
+async def test_single_requester(dut: HierarchyObject) -> None:
+    image = random.randbytes(4096)
+    requester = random.randrange(len(BURST_BYTES))
+    address = random.randrange(len(image) - 1000)
+
+    await start(dut, image)
+
+    # Nobody else is waiting, so the read isn't stopped
+    data, cycles = await read(dut, requester, address, 1000)
+    assert data == image[address : address + 1000]
+    assert cycles[0] == 1 + FIRST_BYTE_CYCLES
+    assert all(b - a == SPI_FLASH.cycles_per_byte for a, b in zip(cycles, cycles[1:]))
+
+
+@cocotb.test()  # type: ignore
+async def test_shared(dut: HierarchyObject) -> None:
+    image = random.randbytes(4096)
+
+    await start(dut, image)
+
+    tasks = [
+        cocotb.start_soon(run_requester(dut, requester, image, 30))
+        for requester in range(len(BURST_BYTES))
+    ]
+    for task in tasks:
+        await task
+
+
+@cocotb.test()  # type: ignore
+async def test_max_wait(dut: HierarchyObject) -> None:
+    image = random.randbytes(4096)
+
+    await start(dut, image)
+
+    # Close to the worst case for the first requester: the second one was
+    # granted the controller just before it asked for it. The third one is
+    # waiting as well, but it's in a lower class, so it's granted after the
+    # first. Requesters set i_read on separate edges, so that
+    # they don't overwrite each other, so the second one was granted an
+    # edge earlier than in the worst case.
+    background = []
+    for requester in (1, 2):
+        background.append(cocotb.start_soon(read(dut, requester, 0, 1000)))
+        await FallingEdge(dut.clk)
+    address = random.randrange(len(image) - 100)
+    data, cycles = await read(dut, 0, address, 100)
+    assert data == image[address : address + 100]
+    assert cycles[0] == MAX_WAIT_CYCLES[0] - 1
+
+    for task in background:
+        data, _ = await task
+        assert data == image[:1000]
+
+
+@cocotb.test()  # type: ignore
+async def test_priorities(dut: HierarchyObject) -> None:
+    image = random.randbytes(4096)
+
+    await start(dut, image)
+
+    grants = []
+
+    async def record_grants() -> None:
+        last = 0
+        while True:
+            await FallingEdge(dut.clk)
+            grant = dut.o_grant.value.integer
+            if grant and grant != last:
+                grants.append(grant.bit_length() - 1)
+            last = grant
+
+    recorder = cocotb.start_soon(record_grants())
+
+    # Everybody reads as much as it can. The first requester's class gets
+    # every other burst, and the other class takes turns in the rest.
+    tasks = []
+    for requester in range(len(BURST_BYTES)):
+        tasks.append(cocotb.start_soon(read(dut, requester, 0, 200)))
+        await FallingEdge(dut.clk)
+    for task in tasks:
+        data, _ = await task
+        assert data == image[:200]
+    recorder.kill()
+
+    # The first requester finishes first, so only the start is checked
+    assert grants[:8] == [0, 1, 0, 2, 0, 1, 0, 2]
@@ -0,0 +1,52 @@
+"""
+Runs the arbiter against SPIFlash and the flash model, to check reads that
+are stopped while the controller is still sending the command against the
+controller itself, and not only against the stand-in of test_arbiter.py.
+"""
+
+import random
+
+from amaranth import Module
+from amaranth.sim import SimulatorContext
+from flash_sim import ABANDON_CYCLES, connect, simulate
+from tt10_rtl.arbiter import Arbiter
+from tt10_rtl.spi_flash import SPIFlash
+
+
+async def _read(
+    ctx: SimulatorContext, arbiter: Arbiter, requester: int, address: int, length: int
+) -> bytes:
+    ctx.set(arbiter.i_address[requester], address)
+    ctx.set(arbiter.i_read[requester], 1)
+    result = bytearray()
+    while len(result) < length:
+        _, _, valid, data = await ctx.tick().sample(
+            arbiter.o_data_valid[requester], arbiter.o_data
+        )
+        if valid:
+            result.append(data)
+    ctx.set(arbiter.i_read[requester], 0)
+    await ctx.tick()
+    return bytes(result)
+
+
+def test_abandoned_read() -> None:
+    image = random.randbytes(4096)
+    m = Module()
+    m.submodules.arbiter = arbiter = Arbiter(burst_bytes=(16, 8))
+    m.submodules.controller = controller = SPIFlash()
+    connect(m, arbiter, controller)
+
+    async def testbench(ctx: SimulatorContext) -> None:
+        # A read that's abandoned while the controller sends the command
+        ctx.set(arbiter.i_address[1], 0x100)
+        ctx.set(arbiter.i_read[1], 1)
+        await ctx.tick().repeat(ABANDON_CYCLES)
+        assert not ctx.get(controller.o_cs_n)
+        ctx.set(arbiter.i_read[1], 0)
+        await ctx.tick()
+
+        # The next requester gets its own bytes
+        assert await _read(ctx, arbiter, 0, 0x200, 16) == image[0x200:0x210]
+
+    simulate(m, controller, image, testbench)
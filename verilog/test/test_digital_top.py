@@ -1,4 +1,5 @@
 import itertools
+import os
 import random
 from enum import Enum
 from typing import Any, Iterable, Iterator
@@ -7,14 +8,30 @@ import cocotb
 import cocotb.utils
 from cocotb.clock import Clock
 from cocotb.handle import HierarchyObject, ModifiableObject
-from cocotb.triggers import ClockCycles, First, ReadOnly, ReadWrite, Timer, Waitable
+from cocotb.triggers import (
+    ClockCycles,
+    Event,
+    First,
+    ReadOnly,
+    ReadWrite,
+    Timer,
+    Waitable,
+)
 from cocotb.triggers import Edge as _Edge
+from flash_model import FlashMemory, SeededFlashMemory, SPIFlashEngine
+from flash_model.cocotb import CocotbFlash, Pins
 from pytest import approx
 from typing_extensions import Self
 
 AUDIO_SAMPLE_RATE_HZ = 48e3  # https://en.wikipedia.org/wiki/48,000_Hz
 SYSTEM_CLOCK_HZ = AUDIO_SAMPLE_RATE_HZ * 16 * 2
 
+# Number of frames to play in the soak test. The test is skipped if 0.
+# 1 << 23 stereo frames cover the whole 24-bit address space.
+SOAK_FRAMES = int(os.environ.get("SOAK_FRAMES", "0"))
+SOAK_MAX_PLAY_US = int(os.environ.get("SOAK_MAX_PLAY_US", "100000"))
+SOAK_MAX_PAUSE_US = int(os.environ.get("SOAK_MAX_PAUSE_US", "1000"))
+
 
 # NOTE: Keep in sync with the RTL
 class Mode(Enum):
@@ -154,10 +171,7 @@ async def _test_player(dut: HierarchyObject, left_pt: bool) -> None:
     digital_pt = dut.uo_out
 
     # SPI signals
-    cs_n = AwaitableSubObject(dut.uio_out, 0)
-    copi = dut.uio_out[1]
     cipo = dut.uio_in[2]
-    sclk = AwaitableSubObject(dut.uio_out, 3)
 
     mode.value = Mode.PRODUCTION_L.value if left_pt else Mode.PRODUCTION_R.value
     play.value = 0
@@ -188,15 +202,8 @@ async def _test_player(dut: HierarchyObject, left_pt: bool) -> None:
 
     samples = _generate_samples(100)
 
-    cocotb.start_soon(
-        _spi_peripheral(
-            memory=bytes(itertools.chain.from_iterable(samples)),
-            cs_n=cs_n,
-            copi=copi,
-            cipo=cipo,
-            sclk=sclk,
-        )
-    )
+    memory = bytes(itertools.chain.from_iterable(samples))
+    cocotb.start_soon(_spi_flash(dut, SPIFlashEngine(memory)).run())
 
     play.value = 1
 
@@ -265,72 +272,169 @@ def _generate_samples(count: int) -> list[tuple[int, int]]:
     return list(zip(generate_channel(), generate_channel(), strict=True))
 
 
-async def _spi_peripheral(
-    *,
-    memory: bytes,
-    cs_n: ModifiableObject | AwaitableSubObject,
-    copi: ModifiableObject,
-    cipo: ModifiableObject,
-    sclk: ModifiableObject | AwaitableSubObject,
-) -> None:
+@cocotb.test(skip=SOAK_FRAMES == 0)  # type: ignore
+async def test_player_soak(dut: HierarchyObject) -> None:
     """
-    Emulates a SPI flash peripheral. Responds to plain read commands.
+    Plays SOAK_FRAMES frames with random pauses in between, checking every
+    frame against the flash contents as it arrives. Memory usage doesn't
+    depend on the length of the test.
     """
 
-    async def read_byte() -> int | None:
-        """
-        Reads a single byte from the SPI output. If chip-select
-        is deasserted before a full byte is read, None is returned.
-        """
+    mode = Bus(dut.uio_in[i] for i in range(6, 8))
+
+    play = dut.ui_in[0]
+    busy = AwaitableSubObject(dut.uio_out, 4)
+    digital_out = dut.o_digital
+    digital_pt = dut.uo_out
+
+    mode.value = Mode.PRODUCTION_L.value
+    play.value = 0
+    dut.uio_in[2].value = 1  # CIPO pull-up
+
+    dut.rst_n.value = 0
+    await Timer(100, units="ns")
+
+    clock_period_ps = round(1e12 / SYSTEM_CLOCK_HZ)
+    clock = Clock(dut.clk, clock_period_ps, units="ps")
+    cocotb.start_soon(clock.start())
+
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 2)
+
+    # The full 24-bit address space, so that long enough playback wraps around.
+    # The contents are generated as they're read, from a seed that's derived
+    # from RANDOM_SEED, so the test can be replayed.
+    seed = random.getrandbits(32)
+    dut._log.info("Flash contents from seed %d", seed)
+    flash = SPIFlashEngine(SeededFlashMemory(seed, 1 << 24))
+    cocotb.start_soon(_spi_flash(dut, flash).run())
 
-        byte = 0
+    scoreboard = _PlaybackScoreboard(flash.memory, clock_period_ps)
+    done = Event()
 
-        for _ in range(8):
-            await First(RisingEdge(sclk), RisingEdge(cs_n))
+    async def monitor() -> None:
+        while True:
+            await Edge(digital_out)
             await ReadOnly()
 
-            if cs_n.value:
-                return None
+            # The last frame before a pause arrives together with the
+            # deassertion of "busy". It's handled by the pause logic below.
+            if not busy.value:
+                continue
 
-            # Data is sent MSB-first
-            byte <<= 1
-            byte |= copi.value
+            scoreboard.check(digital_out.value.integer)
+            assert digital_pt.value == digital_out.value.integer & 0xFF
 
-        return byte
+            if scoreboard.frames >= SOAK_FRAMES:
+                done.set()
+            if scoreboard.frames % (1 << 20) == 0:
+                dut._log.info("%s", scoreboard)
 
-    async def read_bytes(count: int) -> bytes | None:
-        result = bytearray(count)
-        for i in range(count):
-            byte = await read_byte()
-            if byte is None:
-                return None
-            result[i] = byte
-        return bytes(result)
+    cocotb.start_soon(monitor())
 
-    async def send_bytes(data: Iterable[int]) -> None:
-        for byte in itertools.cycle(data):
-            for i in reversed(range(8)):
-                await First(FallingEdge(sclk), RisingEdge(cs_n))
+    play.value = 1
+    while not done.is_set():
+        # Play for a while
+        await First(
+            Timer(random.randrange(1, SOAK_MAX_PLAY_US), units="us"),
+            done.wait(),
+        )
 
-                if cs_n.value:
-                    return
+        # Pause
+        await RisingEdge(dut.clk)
+        play.value = 0
+        await FallingEdge(busy)
+        await ReadOnly()
+        scoreboard.check(digital_out.value.integer, last_before_pause=True)
 
-                # Data is sent MSB-first
-                cipo.value = (byte >> i) & 1
+        # Resume
+        await Timer(random.randrange(1, SOAK_MAX_PAUSE_US), units="us")
+        await RisingEdge(dut.clk)
+        play.value = 1
 
-    while True:
-        await FallingEdge(cs_n)
+    dut._log.info("%s", scoreboard)
 
-        cmd = await read_byte()
-        if cmd != 0x03:
-            continue
 
-        address = await read_bytes(3)
-        if address is None:
-            continue
+class _PlaybackScoreboard:
+    """
+    Checks the frames output by the player against the flash contents,
+    as they arrive. Keeps statistics of the intervals between frames,
+    instead of asserting on each one.
+    """
 
-        offset = int.from_bytes(address, "big") % len(memory)
-        await send_bytes(memory[offset:] + memory[:offset])
+    def __init__(self, memory: FlashMemory, clock_period_ps: int) -> None:
+        # The player reads the flash sequentially from address 0, and the
+        # stream of frames continues across pauses.
+        self._expected = memory.stream(0)
+        self._clock_period_ps = clock_period_ps
+
+        self._last_frame = 0
+        self._last_time_ps: int | None = None
+
+        self.frames = 0
+        self.pauses = 0
+
+        # Running statistics of the interval between consecutive frames,
+        # in clock cycles. See https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Welford's_online_algorithm
+        self._intervals = 0
+        self._interval_mean = 0.0
+        self._interval_m2 = 0.0
+        self._interval_min = float("inf")
+        self._interval_max = 0.0
+
+    def _next_expected(self) -> int:
+        left = next(self._expected)
+        right = next(self._expected)
+        return left | (right << 8)
+
+    def check(self, frame: int, *, last_before_pause: bool = False) -> None:
+        now_ps = cocotb.utils.get_sim_time("ps")
+
+        # A frame equal to the previous one doesn't change the output,
+        # so we can't observe it. Skip such frames, but account for them
+        # when computing the interval.
+        frames = 1
+        expected = self._next_expected()
+        while expected != frame and expected == self._last_frame:
+            frames += 1
+            expected = self._next_expected()
+
+        assert frame == expected, (
+            f"Frame {self.frames + frames - 1}: "
+            f"expected 0x{expected:04X}, got 0x{frame:04X}"
+        )
+
+        if self._last_time_ps is not None:
+            interval = (now_ps - self._last_time_ps) / self._clock_period_ps / frames
+            self._intervals += 1
+            delta = interval - self._interval_mean
+            self._interval_mean += delta / self._intervals
+            self._interval_m2 += delta * (interval - self._interval_mean)
+            self._interval_min = min(self._interval_min, interval)
+            self._interval_max = max(self._interval_max, interval)
+
+        self.frames += frames
+        self._last_frame = frame
+        self._last_time_ps = now_ps
+
+        if last_before_pause:
+            # Don't count the pause as an interval
+            self.pauses += 1
+            self._last_time_ps = None
+            # The player clears its output on pause
+            self._last_frame = 0
+
+    def __str__(self) -> str:
+        if not self._intervals:
+            return f"{self.frames} frames, {self.pauses} pauses"
+        stddev = (self._interval_m2 / self._intervals) ** 0.5
+        return (
+            f"{self.frames} frames, {self.pauses} pauses, "
+            f"interval (clocks): mean {self._interval_mean:.3f}, "
+            f"stddev {stddev:.3f}, "
+            f"min {self._interval_min:.3f}, max {self._interval_max:.3f}"
+        )
 
 
 @cocotb.test()  # type: ignore
@@ -354,10 +458,7 @@ async def _test_debug(dut: HierarchyObject, left_pt: bool) -> None:
     spi_ctl_data_valid = AwaitableSubObject(dut.uio_out, 4)
 
     # SPI signals
-    cs_n = AwaitableSubObject(dut.uio_out, 0)
-    copi = dut.uio_out[1]
     cipo = dut.uio_in[2]
-    sclk = AwaitableSubObject(dut.uio_out, 3)
 
     mode.value = Mode.DEBUG_DAC_L_PT.value if left_pt else Mode.DEBUG_DAC_R_PT.value
     cipo.value = 1  # Pull-up :)
@@ -398,15 +499,7 @@ async def _test_debug(dut: HierarchyObject, left_pt: bool) -> None:
 
     memory = random.randbytes(16 * 1024 * 1024)  # Size of IS25WP128 flash chip
 
-    cocotb.start_soon(
-        _spi_peripheral(
-            memory=memory,
-            cs_n=cs_n,
-            copi=copi,
-            cipo=cipo,
-            sclk=sclk,
-        )
-    )
+    cocotb.start_soon(_spi_flash(dut, SPIFlashEngine(memory)).run())
 
     # The input is limited to 8 bits 🤷
     address = random.randrange(1 << 8)
@@ -420,6 +513,16 @@ async def _test_debug(dut: HierarchyObject, left_pt: bool) -> None:
         assert spi_ctl_data_out.value == memory[(address + i) % len(memory)]
 
 
+def _spi_flash(dut: HierarchyObject, engine: SPIFlashEngine) -> CocotbFlash:
+    return CocotbFlash(
+        engine,
+        cs_n=Pins((dut.uio_out, 0)),
+        out=Pins((dut.uio_out, 1)),
+        in_=Pins((dut.uio_in, 2)),
+        sclk=Pins((dut.uio_out, 3)),
+    )
+
+
 async def _check_signal_constant(signal: ModifiableObject, value: int) -> None:
     assert signal.value == value
 
@@ -0,0 +1,120 @@
+"""
+Checks player_model against DigitalTop, running it with SPIFlash and the flash
+model in the Amaranth simulator.
+"""
+
+import random
+
+import player_model
+import pytest
+from amaranth.sim import Simulator, SimulatorContext
+from flash_model import SPIFlashEngine
+from flash_model.amaranth import AmaranthFlash
+from flash_sim import CLOCK_HZ
+from tt10_rtl.digital_top import DigitalTop, Mode
+
+
+def _simulate_rtl(
+    image: bytes,
+    play_events: list[tuple[int, bool]],
+    end_cycle: int,
+    *,
+    upsampling: int = 1,
+) -> list[int]:
+    """
+    Simulates DigitalTop with a flash holding the image.
+    Returns the value of o_digital after every edge.
+    """
+    dut = DigitalTop(upsampling=upsampling)
+    result: list[int] = []
+
+    flash = AmaranthFlash(
+        SPIFlashEngine(image),
+        cs_n=dut.uio_out[0],
+        sclk=dut.uio_out[3],
+        out=dut.uio_out[1],
+        in_=dut.uio_in[2],
+    )
+
+    async def testbench(ctx: SimulatorContext) -> None:
+        events = dict(play_events)
+        play = 0
+
+        ctx.set(dut.uio_in[6:8], Mode.PRODUCTION_L.value)
+
+        for cycle in range(end_cycle + 1):
+            play = int(events.get(cycle, play))
+            ctx.set(dut.ui_in, play)
+
+            await ctx.tick()
+            result.append(ctx.get(dut.o_digital))
+
+    sim = Simulator(dut)
+    sim.add_clock(1 / CLOCK_HZ)
+    sim.add_testbench(flash.run, background=True)
+    sim.add_testbench(testbench)
+    sim.run()
+
+    return result
+
+
+def _expand(playback: player_model.Playback, end_cycle: int) -> list[int]:
+    """
+    Value of o_digital after every edge, according to the model.
+    """
+    result = [0] * (end_cycle + 1)
+    rows = dict(zip(playback.cycles.tolist(), playback.o_digital.tolist()))
+    value = 0
+    for cycle in range(end_cycle + 1):
+        value = rows.get(cycle, value)
+        result[cycle] = value
+    return result
+
+
+def _random_play_events(rng: random.Random, end_cycle: int) -> list[tuple[int, bool]]:
+    play_events: list[tuple[int, bool]] = []
+    cycle = rng.randrange(10)
+    level = True
+    while cycle <= end_cycle:
+        play_events.append((cycle, level))
+        level = not level
+        # Pauses that are shorter than a frame, and ones that are longer
+        # than starting a read
+        cycle += rng.choice([rng.randrange(1, 40), rng.randrange(40, 2000)])
+    return play_events
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_rtl(seed: int) -> None:
+    rng = random.Random(seed)
+    image = rng.randbytes(rng.randrange(1, 1000))
+    end_cycle = 10_000
+    play_events = _random_play_events(rng, end_cycle)
+
+    playback = player_model.simulate(
+        image, play_events, end_cycle=end_cycle, clock_hz=CLOCK_HZ
+    )
+
+    assert _expand(playback, end_cycle) == _simulate_rtl(image, play_events, end_cycle)
+    assert (playback.times == playback.cycles / CLOCK_HZ).all()
+
+
+@pytest.mark.parametrize("factor", (2, 4))
+@pytest.mark.parametrize("seed", range(2))
+def test_upsampling_matches_rtl(factor: int, seed: int) -> None:
+    rng = random.Random(seed)
+    image = rng.randbytes(rng.randrange(1, 1000))
+    end_cycle = 10_000
+    play_events = _random_play_events(rng, end_cycle)
+
+    playback = player_model.upsample(
+        player_model.simulate(
+            image, play_events, end_cycle=end_cycle, clock_hz=CLOCK_HZ
+        ),
+        factor,
+        end_cycle=end_cycle,
+    )
+
+    assert _expand(playback, end_cycle) == _simulate_rtl(
+        image, play_events, end_cycle, upsampling=factor
+    )
@@ -0,0 +1,139 @@
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.handle import HierarchyObject
+from cocotb.triggers import ClockCycles, FallingEdge
+from controller_model import SPI_FLASH, run_controller
+
+# NOTE: Keep in sync with the Makefile
+LINES = 4
+LINE_BYTES = 8
+
+# Cycles from the assertion of i_read until the first byte is available,
+# when it's in the cache
+HIT_FIRST_BYTE_CYCLES = 3
+
+
+class FlashReads:
+    """
+    Counts the reads started on the controller.
+    """
+
+    def __init__(self, dut: HierarchyObject) -> None:
+        self.count = 0
+        cocotb.start_soon(self._run(dut))
+
+    async def _run(self, dut: HierarchyObject) -> None:
+        reading = False
+        while True:
+            await FallingEdge(dut.clk)
+            if dut.o_spi_read.value and not reading:
+                self.count += 1
+            reading = bool(dut.o_spi_read.value)
+
+
+async def start(dut: HierarchyObject, image: bytes) -> FlashReads:
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.i_read.value = 0
+    dut.i_address.value = 0
+    dut.i_spi_data_valid.value = 0
+    dut.i_spi_data.value = 0
+    dut.i_spi_busy.value = 0
+    dut.i_perf_clear.value = 0
+
+    cocotb.start_soon(run_controller(dut, image, SPI_FLASH))
+    flash_reads = FlashReads(dut)
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+    return flash_reads
+
+
+async def read(
+    dut: HierarchyObject, address: int, length: int
+) -> tuple[bytes, list[int]]:
+    """
+    Reads from the cache, and stops the read once all the bytes are received.
+    Returns the bytes, and the cycle at which each one was received,
+    counting from the assertion of i_read.
+    """
+    await FallingEdge(dut.clk)
+    dut.i_address.value = address
+    dut.i_read.value = 1
+
+    result = bytearray()
+    cycles = []
+    cycle = 0
+    while len(result) < length:
+        await FallingEdge(dut.clk)
+        cycle += 1
+        if dut.o_data_valid.value:
+            result.append(dut.o_data.value.integer)
+            cycles.append(cycle)
+
+    dut.i_read.value = 0
+    return bytes(result), cycles
+
+
+@cocotb.test()  # type: ignore
+async def test_repeated_clip(dut: HierarchyObject) -> None:
+    image = random.randbytes(4096)
+    address = random.randrange(len(image) // LINE_BYTES) * LINE_BYTES
+    length = random.randrange(1, LINES) * LINE_BYTES
+    expected = image[address : address + length]
+
+    flash_reads = await start(dut, image)
+
+    data, cycles = await read(dut, address, length)
+    assert data == expected
+    assert flash_reads.count == 1
+    assert dut.o_perf_hits.value == 0
+    assert dut.o_perf_misses.value == 1
+
+    for repetition in range(1, 4):
+        data, cycles = await read(dut, address, length)
+        assert data == expected
+
+        # Served from the cache, at the rate of the controller
+        assert flash_reads.count == 1
+        assert cycles[0] == HIT_FIRST_BYTE_CYCLES
+        assert all(
+            b - a == SPI_FLASH.cycles_per_byte for a, b in zip(cycles, cycles[1:])
+        )
+
+        # Every line is looked up
+        assert dut.o_perf_hits.value == repetition * (length // LINE_BYTES)
+        assert dut.o_perf_misses.value == 1
+
+    await FallingEdge(dut.clk)
+    dut.i_perf_clear.value = 1
+    await FallingEdge(dut.clk)
+    dut.i_perf_clear.value = 0
+    assert dut.o_perf_hits.value == 0
+    assert dut.o_perf_misses.value == 0
+
+
+@cocotb.test()  # type: ignore
+async def test_random_reads(dut: HierarchyObject) -> None:
+    image = random.randbytes(4096)
+    # A region that's twice the size of the cache, so that lines replace
+    # each other
+    region_start = random.randrange(len(image) // LINE_BYTES - 2 * LINES) * LINE_BYTES
+    region_end = region_start + 2 * LINES * LINE_BYTES
+
+    flash_reads = await start(dut, image)
+
+    for _ in range(50):
+        address = random.randrange(region_start, region_end)
+        length = random.randrange(1, 3 * LINE_BYTES)
+        data, _ = await read(dut, address, length)
+        assert data == image[address : address + length]
+        assert dut.o_perf_misses.value == flash_reads.count
+
+    assert dut.o_perf_hits.value.integer > 0
@@ -0,0 +1,53 @@
+"""
+Runs the line cache against SPIFlash and the flash model, to check misses
+that are abandoned while the controller is still sending the command against
+the controller itself, and not only against the stand-in of test_line_cache.py.
+"""
+
+import random
+
+from amaranth import Module
+from amaranth.sim import SimulatorContext
+from flash_sim import ABANDON_CYCLES, connect, simulate
+from tt10_rtl.line_cache import LineCache
+from tt10_rtl.spi_flash import SPIFlash
+
+
+async def _read(
+    ctx: SimulatorContext, cache: LineCache, address: int, length: int
+) -> bytes:
+    ctx.set(cache.i_address, address)
+    ctx.set(cache.i_read, 1)
+    result = bytearray()
+    while len(result) < length:
+        _, _, valid, data = await ctx.tick().sample(cache.o_data_valid, cache.o_data)
+        if valid:
+            result.append(data)
+    ctx.set(cache.i_read, 0)
+    await ctx.tick()
+    return bytes(result)
+
+
+def test_abandoned_miss() -> None:
+    image = random.randbytes(4096)
+    m = Module()
+    m.submodules.cache = cache = LineCache(lines=4, line_bytes=8, perf_counters=True)
+    m.submodules.controller = controller = SPIFlash()
+    connect(m, cache, controller)
+
+    async def testbench(ctx: SimulatorContext) -> None:
+        # A miss that's abandoned while the controller sends the command
+        ctx.set(cache.i_address, 0x100)
+        ctx.set(cache.i_read, 1)
+        await ctx.tick().repeat(ABANDON_CYCLES)
+        assert not ctx.get(controller.o_cs_n)
+        ctx.set(cache.i_read, 0)
+        await ctx.tick()
+
+        # The next read gets its own bytes, and so does the one after it,
+        # from the cache
+        for _ in range(2):
+            assert await _read(ctx, cache, 0x200, 16) == image[0x200:0x210]
+        assert ctx.get(cache.o_perf_hits) == 2
+
+    simulate(m, controller, image, testbench)
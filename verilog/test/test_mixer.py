@@ -0,0 +1,163 @@
+import itertools
+import random
+from collections.abc import Iterator
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.handle import HierarchyObject
+from cocotb.triggers import ClockCycles, FallingEdge
+from controller_model import QSPI_FLASH_DTR, run_controller
+
+AUDIO_SAMPLE_RATE_HZ = 48e3  # https://en.wikipedia.org/wiki/48,000_Hz
+CHANNELS = 2
+VOICES = 2
+ADDRESS_WIDTH_BITS = 24
+
+# NOTE: Keep in sync with the Makefile
+FRAME_PERIOD_CYCLES = 32
+
+SYSTEM_CLOCK_HZ = AUDIO_SAMPLE_RATE_HZ * FRAME_PERIOD_CYCLES
+
+SILENCE = bytes([0x80] * CHANNELS)
+
+
+def nonzero_bytes(count: int) -> bytes:
+    """
+    An image without zeros, so that the start of playback can be detected.
+    """
+    return bytes(random.randrange(1, 256) for _ in range(count))
+
+
+def voice_frames(image: bytes, start: int, end: int) -> Iterator[bytes]:
+    """
+    The frames of a voice playing [start, end), followed by silence.
+    """
+    for address in range(start, end, CHANNELS):
+        yield image[address : address + CHANNELS]
+    while True:
+        yield SILENCE
+
+
+def mix(*frames: bytes) -> int:
+    """
+    The value of o_digital for the given frames of the voices.
+    """
+    result = 0
+    for channel in range(CHANNELS):
+        total = sum(frame[channel] for frame in frames) - (len(frames) - 1) * 0x80
+        result |= min(max(total, 0), 0xFF) << (8 * channel)
+    return result
+
+
+async def start(dut: HierarchyObject, image: bytes) -> None:
+    # The period must be even, so that it can be split into two halves
+    clock = Clock(dut.clk, 2 * round(1e12 / SYSTEM_CLOCK_HZ / 2), units="ps")
+    cocotb.start_soon(clock.start())
+
+    dut.i_start.value = 0
+    dut.i_start_address.value = 0
+    dut.i_end_address.value = 0
+    dut.i_spi_data_valid.value = 0
+    dut.i_spi_data.value = 0
+    dut.i_spi_busy.value = 0
+
+    cocotb.start_soon(run_controller(dut, image, QSPI_FLASH_DTR))
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+
+async def start_voice(dut: HierarchyObject, voice: int, start: int, end: int) -> None:
+    address_mask = (1 << ADDRESS_WIDTH_BITS) - 1
+    shift = voice * ADDRESS_WIDTH_BITS
+    await FallingEdge(dut.clk)
+    dut.i_start_address.value = (
+        dut.i_start_address.value.integer & ~(address_mask << shift)
+    ) | (start << shift)
+    dut.i_end_address.value = (
+        dut.i_end_address.value.integer & ~(address_mask << shift)
+    ) | (end << shift)
+    dut.i_start.value = 1 << voice
+    await FallingEdge(dut.clk)
+    dut.i_start.value = 0
+
+
+async def sample_frames(dut: HierarchyObject, count: int) -> list[int]:
+    """
+    Waits for playback to start, and samples o_digital once in every
+    frame period.
+    """
+    while True:
+        await FallingEdge(dut.clk)
+        if dut.o_digital.value:
+            break
+
+    result = []
+    for i in range(count):
+        if i:
+            await ClockCycles(dut.clk, FRAME_PERIOD_CYCLES, rising=False)
+        result.append(dut.o_digital.value.integer)
+    return result
+
+
+@cocotb.test()  # type: ignore
+async def test_single_voice(dut: HierarchyObject) -> None:
+    image = nonzero_bytes(4096)
+    voice = random.randrange(VOICES)
+    start_address = random.randrange(100) * CHANNELS
+    end_address = start_address + random.randrange(50, 500) * CHANNELS
+
+    await start(dut, image)
+    await start_voice(dut, voice, start_address, end_address)
+    assert dut.o_busy.value == 1 << voice
+
+    frames = (end_address - start_address) // CHANNELS
+    expected = voice_frames(image, start_address, end_address)
+    samples = await sample_frames(dut, frames)
+    assert samples == [mix(next(expected), SILENCE) for _ in range(frames)]
+
+    # Once the voice is done, the output is cleared
+    await ClockCycles(dut.clk, FRAME_PERIOD_CYCLES + 1)
+    assert dut.o_busy.value == 0
+    assert dut.o_digital.value == 0
+
+
+@cocotb.test()  # type: ignore
+async def test_two_voices(dut: HierarchyObject) -> None:
+    image = nonzero_bytes(8192)
+    # Background audio, and a sound effect over it
+    background = (0, 6000)
+    effect_length = random.randrange(100, 500)
+    effect_start = random.randrange(3000, len(image) // CHANNELS - effect_length)
+    effect_start *= CHANNELS
+    effect = (effect_start, effect_start + effect_length * CHANNELS)
+
+    await start(dut, image)
+    await start_voice(dut, 0, *background)
+    sampling = cocotb.start_soon(
+        sample_frames(dut, (background[1] - background[0]) // CHANNELS)
+    )
+
+    await ClockCycles(dut.clk, random.randrange(1000, 10000))
+    await start_voice(dut, 1, *effect)
+
+    samples = await sampling
+    await ClockCycles(dut.clk, FRAME_PERIOD_CYCLES + 1)
+    assert dut.o_busy.value == 0
+
+    # The effect starts at some frame of the background. From there, both
+    # voices must play every one of their frames, on time.
+    background_frames = list(
+        itertools.islice(voice_frames(image, *background), len(samples))
+    )
+    first_effect_frame = next(
+        i
+        for i, (sample, frame) in enumerate(zip(samples, background_frames))
+        if sample != mix(frame, SILENCE)
+    )
+    effect_frames = itertools.chain(
+        itertools.repeat(SILENCE, first_effect_frame), voice_frames(image, *effect)
+    )
+    assert samples == [mix(frame, next(effect_frames)) for frame in background_frames]
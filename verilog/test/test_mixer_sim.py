@@ -0,0 +1,91 @@
+"""
+Runs the mixer against QSPIFlashDTR and the flash model, to check that both
+voices are kept fed by the controller itself, and not only by the stand-in
+of test_mixer.py.
+"""
+
+import itertools
+import random
+
+from amaranth import Module
+from amaranth.sim import SimulatorContext
+from flash_sim import connect, simulate
+from test_mixer import (
+    CHANNELS,
+    FRAME_PERIOD_CYCLES,
+    SILENCE,
+    mix,
+    nonzero_bytes,
+    voice_frames,
+)
+from tt10_rtl.mixer import Mixer
+from tt10_rtl.qspi_flash_dtr import QSPIFlashDTR
+
+
+def test_two_voices() -> None:
+    image = nonzero_bytes(4096)
+    # Background audio, and a sound effect over it
+    background = (0, 2000)
+    effect_length = random.randrange(100, 300)
+    effect_start = random.randrange(1000, len(image) // CHANNELS - effect_length)
+    effect_start *= CHANNELS
+    effect = (effect_start, effect_start + effect_length * CHANNELS)
+
+    m = Module()
+    m.submodules.mixer = mixer = Mixer(
+        frame_period_cycles=FRAME_PERIOD_CYCLES, burst_frames=8
+    )
+    m.submodules.controller = controller = QSPIFlashDTR()
+    connect(m, mixer, controller)
+
+    async def start_voice(
+        ctx: SimulatorContext, voice: int, start: int, end: int
+    ) -> None:
+        ctx.set(mixer.i_start_address[voice], start)
+        ctx.set(mixer.i_end_address[voice], end)
+        ctx.set(mixer.i_start[voice], 1)
+        await ctx.tick()
+        ctx.set(mixer.i_start[voice], 0)
+
+    async def testbench(ctx: SimulatorContext) -> None:
+        await start_voice(ctx, 0, *background)
+
+        # Waits for playback to start, and samples o_digital once in every
+        # frame period. The effect starts somewhere in the middle.
+        effect_cycle = random.randrange(1000, 10000)
+        cycle = 0
+        samples: list[int] = []
+        next_sample = None
+        while len(samples) < (background[1] - background[0]) // CHANNELS:
+            if cycle == effect_cycle:
+                await start_voice(ctx, 1, *effect)
+            else:
+                await ctx.tick()
+            cycle += 1
+
+            value = ctx.get(mixer.o_digital.as_value())
+            if next_sample is None and value:
+                next_sample = cycle
+            if cycle == next_sample:
+                samples.append(value)
+                next_sample += FRAME_PERIOD_CYCLES
+
+        # From the frame at which the effect starts, both voices must play
+        # every one of their frames, on time
+        background_frames = list(
+            itertools.islice(voice_frames(image, *background), len(samples))
+        )
+        first_effect_frame = next(
+            i
+            for i, (sample, frame) in enumerate(zip(samples, background_frames))
+            if sample != mix(frame, SILENCE)
+        )
+        effect_frames = itertools.chain(
+            itertools.repeat(SILENCE, first_effect_frame),
+            voice_frames(image, *effect),
+        )
+        assert samples == [
+            mix(frame, next(effect_frames)) for frame in background_frames
+        ]
+
+    simulate(m, controller, image, testbench)
@@ -0,0 +1,175 @@
+import random
+from collections.abc import Iterator
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.handle import HierarchyObject
+from cocotb.triggers import ClockCycles, FallingEdge
+from controller_model import QSPI_FLASH_DTR, SPI_FLASH, ControllerTiming, run_controller
+
+AUDIO_SAMPLE_RATE_HZ = 48e3  # https://en.wikipedia.org/wiki/48,000_Hz
+CHANNELS = 2
+
+# NOTE: Keep in sync with the Makefile
+FRAME_PERIOD_CYCLES = 64
+
+SYSTEM_CLOCK_HZ = AUDIO_SAMPLE_RATE_HZ * FRAME_PERIOD_CYCLES
+
+
+def frames(
+    image: bytes, *, loop_start: int | None = None, loop_end: int | None = None
+) -> Iterator[int]:
+    """
+    The values of o_digital when playing the image from the start,
+    looping over [loop_start, loop_end) if given.
+    """
+    address = 0
+    while True:
+        yield int.from_bytes(
+            bytes(image[(address + i) % len(image)] for i in range(CHANNELS)),
+            "little",
+        )
+        address += CHANNELS
+        if loop_end is not None and address >= loop_end:
+            assert loop_start is not None
+            address = loop_start
+
+
+async def start(dut: HierarchyObject, image: bytes, timing: ControllerTiming) -> None:
+    # The period must be even, so that it can be split into two halves
+    clock = Clock(dut.clk, 2 * round(1e12 / SYSTEM_CLOCK_HZ / 2), units="ps")
+    cocotb.start_soon(clock.start())
+
+    dut.i_play.value = 0
+    dut.i_spi_data_valid.value = 0
+    dut.i_spi_data.value = 0
+    dut.i_loop.value = 0
+    dut.i_loop_start.value = 0
+    dut.i_loop_end.value = 0
+    dut.i_perf_clear.value = 0
+
+    cocotb.start_soon(run_controller(dut, image, timing))
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+
+async def wait_for_playback(dut: HierarchyObject) -> None:
+    """
+    Waits until the first frame is output. The image must not contain zeros.
+    """
+    while True:
+        await FallingEdge(dut.clk)
+        if dut.o_digital.value:
+            return
+
+
+async def check_frames(
+    dut: HierarchyObject, expected: Iterator[int], count: int
+) -> None:
+    """
+    Checks that the next frames are output exactly a frame period apart.
+    Starts on a cycle with a new frame, and ends on one.
+    """
+    for i in range(count):
+        if i:
+            await ClockCycles(dut.clk, FRAME_PERIOD_CYCLES, rising=False)
+        assert dut.o_digital.value == next(expected), f"Frame {i}"
+
+
+async def _test_loop(dut: HierarchyObject, timing: ControllerTiming) -> None:
+    image = bytes(random.randrange(1, 256) for _ in range(4096))
+    loop_start = random.randrange(0, 100) * CHANNELS
+    loop_end = loop_start + random.randrange(8, 100) * CHANNELS
+
+    await start(dut, image, timing)
+
+    dut.i_loop_start.value = loop_start
+    dut.i_loop_end.value = loop_end
+    dut.i_loop.value = 1
+    dut.i_play.value = 1
+
+    await wait_for_playback(dut)
+    loop_frames = (loop_end - loop_start) // CHANNELS
+    await check_frames(
+        dut,
+        frames(image, loop_start=loop_start, loop_end=loop_end),
+        loop_end // CHANNELS + 5 * loop_frames,
+    )
+    assert dut.o_perf_underruns.value == 0
+
+
+@cocotb.test()  # type: ignore
+async def test_loop_spi_flash(dut: HierarchyObject) -> None:
+    await _test_loop(dut, SPI_FLASH)
+
+
+@cocotb.test()  # type: ignore
+async def test_loop_qspi_flash_dtr(dut: HierarchyObject) -> None:
+    await _test_loop(dut, QSPI_FLASH_DTR)
+
+
+@cocotb.test()  # type: ignore
+async def test_pause(dut: HierarchyObject) -> None:
+    image = bytes(random.randrange(1, 256) for _ in range(4096))
+
+    await start(dut, image, SPI_FLASH)
+    expected = frames(image)
+
+    dut.i_play.value = 1
+    for _ in range(3):
+        await wait_for_playback(dut)
+        assert dut.o_busy.value
+        await check_frames(dut, expected, random.randrange(1, 50))
+
+        # The next frame is still played, and then the output is cleared
+        dut.i_play.value = 0
+        await ClockCycles(dut.clk, FRAME_PERIOD_CYCLES, rising=False)
+        assert dut.o_digital.value == next(expected)
+        await FallingEdge(dut.clk)
+        assert dut.o_digital.value == 0
+        assert not dut.o_busy.value
+
+        await ClockCycles(dut.clk, random.randrange(1, 200))
+        dut.i_play.value = 1
+
+
+@cocotb.test()  # type: ignore
+async def test_underruns(dut: HierarchyObject) -> None:
+    # Consecutive frames differ, so that a repeated frame can be told apart
+    image = bytes(
+        sample
+        for frame in range(4096 // CHANNELS)
+        for sample in (frame % 255 + 1, random.randrange(1, 256))
+    )
+    # A frame takes longer to read than to play
+    timing = ControllerTiming(
+        first_byte_cycles=SPI_FLASH.first_byte_cycles,
+        cycles_per_byte=FRAME_PERIOD_CYCLES,
+    )
+
+    await start(dut, image, timing)
+    dut.i_play.value = 1
+    await wait_for_playback(dut)
+
+    # Every frame is played, but once the buffer runs dry, every other
+    # period repeats the last frame
+    frame_count = random.randrange(10, 50)
+    played = [dut.o_digital.value.integer]
+    for _ in range(2 * frame_count):
+        await ClockCycles(dut.clk, FRAME_PERIOD_CYCLES, rising=False)
+        if dut.o_digital.value != played[-1]:
+            played.append(dut.o_digital.value.integer)
+    expected = frames(image)
+    assert played == [next(expected) for _ in range(len(played))]
+    assert len(played) < 2 * frame_count
+    underruns = dut.o_perf_underruns.value.integer
+    assert 2 * frame_count - len(played) <= underruns <= 2 * frame_count
+
+    await FallingEdge(dut.clk)
+    dut.i_perf_clear.value = 1
+    await FallingEdge(dut.clk)
+    dut.i_perf_clear.value = 0
+    assert dut.o_perf_underruns.value == 0
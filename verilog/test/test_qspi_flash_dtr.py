@@ -1,13 +1,32 @@
 import itertools
+import os
 import random
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.handle import HierarchyObject
 from cocotb.triggers import ClockCycles, FallingEdge, First, ReadOnly, RisingEdge
+from cocotb.utils import get_sim_steps
+from flash_model import QSPIFlashDTREngine
+from flash_model.cocotb import CocotbFlash, Pins
 
 PIXEL_CLOCK_HZ = 25.175e6  # http://www.tinyvga.com/vga-timing/640x480@60Hz
 SYSTEM_CLOCK_HZ = PIXEL_CLOCK_HZ * 2
+CLOCK_PERIOD_PS = round(1e12 / SYSTEM_CLOCK_HZ) + 1
+
+# Set by the Makefile, which builds the controller accordingly
+FOUR_BYTE_ADDRESS = os.environ.get("FOUR_BYTE_ADDRESS") == "1"
+ADDRESS_WIDTH_BITS = 32 if FOUR_BYTE_ADDRESS else 24
+READ_COMMAND = 0xEE if FOUR_BYTE_ADDRESS else 0xED
+
+# NOTE: Keep in sync with FlashParams.cycles_until_first_read_byte
+CYCLES_UNTIL_FIRST_READ_BYTE = 59 if FOUR_BYTE_ADDRESS else 57
+
+# NOTE: Keep in sync with the Makefile
+MAX_SAMPLE_DELAY = 5
+# NOTE: Keep in sync with qspi_flash_dtr
+CALIBRATION_PATTERN = bytes([0x0F, 0xF0, 0x5A, 0xA5, 0x3C, 0xC3, 0x96, 0x69])
+CALIBRATION_ADDRESS = (1 << 24) - len(CALIBRATION_PATTERN)
 
 
 async def read_byte(dut: HierarchyObject, n_bits: int, dtr: bool = False) -> int | None:
@@ -92,10 +111,11 @@ async def send_bytes(
 
 @cocotb.test()  # type: ignore[misc]
 async def test_configure(dut: HierarchyObject) -> None:
-    clock = Clock(dut.clk, round(1e12 / SYSTEM_CLOCK_HZ) + 1, units="ps")
+    clock = Clock(dut.clk, CLOCK_PERIOD_PS, units="ps")
     cocotb.start_soon(clock.start())
 
     dut.i_configure.value = 0
+    dut.i_calibrate.value = 0
     dut.i_read.value = 0
     dut.i_address.value = 0
     dut.i_io.value = 0
@@ -123,10 +143,11 @@ async def test_configure(dut: HierarchyObject) -> None:
 
 @cocotb.test()  # type: ignore
 async def test_read(dut: HierarchyObject) -> None:
-    clock = Clock(dut.clk, round(1e12 / SYSTEM_CLOCK_HZ) + 1, units="ps")
+    clock = Clock(dut.clk, CLOCK_PERIOD_PS, units="ps")
     cocotb.start_soon(clock.start())
 
     dut.i_configure.value = 0
+    dut.i_calibrate.value = 0
     dut.i_read.value = 0
     dut.i_address.value = 0
     dut.i_io.value = 0
@@ -136,7 +157,7 @@ async def test_read(dut: HierarchyObject) -> None:
     dut.rst_n.value = 1
     await ClockCycles(dut.clk, 1)
 
-    address = random.randrange(1 << 24)
+    address = random.randrange(1 << ADDRESS_WIDTH_BITS)
 
     dut.i_address.value = address
     dut.i_read.value = 1
@@ -144,11 +165,13 @@ async def test_read(dut: HierarchyObject) -> None:
     await FallingEdge(dut.o_cs_n)
 
     cmd = await read_byte(dut, 1)
-    assert cmd == 0xED
+    assert cmd == READ_COMMAND
 
-    received_address = [(await read_byte(dut, 4, True)) for _ in range(3)]
+    received_address = [
+        (await read_byte(dut, 4, True)) for _ in range(ADDRESS_WIDTH_BITS // 8)
+    ]
     assert received_address == list(
-        reversed([(address >> i) & 0xFF for i in range(0, 24, 8)])
+        reversed([(address >> i) & 0xFF for i in range(0, ADDRESS_WIDTH_BITS, 8)])
     )
 
     # Mode bits
@@ -179,3 +202,240 @@ async def test_read(dut: HierarchyObject) -> None:
         await ClockCycles(dut.clk, 1)
         await ReadOnly()
         assert dut.o_cs_n.value
+
+
+@cocotb.test()  # type: ignore
+async def test_read_flash_model(dut: HierarchyObject) -> None:
+    clock = Clock(dut.clk, CLOCK_PERIOD_PS, units="ps")
+    cocotb.start_soon(clock.start())
+
+    dut.i_configure.value = 0
+    dut.i_calibrate.value = 0
+    dut.i_read.value = 0
+    dut.i_address.value = 0
+    dut.i_io.value = 0
+
+    flash = _flash_engine()
+    cocotb.start_soon(_qspi_flash(dut, flash).run())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+    dut.i_configure.value = 1
+    await ClockCycles(dut.clk, 1)
+    dut.i_configure.value = 0
+    await RisingEdge(dut.o_configure_done)
+    assert flash.resets == 1
+
+    for _ in range(3):
+        address = random.randrange(1 << ADDRESS_WIDTH_BITS)
+
+        await RisingEdge(dut.clk)
+        dut.i_address.value = address
+        dut.i_read.value = 1
+
+        await FallingEdge(dut.o_cs_n)
+        await RisingEdge(dut.o_sclk)
+        await ClockCycles(dut.clk, CYCLES_UNTIL_FIRST_READ_BYTE - 2)
+
+        for i in range(1000):
+            await ReadOnly()
+            # Every byte is on o_data for 2 cycles,
+            # and o_data_valid is asserted only on the first one.
+            assert not dut.o_data_valid.value
+            assert dut.o_data.value == flash.memory[address + i]
+            await ClockCycles(dut.clk, 1)
+            await ReadOnly()
+            assert dut.o_data_valid.value
+            await ClockCycles(dut.clk, 1)
+
+        dut.i_read.value = 0
+        await RisingEdge(dut.o_cs_n)
+
+
+@cocotb.test()  # type: ignore
+async def test_perf_counters(dut: HierarchyObject) -> None:
+    clock = Clock(dut.clk, CLOCK_PERIOD_PS, units="ps")
+    cocotb.start_soon(clock.start())
+
+    dut.i_configure.value = 0
+    dut.i_calibrate.value = 0
+    dut.i_read.value = 0
+    dut.i_address.value = 0
+    dut.i_io.value = 0
+    dut.i_perf_clear.value = 0
+
+    flash = _flash_engine()
+    cocotb.start_soon(_qspi_flash(dut, flash).run())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 1
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 0
+
+    idle_cycles = random.randrange(1, 100)
+    await ClockCycles(dut.clk, idle_cycles)
+    await ReadOnly()
+    assert dut.o_perf_idle_cycles.value == idle_cycles
+
+    # Configuration is not a read
+    await RisingEdge(dut.clk)
+    dut.i_configure.value = 1
+    await ClockCycles(dut.clk, 1)
+    dut.i_configure.value = 0
+    await RisingEdge(dut.o_configure_done)
+    await ReadOnly()
+    assert dut.o_perf_reads.value == 0
+    assert dut.o_perf_bytes.value == 0
+
+    total_bytes = 0
+
+    for read in range(1, 4):
+        byte_count = random.randrange(1, 1000)
+
+        await RisingEdge(dut.clk)
+        dut.i_address.value = random.randrange(1 << ADDRESS_WIDTH_BITS)
+        dut.i_read.value = 1
+
+        # Wait until the last byte we want is on o_data, and stop reading
+        # before the next one.
+        await ClockCycles(
+            dut.clk, 1 + CYCLES_UNTIL_FIRST_READ_BYTE + 2 * (byte_count - 1)
+        )
+        dut.i_read.value = 0
+        total_bytes += byte_count
+
+        await RisingEdge(dut.o_cs_n)
+        await ReadOnly()
+
+        assert dut.o_perf_reads.value == read
+        assert dut.o_perf_first_byte_cycles.value == CYCLES_UNTIL_FIRST_READ_BYTE
+        assert dut.o_perf_bytes.value == total_bytes
+
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 1
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 0
+    await ReadOnly()
+    assert dut.o_perf_reads.value == 0
+    assert dut.o_perf_first_byte_cycles.value == 0
+    assert dut.o_perf_bytes.value == 0
+    assert dut.o_perf_idle_cycles.value == 0
+
+
+async def _read(dut: HierarchyObject, address: int, length: int) -> bytes:
+    """
+    Reads bytes as they're signaled by o_data_valid, whatever their timing.
+    """
+    await RisingEdge(dut.clk)
+    dut.i_address.value = address
+    dut.i_read.value = 1
+
+    result = bytearray()
+    while len(result) < length:
+        await RisingEdge(dut.clk)
+        await ReadOnly()
+        if dut.o_data_valid.value:
+            result.append(dut.o_data.value.integer)
+
+    await RisingEdge(dut.clk)
+    dut.i_read.value = 0
+    await RisingEdge(dut.o_cs_n)
+    return bytes(result)
+
+
+async def _test_calibrate(dut: HierarchyObject, output_delay_half_cycles: int) -> None:
+    """
+    Calibrates against a flash whose data comes the given number of half
+    cycles of the module clock later than usual.
+    """
+    clock = Clock(dut.clk, CLOCK_PERIOD_PS, units="ps")
+    cocotb.start_soon(clock.start())
+
+    dut.i_configure.value = 0
+    dut.i_calibrate.value = 0
+    dut.i_read.value = 0
+    dut.i_address.value = 0
+    dut.i_io.value = 0
+    dut.i_perf_clear.value = 0
+
+    flash = _flash_engine()
+    output_delay_steps = get_sim_steps(
+        output_delay_half_cycles * CLOCK_PERIOD_PS / 2, "ps", round_mode="round"
+    )
+    cocotb.start_soon(_qspi_flash(dut, flash, output_delay_steps).run())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 1)
+
+    # The flash drives the data a quarter of a cycle after the edge of SCLK,
+    # and we sample it a cycle after the edge. Past that, the data is late.
+    late = output_delay_half_cycles * 2 >= 3
+    uncalibrated = await _read(dut, CALIBRATION_ADDRESS, len(CALIBRATION_PATTERN))
+    assert (uncalibrated != CALIBRATION_PATTERN) == late
+
+    await RisingEdge(dut.clk)
+    dut.i_calibrate.value = 1
+    await RisingEdge(dut.clk)
+    dut.i_calibrate.value = 0
+    await RisingEdge(dut.o_calibrate_done)
+    await ReadOnly()
+    assert dut.o_calibrate_ok.value
+
+    # The data is valid from a quarter of a cycle after the edge, for a cycle.
+    # Of the delays that sample it in that window, the earlier one is picked.
+    assert dut.o_sample_delay.value == max(output_delay_half_cycles - 1, 0)
+
+    for _ in range(3):
+        address = random.randrange(1 << ADDRESS_WIDTH_BITS)
+        assert await _read(dut, address, 100) == flash.memory.read(address, 100)
+
+
+@cocotb.test()  # type: ignore
+async def test_calibrate_no_delay(dut: HierarchyObject) -> None:
+    await _test_calibrate(dut, 0)
+
+
+@cocotb.test()  # type: ignore
+async def test_calibrate_cycle_delay(dut: HierarchyObject) -> None:
+    await _test_calibrate(dut, 2)
+
+
+@cocotb.test()  # type: ignore
+async def test_calibrate_long_delay(dut: HierarchyObject) -> None:
+    await _test_calibrate(dut, 3)
+
+
+def _qspi_flash(
+    dut: HierarchyObject, engine: QSPIFlashDTREngine, output_delay_steps: int = 0
+) -> CocotbFlash:
+    return CocotbFlash(
+        engine,
+        cs_n=Pins(dut.o_cs_n),
+        sclk=Pins(dut.o_sclk),
+        out=Pins(dut.o_io),
+        in_=Pins(dut.i_io),
+        output_delay_steps=output_delay_steps,
+    )
+
+
+def _flash_engine() -> QSPIFlashDTREngine:
+    """
+    A flash with random contents, and the calibration pattern at its end.
+    """
+    image = bytearray(random.randbytes(64 * 1024))
+    offset = CALIBRATION_ADDRESS % len(image)
+    image[offset : offset + len(CALIBRATION_PATTERN)] = CALIBRATION_PATTERN
+    return QSPIFlashDTREngine(
+        bytes(image),
+        address_width_bits=ADDRESS_WIDTH_BITS,
+        read_command=READ_COMMAND,
+    )
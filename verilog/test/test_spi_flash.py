@@ -1,24 +1,68 @@
-import itertools
+import os
 import random
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.handle import HierarchyObject
 from cocotb.triggers import ClockCycles, FallingEdge, First, ReadOnly, RisingEdge
+from flash_model import SPIFlashEngine
+from flash_model.cocotb import CocotbFlash, Pins
 
 AUDIO_SAMPLE_RATE_HZ = 48e3  # https://en.wikipedia.org/wiki/48,000_Hz
 SYSTEM_CLOCK_HZ = AUDIO_SAMPLE_RATE_HZ * 16 * 2
 
-
-async def read_byte(dut: HierarchyObject) -> int | None:
+# Set by the Makefile, which builds the controller accordingly
+FULL_RATE_SCLK = os.environ.get("FULL_RATE_SCLK") == "1"
+SPI_FLASH_READ = int(os.environ.get("SPI_FLASH_READ", "0x03"), 0)
+FOUR_BYTE_ADDRESS = os.environ.get("FOUR_BYTE_ADDRESS") == "1"
+
+# NOTE: Keep in sync with the Makefile
+READ_PARAMS: dict[str, int] = {
+    0x03: {},
+    0x3B: {"data_io_width": 2, "read_dummy_cycles": 8},
+    0x6B: {"data_io_width": 4, "read_dummy_cycles": 8},
+    0xEB: {
+        "address_io_width": 4,
+        "data_io_width": 4,
+        "read_mode_bits": 8,
+        "read_dummy_cycles": 4,
+    },
+}[SPI_FLASH_READ]
+ADDRESS_IO_WIDTH = READ_PARAMS.get("address_io_width", 1)
+DATA_IO_WIDTH = READ_PARAMS.get("data_io_width", 1)
+ADDRESS_WIDTH_BITS = 32 if FOUR_BYTE_ADDRESS else 24
+# NOTE: Keep in sync with FOUR_BYTE_READ_COMMANDS
+READ_COMMAND = (
+    {0x03: 0x13, 0x3B: 0x3C, 0x6B: 0x6C, 0xEB: 0xEC}[SPI_FLASH_READ]
+    if FOUR_BYTE_ADDRESS
+    else SPI_FLASH_READ
+)
+# The lines driven by the flash during the data phase. A single line is CIPO.
+DATA_LINES_MASK = 0b0010 if DATA_IO_WIDTH == 1 else (1 << DATA_IO_WIDTH) - 1
+
+# NOTE: Keep in sync with FlashParams.cycles_until_first_read_byte
+CYCLES_UNTIL_FIRST_READ_BYTE = {
+    # (full-rate, half-rate)
+    0x03: (42, 82),
+    0x3B: (46, 90),
+    0x6B: (44, 86),
+    0xEB: (24, 46),
+}[SPI_FLASH_READ][0 if FULL_RATE_SCLK else 1] + (
+    # 8 more address bits
+    (8 // ADDRESS_IO_WIDTH) * (1 if FULL_RATE_SCLK else 2) if FOUR_BYTE_ADDRESS else 0
+)
+
+
+async def read_bits(dut: HierarchyObject, count: int, io_width: int = 1) -> int | None:
     """
-    Reads a single byte from the SPI output of the DUT. If chip-select
-    is deasserted before a full byte is read, None is returned.
+    Reads ``count`` SPI clocks worth of data from the IO lines driven by
+    the DUT, ``io_width`` bits per clock. If chip-select is deasserted before
+    that, None is returned.
     """
 
-    byte = 0
+    value = 0
 
-    for _ in range(8):
+    for _ in range(count):
         await First(RisingEdge(dut.o_sclk), RisingEdge(dut.o_cs_n))
         # Wait for signals to settle after this clock edge
         # https://github.com/cocotb/cocotb/issues/204
@@ -27,28 +71,13 @@ async def read_byte(dut: HierarchyObject) -> int | None:
         if dut.o_cs_n.value:
             return None
 
-        # Data is sent MSB-first
-        byte <<= 1
-        byte |= dut.o_copi.value
-
-    return byte
-
-
-async def send_bytes(dut: HierarchyObject, data: bytes) -> None:
-    """
-    Sends bytes to the DUT's input, indefinitely repeating the given
-    payload. Stops when the chip-select signal is deasserted.
-    """
-
-    for byte in itertools.cycle(data):
-        for i in reversed(range(8)):
-            await RisingEdge(dut.o_sclk)
+        assert dut.o_oe.value & ((1 << io_width) - 1) == (1 << io_width) - 1
 
-            if dut.o_cs_n.value:
-                return
+        # Data is sent MSB-first
+        value <<= io_width
+        value |= dut.o_io.value & ((1 << io_width) - 1)
 
-            # Data is sent MSB-first
-            dut.i_cipo.value = (byte >> i) & 1
+    return value
 
 
 @cocotb.test()  # type: ignore
@@ -58,37 +87,36 @@ async def test_read(dut: HierarchyObject) -> None:
 
     dut.i_read.value = 0
     dut.i_address.value = 0
-    dut.i_cipo.value = 0
+    dut.i_io.value = 0
+
+    flash = _flash_engine()
+    cocotb.start_soon(_spi_flash(dut, flash).run())
 
     dut.rst_n.value = 0
     await ClockCycles(dut.clk, 2)
     dut.rst_n.value = 1
     await ClockCycles(dut.clk, 1)
 
-    address = random.randrange(1 << 24)
+    address = random.randrange(1 << ADDRESS_WIDTH_BITS)
 
     dut.i_address.value = address
     dut.i_read.value = 1
 
     await FallingEdge(dut.o_cs_n)
 
-    cmd = await read_byte(dut)
-    assert cmd == 0x03
+    cmd = await read_bits(dut, 8)
+    assert cmd == READ_COMMAND
 
-    received_address = [(await read_byte(dut)) for _ in range(3)]
-    assert received_address == list(
-        reversed([(address >> i) & 0xFF for i in range(0, 24, 8)])
+    received_address = await read_bits(
+        dut, ADDRESS_WIDTH_BITS // ADDRESS_IO_WIDTH, ADDRESS_IO_WIDTH
     )
+    assert received_address == address
 
-    payload = random.randbytes(100)
-
-    cocotb.start_soon(send_bytes(dut, payload))
-
-    for _ in range(10):
-        for byte in payload:
-            await RisingEdge(dut.o_data_valid)
-            await ReadOnly()
-            assert dut.o_data.value == byte
+    for i in range(1000):
+        await RisingEdge(dut.o_data_valid)
+        await ReadOnly()
+        assert dut.o_data.value == flash.memory[address + i]
+        assert not dut.o_oe.value & DATA_LINES_MASK
 
     await RisingEdge(dut.clk)
     dut.i_read.value = 0
@@ -98,3 +126,94 @@ async def test_read(dut: HierarchyObject) -> None:
         await ReadOnly()
         assert dut.o_cs_n.value
         assert not dut.o_data_valid.value
+
+
+@cocotb.test()  # type: ignore
+async def test_perf_counters(dut: HierarchyObject) -> None:
+    clock = Clock(dut.clk, round(1e12 / SYSTEM_CLOCK_HZ), units="ps")
+    cocotb.start_soon(clock.start())
+
+    dut.i_read.value = 0
+    dut.i_address.value = 0
+    dut.i_io.value = 0
+    dut.i_perf_clear.value = 0
+
+    flash = _flash_engine()
+    cocotb.start_soon(_spi_flash(dut, flash).run())
+
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 1
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 0
+
+    idle_cycles = random.randrange(1, 100)
+    await ClockCycles(dut.clk, idle_cycles)
+    await ReadOnly()
+    assert dut.o_perf_reads.value == 0
+    assert dut.o_perf_first_byte_cycles.value == 0
+    assert dut.o_perf_bytes.value == 0
+    assert dut.o_perf_idle_cycles.value == idle_cycles
+
+    total_bytes = 0
+
+    for read in range(1, 4):
+        await RisingEdge(dut.clk)
+        dut.i_address.value = random.randrange(1 << ADDRESS_WIDTH_BITS)
+        dut.i_read.value = 1
+
+        for _ in range(random.randrange(1, 50)):
+            await RisingEdge(dut.o_data_valid)
+            total_bytes += 1
+
+        await RisingEdge(dut.clk)
+        dut.i_read.value = 0
+        await ClockCycles(dut.clk, random.randrange(1, 10))
+        await ReadOnly()
+
+        assert dut.o_perf_reads.value == read
+        assert dut.o_perf_first_byte_cycles.value == CYCLES_UNTIL_FIRST_READ_BYTE
+        assert dut.o_perf_bytes.value == total_bytes
+
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 1
+    await RisingEdge(dut.clk)
+    dut.i_perf_clear.value = 0
+    await ReadOnly()
+    assert dut.o_perf_reads.value == 0
+    assert dut.o_perf_first_byte_cycles.value == 0
+    assert dut.o_perf_bytes.value == 0
+    assert dut.o_perf_idle_cycles.value == 0
+
+
+def _spi_flash(dut: HierarchyObject, engine: SPIFlashEngine) -> CocotbFlash:
+    if DATA_IO_WIDTH == 1:
+        out = Pins((dut.o_io, 0))
+        # CIPO
+        in_ = Pins((dut.i_io, 1))
+    elif DATA_IO_WIDTH == 4:
+        out = Pins(dut.o_io)
+        in_ = Pins(dut.i_io)
+    else:
+        out = Pins(*((dut.o_io, i) for i in range(DATA_IO_WIDTH)))
+        in_ = Pins(*((dut.i_io, i) for i in range(DATA_IO_WIDTH)))
+
+    return CocotbFlash(
+        engine,
+        cs_n=Pins(dut.o_cs_n),
+        sclk=Pins(dut.o_sclk),
+        out=out,
+        in_=in_,
+    )
+
+
+def _flash_engine() -> SPIFlashEngine:
+    return SPIFlashEngine(
+        random.randbytes(64 * 1024),
+        address_width_bits=ADDRESS_WIDTH_BITS,
+        read_command=READ_COMMAND,
+        **READ_PARAMS,
+    )